@@ -3,57 +3,252 @@ run_pipeline.py — Single command entrypoint
 Usage:
     python run_pipeline.py
 
+    # Stages are skipped when their inputs and config are unchanged since the
+    # last run; run one stage, or force a rebuild
+    python run_pipeline.py --stage chunk
+    python run_pipeline.py --stage embed --force
+
+    # Re-embed only chunks whose text changed since the live snapshot
+    python run_pipeline.py --incremental
+
+    # Large corpora — streaming ingest with bounded memory and crash resume
+    python run_pipeline.py --stream
+
     # Run a query (retrieval + answer + log)
     python run_pipeline.py --query "What evidence did Curiosity find in Gale Crater?"
 
+    # Restrict the search to a subset of the corpus
+    python run_pipeline.py --query "What produces methane?" --filter "year>=2015; keyword=methane"
+
 Requires Ollama running locally:
     ollama serve
     ollama pull llama3.2
 """
 
 import sys
+import csv
+import json
+import time
+import hashlib
 import argparse
+from datetime import datetime
 from pathlib import Path
 
 # Add repo root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from src.ingest import chunk, embed_index, pagecache, snapshot
 from src.ingest.chunk import run as run_chunking
 from src.ingest.embed_index import run as run_embedding
-from src.rag.retrieve import query_and_log
+from src.ingest.stream import run as run_streaming
+
+STATE_PATH  = Path("data/pipeline_state.json")
+SMOKE_QUERY = "What evidence did Curiosity find in Gale Crater?"
+
+
+# ── Stage fingerprints ─────────────────────────────────────────────────────────
+# A fingerprint hashes everything a stage's output depends on: its config,
+# the code that produces it, and the content of its inputs. A stage is
+# up to date when its fingerprint matches the last successful run and its
+# outputs still check out.
+def _digest(parts: dict) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def _source(module) -> str:
+    return snapshot.fingerprint_file(Path(module.__file__))
+
+
+def _pdf_hashes() -> dict:
+    with chunk.MANIFEST_PATH.open(newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    out = {}
+    for row in rows:
+        pdf = Path(row["raw_path"]).with_suffix(".pdf")
+        out[row["source_id"]] = pagecache.pdf_hash(pdf) if pdf.exists() else None
+    return out
+
+
+def _chunks_hash():
+    return snapshot.fingerprint_file(chunk.CHUNKS_PATH) if chunk.CHUNKS_PATH.exists() else None
+
+
+def _fp_chunk(opts) -> str:
+    return _digest({
+        "manifest":  snapshot.fingerprint_file(chunk.MANIFEST_PATH),
+        "pdfs":      _pdf_hashes(),
+        "config":    [chunk.CHUNK_CHARS, chunk.OVERLAP_CHARS, opts.extractor or pagecache.EXTRACTOR],
+        "code":      [_source(chunk), _source(pagecache)],
+    })
+
+
+def _fp_embed(opts) -> str:
+    return _digest({
+        "chunks": _chunks_hash(),
+        "config": [embed_index.EMBED_MODEL, embed_index.SHARDS, embed_index.SENTENCES],
+        "code":   _source(embed_index),
+    })
+
+
+def _fp_ingest(opts) -> str:
+    return _digest({"chunk": _fp_chunk(opts), "config": [embed_index.EMBED_MODEL]})
 
 
-def run_pipeline():
+def _fp_smoke(opts) -> str:
+    return _digest({"snapshot": snapshot.current_version(), "query": SMOKE_QUERY})
+
+
+def _snapshot_matches_chunks() -> bool:
+    manifest = snapshot.read_manifest(snapshot.current_version())
+    return manifest.get("chunks_fingerprint") is not None and manifest["chunks_fingerprint"] == _chunks_hash()
+
+
+def _run_smoke(opts):
+    from src.rag.retrieve import query_and_log
+    query_and_log(SMOKE_QUERY)
+
+
+# ── Stage graph ────────────────────────────────────────────────────────────────
+# deps: stages that must be current first; outputs_ok: the artifacts exist
+# and belong together. `ingest` (streaming) replaces chunk + embed with --stream.
+STAGES = {
+    "chunk": {
+        "title":       "Chunking PDFs",
+        "deps":        [],
+        "fingerprint": _fp_chunk,
+        "outputs_ok":  lambda: chunk.CHUNKS_PATH.exists(),
+        "run":         lambda opts: run_chunking(extractor=opts.extractor),
+    },
+    "embed": {
+        "title":       "Embedding & Indexing",
+        "deps":        ["chunk"],
+        "fingerprint": _fp_embed,
+        "outputs_ok":  _snapshot_matches_chunks,
+        "run":         lambda opts: run_embedding(incremental=opts.incremental),
+    },
+    "ingest": {
+        "title":       "Streaming ingest (chunk → embed → index)",
+        "deps":        [],
+        "fingerprint": _fp_ingest,
+        "outputs_ok":  lambda: chunk.CHUNKS_PATH.exists() and _snapshot_matches_chunks(),
+        "run":         lambda opts: run_streaming(resume=opts.resume),
+    },
+    "smoke": {
+        "title":       "Smoke Test — Retrieval + Answer + Log",
+        "deps":        [],
+        "fingerprint": _fp_smoke,
+        "outputs_ok":  lambda: True,
+        "run":         _run_smoke,
+    },
+}
+
+
+def _load_state() -> dict:
+    return json.loads(STATE_PATH.read_text()) if STATE_PATH.exists() else {}
+
+
+def _save_state(state: dict):
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    tmp.replace(STATE_PATH)
+
+
+def _is_current(name: str, opts, state: dict) -> bool:
+    stage = STAGES[name]
+    return state.get(name, {}).get("fingerprint") == stage["fingerprint"](opts) and stage["outputs_ok"]()
+
+
+def _plan(stream: bool, only: list = None) -> list:
+    order = ["ingest", "smoke"] if stream else ["chunk", "embed", "smoke"]
+    return [s for s in order if not only or s in only]
+
+
+def run_pipeline(stream: bool = False, resume: bool = True, incremental: bool = False,
+                 stages: list = None, force: bool = False, extractor: str = None):
     print("\n" + "="*60)
     print("MARS LIFE RESEARCH PORTAL — FULL PIPELINE")
     print("="*60 + "\n")
 
-    print("STAGE 1: Chunking PDFs...")
-    print("-"*40)
-    run_chunking()
+    opts    = argparse.Namespace(resume=resume, incremental=incremental, extractor=extractor)
+    state   = _load_state()
+    summary = []
+
+    for n, name in enumerate(_plan(stream, stages), start=1):
+        stage = STAGES[name]
+        print(f"STAGE {n}: {stage['title']}...")
+        print("-"*40)
+        for dep in stage["deps"]:
+            if stages and dep not in stages and not _is_current(dep, opts, state):
+                print(f"  WARNING: '{dep}' is out of date — add --stage {dep} to rebuild it first")
 
-    print("\nSTAGE 2: Embedding & Indexing...")
-    print("-"*40)
-    run_embedding()
+        fp_start = time.perf_counter()
+        fp       = stage["fingerprint"](opts)
+        fp_s     = time.perf_counter() - fp_start
+        prev     = state.get(name, {})
+        if not force and prev.get("fingerprint") == fp and stage["outputs_ok"]():
+            print(f"  up to date (last run {prev.get('finished', '?')[:19]}) — skipping\n")
+            summary.append((name, "skipped", fp_s))
+            continue
 
-    print("\nSTAGE 3: Smoke Test — Retrieval + Answer + Log")
-    print("-"*40)
-    query_and_log("What evidence did Curiosity find in Gale Crater?")
+        start = time.perf_counter()
+        try:
+            stage["run"](opts)
+        except BaseException:
+            summary.append((name, "FAILED", time.perf_counter() - start + fp_s))
+            _print_summary(summary)
+            raise
+        seconds = time.perf_counter() - start
+        # Re-fingerprint: a stage's own run may change what its fingerprint reads
+        # (e.g. the smoke test depends on the snapshot the embed stage published)
+        state[name] = {
+            "fingerprint": stage["fingerprint"](opts),
+            "finished":    datetime.now().isoformat(),
+            "seconds":     round(seconds, 2),
+        }
+        _save_state(state)
+        summary.append((name, "ran", seconds + fp_s))
+        print()
 
+    _print_summary(summary)
     print("\n" + "="*60)
     print("PIPELINE COMPLETE")
     print("Run the portal: streamlit run src/app/app.py")
     print("="*60)
 
 
+def _print_summary(summary: list):
+    print(f"\n{'Stage':<10}{'Status':<10}{'Seconds':>10}")
+    for name, status, seconds in summary:
+        print(f"{name:<10}{status:<10}{seconds:>10.2f}")
+    print(f"{'total':<20}{sum(s for _, _, s in summary):>10.2f}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Mars Life Research Portal")
     parser.add_argument("--query", type=str, default=None, help="Run a single query and log results")
+    parser.add_argument("--filter", type=str, default=None,
+                        help='Metadata filter for --query, e.g. "year>=2015; keyword=methane; type=Case Study"')
+    parser.add_argument("--stream", action="store_true", help="Use the streaming ingest (bounded memory, resumable)")
+    parser.add_argument("--fresh", action="store_true", help="With --stream: ignore any ingest checkpoint")
+    parser.add_argument("--incremental", action="store_true", help="Only re-embed chunks whose text changed")
+    parser.add_argument("--stage", action="append", choices=list(STAGES), default=None,
+                        help="Run only this stage (repeatable); up-to-date stages are still skipped")
+    parser.add_argument("--force", action="store_true", help="Run the selected stages even if up to date")
+    parser.add_argument("--extractor", choices=pagecache.BACKENDS, default=None,
+                        help=f"PDF text backend for chunking (default: {pagecache.EXTRACTOR})")
     args = parser.parse_args()
 
     if args.query:
         # Single query mode — retrieval + answer + log
-        query_and_log(args.query)
+        from src.rag.retrieve import query_and_log, parse_filter
+        try:
+            filters = parse_filter(args.filter) or None
+        except ValueError as e:
+            parser.error(str(e))
+        query_and_log(args.query, filters=filters)
     else:
-        # Full pipeline mode — chunk + embed + index + smoke test
-        run_pipeline()
+        # Full pipeline mode — stale stages of chunk + embed + index + smoke test
+        stream = args.stream or (args.stage is not None and "ingest" in args.stage)
+        run_pipeline(stream=stream, resume=not args.fresh, incremental=args.incremental,
+                     stages=args.stage, force=args.force, extractor=args.extractor)
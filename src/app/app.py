@@ -8,15 +8,16 @@ Requires Ollama running locally:
 """
 
 import streamlit as st
-import json
 import sys
 from datetime import datetime
 from pathlib import Path
 import re
 import html
+import time
 
 ROOT = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(ROOT))
+from src.rag import export
 
 st.set_page_config(page_title="Mars Life Research Portal", layout="wide", initial_sidebar_state="expanded")
 
@@ -89,15 +90,77 @@ section[data-testid="stSidebar"] .block-container{padding:2rem 1.2rem!important;
 @st.cache_resource
 def load_rag():
     from src.rag.rag import ask, save_thread, load_threads
-    return ask, save_thread, load_threads
+    from src.rag import jobs
+    return ask, save_thread, load_threads, jobs
 
-rag_ask = rag_save_thread = rag_load_threads = None
+rag_ask = rag_save_thread = rag_load_threads = rag_jobs = None
 rag_error = None
 try:
-    rag_ask, rag_save_thread, rag_load_threads = load_rag()
+    rag_ask, rag_save_thread, rag_load_threads, rag_jobs = load_rag()
 except Exception as e:
     rag_error = str(e)
 
+# ── Log readers ────────────────────────────────────────────────────────────────
+# Logs are append-only and can grow large: pages are read through logstore's
+# line index and cached on (size, mtime); totals fold in only new records.
+QUERY_LOG   = ROOT / "logs/query_log.jsonl"
+THREADS_LOG = ROOT / "logs/threads.jsonl"
+LOG_PAGE_SIZE = 20
+EXPORT_PART_MB = 50   # largest log download; bigger logs are split into parts
+
+
+def log_signature(path: Path) -> tuple:
+    from src.rag.logstore import signature
+    return signature(path)
+
+
+@st.cache_data(max_entries=4)
+def recent_threads(size: int, mtime_ns: int) -> list:
+    return rag_load_threads(limit=8)
+
+
+def _add_query_stats(acc: dict, log: dict) -> dict:
+    conf = log.get("confidence", {})
+    g    = log.get("grounding") or {}
+    acc["total"]          += 1
+    acc["answered"]       += bool(conf.get("can_answer", False))
+    acc["conf_sum"]       += conf.get("overall_confidence", 0)
+    acc["cite_checked"]   += g.get("checked", 0)
+    acc["cite_supported"] += g.get("supported", 0)
+    return acc
+
+
+def query_log_stats() -> dict:
+    """Totals over the query log; only records appended since the last call are parsed."""
+    from src.rag.logstore import fold
+    stats = fold(QUERY_LOG, "eval_stats", lambda: dict.fromkeys(
+        ("total", "answered", "conf_sum", "cite_checked", "cite_supported"), 0), _add_query_stats)
+    stats["avg_conf"] = stats["conf_sum"] / max(stats["total"], 1)
+    return stats
+
+
+@st.cache_data(max_entries=8)
+def cached_pdf(page_html: str) -> bytes:
+    return export.memo_pdf(page_html)
+
+
+@st.cache_data(max_entries=16)
+def query_log_page(page: int, size: int, mtime_ns: int) -> list:
+    from src.rag.logstore import read_page
+    return read_page(QUERY_LOG, page, LOG_PAGE_SIZE)
+
+# Queries run on the background job queue (src/rag/jobs.py); the page polls it
+JOB_POLL_S = 1.5
+JOB_STAGES = {
+    "queued":         "Queued",
+    "requeued":       "Queued (restarted)",
+    "retrieving":     "Retrieving evidence",
+    "retrieved":      "Evidence retrieved — generating memo",
+    "memo":           "Memo written — building evidence table",
+    "evidence_table": "Generating annotated bibliography",
+    "annot_bib":      "Analysing gaps",
+}
+
 
 # ── SIDEBAR ────────────────────────────────────────────────────────────────────
 with st.sidebar:
@@ -117,13 +180,38 @@ with st.sidebar:
     if rag_error:
         st.markdown(f'<div style="color:#f06060;font-size:0.75rem;margin-top:1rem;padding:0.7rem;border:1px solid #401010;background:#100505">RAG ERROR<br><span style="color:#888;font-size:0.65rem">{rag_error[:120]}</span></div>', unsafe_allow_html=True)
 
+    st.markdown('<hr class="divider">', unsafe_allow_html=True)
+    st.markdown('<div class="sidebar-label">Retrieval</div>', unsafe_allow_html=True)
+    rerank_on = st.checkbox("Cross-encoder re-rank", value=False, help="Over-retrieve 50 candidates and re-score them on CPU before sending the top chunks to the LLM")
+
+    st.markdown('<div class="sidebar-label">Filters</div>', unsafe_allow_html=True)
+    manifest_path = ROOT / "data/data_manifest.csv"
+    manifest_rows = []
+    if manifest_path.exists():
+        import csv
+        with manifest_path.open(newline="", encoding="utf-8") as f:
+            manifest_rows = list(csv.DictReader(f))
+    f_sources = st.multiselect("Sources", sorted(r["source_id"] for r in manifest_rows))
+    f_types   = st.multiselect("Type", sorted({r["type"] for r in manifest_rows if r.get("type")}))
+    f_keyword = st.text_input("Title keyword", placeholder="e.g. methane")
+    years     = [int(r["year"]) for r in manifest_rows if str(r.get("year", "")).isdigit()]
+    f_years   = st.slider("Year", min(years), max(years), (min(years), max(years))) if years else None
+    filters   = {
+        "source_id": f_sources,
+        "type":      f_types,
+        "keyword":   f_keyword.strip(),
+    }
+    if f_years and f_years != (min(years), max(years)):
+        filters["year_min"], filters["year_max"] = f_years
+    filters = {k: v for k, v in filters.items() if v} or None
+
     st.markdown('<hr class="divider">', unsafe_allow_html=True)
     st.markdown('<div class="sidebar-label">Research Threads</div>', unsafe_allow_html=True)
 
     if rag_load_threads:
-        threads = rag_load_threads()
+        threads = recent_threads(*log_signature(THREADS_LOG))
         if threads:
-            for t in reversed(threads[-8:]):
+            for t in reversed(threads):
                 ts   = t.get("timestamp","")[:16].replace("T"," ")
                 q    = t.get("query","")[:60] + ("…" if len(t.get("query",""))>60 else "")
                 conf = t.get("confidence",{}).get("overall_confidence",0)
@@ -164,133 +252,183 @@ with tab_ask:
         st.markdown('<div style="color:var(--muted);font-size:0.78rem;padding-top:0.5rem">Powered by Mistral 7B via Ollama · Running locally</div>', unsafe_allow_html=True)
         
     if run and query:
-        if not rag_ask:
+        if not rag_jobs:
             st.error(f"RAG system failed to load: {rag_error}")
         else:
-            with st.spinner("Retrieving evidence, generating memo and bibliography..."):
-                try:
-                    result    = rag_ask(question=query)
-                    conf      = result["confidence"]
-                    memo      = result["memo"]
-                    citations = result["citations"]
-                    retrieved = result["retrieved"]
-                    ev_table  = result.get("evidence_table", [])
-                    annot_bib = result.get("annot_bib", [])
-                    gaps      = result.get("gaps", {})
-                    score     = conf["overall_confidence"]
-
-                    # Stats
-                    st.markdown(f"""
-                    <div class="stat-grid">
-                        <div class="stat-cell"><div class="stat-value">{score:.2f}</div><div class="stat-label">Overall Conf</div></div>
-                        <div class="stat-cell"><div class="stat-value">{conf.get('retrieval_confidence',0):.2f}</div><div class="stat-label">Retrieval Conf</div></div>
-                        <div class="stat-cell"><div class="stat-value">{len(set(s for s,_ in citations))}</div><div class="stat-label">Sources Cited</div></div>
-                        <div class="stat-cell"><div class="stat-value">{'YES' if conf['can_answer'] else 'NO'}</div><div class="stat-label">Answerable</div></div>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                    if not conf["can_answer"]:
-                        # ── BETTER REFUSAL ──────────────────────────────────
-                        reason_line = conf.get("reasoning", "Confidence below threshold")
-                        unanswered  = gaps.get("unanswered_aspects", [])
-                        suggestions = gaps.get("suggested_queries", [])
-                        missing     = gaps.get("missing_sources", [])
-                        unanswered_html = "".join(f'<div style="font-size:0.8rem;color:#a06080;margin:0.2rem 0">• {a}</div>' for a in unanswered)
-                        suggest_html = "".join(f'<div style="font-size:0.8rem;color:#8080c0;margin:0.2rem 0">→ &ldquo;{sq}&rdquo;</div>' for sq in suggestions)
-                        missing_html    = "".join(f'<div style="font-size:0.78rem;color:var(--muted);margin:0.2rem 0">• {s}</div>' for s in missing)
-                        st.markdown(f"""
-                        <div class="refused-box">
-                            <div class="refused-title">INSUFFICIENT EVIDENCE</div>
-                            <div style="font-size:0.82rem;color:#888;margin-bottom:1rem">{reason_line}</div>
-                            {f'<div class="annot-field-label" style="color:#c03060">Why this cannot be answered</div>{unanswered_html}' if unanswered else ""}
-                            {f'<div class="annot-field-label" style="color:#8080c0;margin-top:0.8rem">Suggested next queries</div>{suggest_html}' if suggestions else ""}
-                            {f'<div class="annot-field-label" style="color:var(--muted);margin-top:0.8rem">Corpus sources that may help</div>{missing_html}' if missing else ""}
-                        </div>
-                        """, unsafe_allow_html=True)
+            job_id = rag_jobs.submit(query, rerank=rerank_on, filters=filters)
+            st.session_state.setdefault("jobs", []).insert(0, job_id)
+            st.session_state["active_job"] = job_id
+
+    # ── JOB QUEUE ──────────────────────────────────────────
+    session_jobs = [j for j in (rag_jobs.get(i) for i in st.session_state.get("jobs", [])) if j] if rag_jobs else []
+    if len(session_jobs) > 1:
+        with st.expander(f"YOUR QUERIES ({len(session_jobs)})", expanded=False):
+            for j in session_jobs:
+                c1, c2 = st.columns([5, 1])
+                c1.markdown(f'<div class="log-row"><span class="badge badge-medium">{j["status"]}</span><div class="log-q">{html.escape(j["query"][:90])}</div><div class="log-meta">{j["submitted"][11:16]}</div></div>', unsafe_allow_html=True)
+                if c2.button("VIEW", key=f"view_{j['id']}"):
+                    st.session_state["active_job"] = j["id"]
+                    st.rerun()
+
+    job = rag_jobs.get(st.session_state["active_job"]) if rag_jobs and st.session_state.get("active_job") else None
+    poll_job = False   # rerun to refresh progress, once every tab has rendered (end of script)
+
+    if job is not None and job["status"] in ("queued", "running"):
+        stage   = JOB_STAGES.get(job["stage"], job["stage"])
+        partial = job.get("partial", {})
+        st.info(f"{stage} · submitted {job['submitted'][11:19]} — you can keep using the app; this query keeps running.")
+        if "confidence" in partial:
+            pconf = partial["confidence"]
+            st.markdown(f'<div class="section-eyebrow">Confidence {pconf["overall_confidence"]:.2f} · {"answerable" if pconf["can_answer"] else "insufficient evidence"}</div>', unsafe_allow_html=True)
+        if "memo" in partial:
+            memo_html = partial["memo"].replace('\n\n','</p><p>').replace('\n','<br>')
+            st.markdown(f'<div class="memo-wrap"><p>{memo_html}</p></div>', unsafe_allow_html=True)
+        elif partial.get("extractive"):
+            # Key sentences from the evidence, shown until the memo is ready
+            st.markdown('<div class="section-eyebrow">Quick answer · key sentences from the evidence</div>', unsafe_allow_html=True)
+            for sent in partial["extractive"]:
+                st.markdown(f'<div class="chunk-card"><div class="chunk-text">{html.escape(sent["text"])}</div><div class="chunk-id">{sent["source_id"]} · {sent["chunk_id"]}<span class="chunk-score">score {sent["score"]:.3f}</span></div></div>', unsafe_allow_html=True)
+        if "retrieved" in partial:
+            with st.expander(f"RETRIEVED EVIDENCE ({len(partial['retrieved'])} chunks)", expanded=False):
+                for r in partial["retrieved"]:
+                    st.markdown(f'<div class="chunk-card"><div class="chunk-id">{r["source_id"]} · {r["chunk_id"]}<span class="chunk-score">score {r["score"]:.3f}</span></div><div class="chunk-text">{r["text"][:450]}{"…" if len(r["text"])>450 else ""}</div></div>', unsafe_allow_html=True)
+        poll_job = True
+
+    elif job is not None and job["status"] == "failed":
+        st.error(f"Error: {job.get('error')}")
+
+    elif job is not None and job["status"] == "done":
+        query  = job["query"]
+        result = job["result"]
+        try:
+            conf      = result["confidence"]
+            memo      = result["memo"]
+            citations = result["citations"]
+            retrieved = result["retrieved"]
+            ev_table  = result.get("evidence_table", [])
+            annot_bib = result.get("annot_bib", [])
+            gaps      = result.get("gaps", {})
+            score     = conf["overall_confidence"]
+
+            # Stats
+            st.markdown(f"""
+            <div class="stat-grid">
+                <div class="stat-cell"><div class="stat-value">{score:.2f}</div><div class="stat-label">Overall Conf</div></div>
+                <div class="stat-cell"><div class="stat-value">{conf.get('retrieval_confidence',0):.2f}</div><div class="stat-label">Retrieval Conf</div></div>
+                <div class="stat-cell"><div class="stat-value">{len(set(s for s,_ in citations))}</div><div class="stat-label">Sources Cited</div></div>
+                <div class="stat-cell"><div class="stat-value">{'YES' if conf['can_answer'] else 'NO'}</div><div class="stat-label">Answerable</div></div>
+            </div>
+            """, unsafe_allow_html=True)
 
+            if not conf["can_answer"]:
+                # ── BETTER REFUSAL ──────────────────────────────────
+                reason_line = conf.get("reasoning", "Confidence below threshold")
+                unanswered  = gaps.get("unanswered_aspects", [])
+                suggestions = gaps.get("suggested_queries", [])
+                missing     = gaps.get("missing_sources", [])
+                unanswered_html = "".join(f'<div style="font-size:0.8rem;color:#a06080;margin:0.2rem 0">• {a}</div>' for a in unanswered)
+                suggest_html = "".join(f'<div style="font-size:0.8rem;color:#8080c0;margin:0.2rem 0">→ &ldquo;{sq}&rdquo;</div>' for sq in suggestions)
+                missing_html    = "".join(f'<div style="font-size:0.78rem;color:var(--muted);margin:0.2rem 0">• {s}</div>' for s in missing)
+                st.markdown(f"""
+                <div class="refused-box">
+                    <div class="refused-title">INSUFFICIENT EVIDENCE</div>
+                    <div style="font-size:0.82rem;color:#888;margin-bottom:1rem">{reason_line}</div>
+                    {f'<div class="annot-field-label" style="color:#c03060">Why this cannot be answered</div>{unanswered_html}' if unanswered else ""}
+                    {f'<div class="annot-field-label" style="color:#8080c0;margin-top:0.8rem">Suggested next queries</div>{suggest_html}' if suggestions else ""}
+                    {f'<div class="annot-field-label" style="color:var(--muted);margin-top:0.8rem">Corpus sources that may help</div>{missing_html}' if missing else ""}
+                </div>
+                """, unsafe_allow_html=True)
+
+            else:
+                # ── SYNTHESIS MEMO ─────────────────────────────────
+                st.markdown('<hr class="divider">', unsafe_allow_html=True)
+                st.markdown('<div class="section-eyebrow">Deliverable 1</div><div class="section-title">SYNTHESIS MEMO</div>', unsafe_allow_html=True)
+                memo_html = memo.replace('\n\n','</p><p>').replace('\n','<br>')
+                memo_html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', memo_html)
+                memo_html = re.sub(r'#{1,3} (.+)', r'<h3>\1</h3>', memo_html)
+                st.markdown(f'<div class="memo-wrap"><p>{memo_html}</p></div>', unsafe_allow_html=True)
+                if citations:
+                    cite_html = "".join(f'<span class="cite-tag">[{s}:{c}]</span>' for s,c in sorted(citations))
+                    st.markdown(f'<div class="section-eyebrow">Verified Citations</div><div class="cite-row">{cite_html}</div>', unsafe_allow_html=True)
+                grounding = result.get("grounding") or {}
+                if grounding.get("checked"):
+                    unsupported = [c for c in grounding["sentences"] if not c["supported"]]
+                    with st.expander(f"CITATION OVERLAP — {grounding['supported']}/{grounding['checked']} cited sentences share wording with their chunk (lexical check; paraphrases score low)", expanded=False):
+                        for c in unsupported:
+                            st.markdown(f'<div class="chunk-card"><div class="chunk-id">{html.escape(", ".join(c["citations"]))}<span class="chunk-score">support {c["support"]:.2f} · best {html.escape(c["best_citation"])} {c["best_support"]:.2f}</span></div><div class="chunk-text">{html.escape(c["sentence"])}</div></div>', unsafe_allow_html=True)
+                        if not unsupported:
+                            st.markdown('<div style="color:var(--muted);font-size:0.8rem">Every cited sentence shares wording with the chunk it cites.</div>', unsafe_allow_html=True)
+
+                # ── EVIDENCE TABLE ─────────────────────────────────
+                if ev_table:
+                    st.markdown('<hr class="divider">', unsafe_allow_html=True)
+                    st.markdown('<div class="section-eyebrow">Deliverable 2</div><div class="section-title">EVIDENCE TABLE</div><div class="section-desc">Every retrieved chunk mapped to a claim, citation, confidence score, and quality notes.</div>', unsafe_allow_html=True)
+                    rows_html = ""
+                    for row in ev_table:
+                        if row["confidence_label"] == "High":     badge = '<span class="badge badge-high">High</span>'
+                        elif row["confidence_label"] == "Medium": badge = '<span class="badge badge-medium">Medium</span>'
+                        else:                                      badge = '<span class="badge badge-low">Low</span>'
+                        rows_html += f"""<tr>
+                            <td>{row['claim'][:120]}…</td>
+                            <td style="font-size:0.75rem;color:var(--muted)">{row['snippet'][:180]}…</td>
+                            <td><span class="cite-tag">{row['citation']}</span></td>
+                            <td>{badge}<br><span style="font-family:'Barlow Condensed';font-size:0.65rem;color:var(--muted)">{row['confidence_score']}</span></td>
+                            <td style="font-size:0.78rem;color:var(--muted)">{row['notes']}</td>
+                        </tr>"""
+                    st.markdown(f"""<table class="ev-table"><thead><tr>
+                        <th>Claim</th><th>Evidence Snippet</th><th>Citation</th><th>Confidence</th><th>Notes</th>
+                    </tr></thead><tbody>{rows_html}</tbody></table>""", unsafe_allow_html=True)
+                    import csv, io
+                    csv_buf = io.StringIO()
+                    writer = csv.DictWriter(csv_buf, fieldnames=["claim","snippet","citation","confidence_score","confidence_label","notes"])
+                    writer.writeheader(); writer.writerows(ev_table)
+                    st.download_button("⬇ DOWNLOAD EVIDENCE TABLE (CSV)", data=csv_buf.getvalue(), file_name=f"evidence_table_{result['timestamp'][:10]}.csv", mime="text/csv")
+
+                # ── ANNOTATED BIBLIOGRAPHY ─────────────────────────
+                if annot_bib:
+                    st.markdown('<hr class="divider">', unsafe_allow_html=True)
+                    with st.expander("DELIVERABLE 3 · ANNOTATED BIBLIOGRAPHY", expanded=True):
+                        st.markdown('<div class="section-desc">LLM-generated annotations for each unique source: claim, method, limitations, and relevance.</div>', unsafe_allow_html=True)
+                        for entry in annot_bib:
+                            st.markdown(f"""
+                            <div class="annot-card">
+                                <div class="annot-source">{entry['source_id']} · {entry['chunk_id']}</div>
+                                <div class="annot-field-label">Claim</div><div class="annot-field-value">{entry['claim']}</div>
+                                <div class="annot-field-label">Method</div><div class="annot-field-value">{entry['method']}</div>
+                                <div class="annot-field-label">Limitations</div><div class="annot-field-value">{entry['limitations']}</div>
+                                <div class="annot-field-label">Why It Matters</div><div class="annot-field-value">{entry['why_it_matters']}</div>
+                            </div>""", unsafe_allow_html=True)
+
+                # ── GAP FINDER ─────────────────────────────────────
+                if gaps:
+                    st.markdown('<hr class="divider">', unsafe_allow_html=True)
+                    st.markdown('<div class="section-eyebrow">Stretch Goal · Gap Analysis</div><div class="section-title">RESEARCH GAPS</div><div class="section-desc">Evidence gaps detected in the corpus for this query, with suggested next retrieval steps.</div>', unsafe_allow_html=True)
+                    has_gaps = gaps.get("unanswered_aspects") or gaps.get("suggested_queries") or gaps.get("missing_sources")
+                    if not has_gaps:
+                        st.markdown('<div style="color:#5adf80;font-size:0.85rem;padding:1rem;border:1px solid #1a4020;background:#0d2010">No significant gaps detected — corpus coverage for this query appears strong.</div>', unsafe_allow_html=True)
                     else:
-                        # ── SYNTHESIS MEMO ─────────────────────────────────
-                        st.markdown('<hr class="divider">', unsafe_allow_html=True)
-                        st.markdown('<div class="section-eyebrow">Deliverable 1</div><div class="section-title">SYNTHESIS MEMO</div>', unsafe_allow_html=True)
-                        memo_html = memo.replace('\n\n','</p><p>').replace('\n','<br>')
-                        memo_html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', memo_html)
-                        memo_html = re.sub(r'#{1,3} (.+)', r'<h3>\1</h3>', memo_html)
-                        st.markdown(f'<div class="memo-wrap"><p>{memo_html}</p></div>', unsafe_allow_html=True)
-                        if citations:
-                            cite_html = "".join(f'<span class="cite-tag">[{s}:{c}]</span>' for s,c in sorted(citations))
-                            st.markdown(f'<div class="section-eyebrow">Verified Citations</div><div class="cite-row">{cite_html}</div>', unsafe_allow_html=True)
-
-                        # ── EVIDENCE TABLE ─────────────────────────────────
-                        if ev_table:
-                            st.markdown('<hr class="divider">', unsafe_allow_html=True)
-                            st.markdown('<div class="section-eyebrow">Deliverable 2</div><div class="section-title">EVIDENCE TABLE</div><div class="section-desc">Every retrieved chunk mapped to a claim, citation, confidence score, and quality notes.</div>', unsafe_allow_html=True)
-                            rows_html = ""
-                            for row in ev_table:
-                                if row["confidence_label"] == "High":     badge = '<span class="badge badge-high">High</span>'
-                                elif row["confidence_label"] == "Medium": badge = '<span class="badge badge-medium">Medium</span>'
-                                else:                                      badge = '<span class="badge badge-low">Low</span>'
-                                rows_html += f"""<tr>
-                                    <td>{row['claim'][:120]}…</td>
-                                    <td style="font-size:0.75rem;color:var(--muted)">{row['snippet'][:180]}…</td>
-                                    <td><span class="cite-tag">{row['citation']}</span></td>
-                                    <td>{badge}<br><span style="font-family:'Barlow Condensed';font-size:0.65rem;color:var(--muted)">{row['confidence_score']}</span></td>
-                                    <td style="font-size:0.78rem;color:var(--muted)">{row['notes']}</td>
-                                </tr>"""
-                            st.markdown(f"""<table class="ev-table"><thead><tr>
-                                <th>Claim</th><th>Evidence Snippet</th><th>Citation</th><th>Confidence</th><th>Notes</th>
-                            </tr></thead><tbody>{rows_html}</tbody></table>""", unsafe_allow_html=True)
-                            import csv, io
-                            csv_buf = io.StringIO()
-                            writer = csv.DictWriter(csv_buf, fieldnames=["claim","snippet","citation","confidence_score","confidence_label","notes"])
-                            writer.writeheader(); writer.writerows(ev_table)
-                            st.download_button("⬇ DOWNLOAD EVIDENCE TABLE (CSV)", data=csv_buf.getvalue(), file_name=f"evidence_table_{result['timestamp'][:10]}.csv", mime="text/csv")
-
-                        # ── ANNOTATED BIBLIOGRAPHY ─────────────────────────
-                        if annot_bib:
-                            st.markdown('<hr class="divider">', unsafe_allow_html=True)
-                            with st.expander("DELIVERABLE 3 · ANNOTATED BIBLIOGRAPHY", expanded=True):
-                                st.markdown('<div class="section-desc">LLM-generated annotations for each unique source: claim, method, limitations, and relevance.</div>', unsafe_allow_html=True)
-                                for entry in annot_bib:
-                                    st.markdown(f"""
-                                    <div class="annot-card">
-                                        <div class="annot-source">{entry['source_id']} · {entry['chunk_id']}</div>
-                                        <div class="annot-field-label">Claim</div><div class="annot-field-value">{entry['claim']}</div>
-                                        <div class="annot-field-label">Method</div><div class="annot-field-value">{entry['method']}</div>
-                                        <div class="annot-field-label">Limitations</div><div class="annot-field-value">{entry['limitations']}</div>
-                                        <div class="annot-field-label">Why It Matters</div><div class="annot-field-value">{entry['why_it_matters']}</div>
-                                    </div>""", unsafe_allow_html=True)
-
-                        # ── GAP FINDER ─────────────────────────────────────
-                        if gaps:
-                            st.markdown('<hr class="divider">', unsafe_allow_html=True)
-                            st.markdown('<div class="section-eyebrow">Stretch Goal · Gap Analysis</div><div class="section-title">RESEARCH GAPS</div><div class="section-desc">Evidence gaps detected in the corpus for this query, with suggested next retrieval steps.</div>', unsafe_allow_html=True)
-                            has_gaps = gaps.get("unanswered_aspects") or gaps.get("suggested_queries") or gaps.get("missing_sources")
-                            if not has_gaps:
-                                st.markdown('<div style="color:#5adf80;font-size:0.85rem;padding:1rem;border:1px solid #1a4020;background:#0d2010">No significant gaps detected — corpus coverage for this query appears strong.</div>', unsafe_allow_html=True)
-                            else:
-                                gap_cols = st.columns(3)
-                                with gap_cols[0]:
-                                    st.markdown('<div class="annot-field-label">Coverage Issues</div>', unsafe_allow_html=True)
-                                    for a in gaps.get("unanswered_aspects", []) or ["None detected"]:
-                                        st.markdown(f'<div style="font-size:0.8rem;color:#f06060;margin:0.3rem 0;padding:0.4rem 0.6rem;border-left:2px solid #f06060;background:#120808">• {a}</div>', unsafe_allow_html=True)
-                                with gap_cols[1]:
-                                    st.markdown('<div class="annot-field-label">Suggested Next Queries</div>', unsafe_allow_html=True)
-                                    for sq in gaps.get("suggested_queries", []) or ["None"]:
-                                        st.markdown(f'<div style="font-size:0.78rem;color:#8080f0;margin:0.3rem 0;padding:0.4rem 0.6rem;border-left:2px solid #8080f0;background:#08080f">→ {sq}</div>', unsafe_allow_html=True)
-                                with gap_cols[2]:
-                                    st.markdown('<div class="annot-field-label">Corpus Sources To Check</div>', unsafe_allow_html=True)
-                                    for s in gaps.get("missing_sources", []) or gaps.get("weak_chunks", [])[:3] or ["All sources matched"]:
-                                        st.markdown(f'<div style="font-size:0.78rem;color:var(--ice);margin:0.3rem 0;padding:0.4rem 0.6rem;border-left:2px solid var(--ice);background:#080f14">• {s}</div>', unsafe_allow_html=True)
-
-                        st.session_state["last_result"] = result
-                        rag_save_thread({"query": query, "citations": citations, "confidence": conf, "timestamp": result["timestamp"]})
-
-                    with st.expander(f"RETRIEVED EVIDENCE ({len(retrieved)} chunks)", expanded=False):
-                        for r in retrieved:
-                            st.markdown(f'<div class="chunk-card"><div class="chunk-id">{r["source_id"]} · {r["chunk_id"]}<span class="chunk-score">score {r["score"]:.3f}</span></div><div class="chunk-text">{r["text"][:450]}{"…" if len(r["text"])>450 else ""}</div></div>', unsafe_allow_html=True)
-
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                        gap_cols = st.columns(3)
+                        with gap_cols[0]:
+                            st.markdown('<div class="annot-field-label">Coverage Issues</div>', unsafe_allow_html=True)
+                            for a in gaps.get("unanswered_aspects", []) or ["None detected"]:
+                                st.markdown(f'<div style="font-size:0.8rem;color:#f06060;margin:0.3rem 0;padding:0.4rem 0.6rem;border-left:2px solid #f06060;background:#120808">• {a}</div>', unsafe_allow_html=True)
+                        with gap_cols[1]:
+                            st.markdown('<div class="annot-field-label">Suggested Next Queries</div>', unsafe_allow_html=True)
+                            for sq in gaps.get("suggested_queries", []) or ["None"]:
+                                st.markdown(f'<div style="font-size:0.78rem;color:#8080f0;margin:0.3rem 0;padding:0.4rem 0.6rem;border-left:2px solid #8080f0;background:#08080f">→ {sq}</div>', unsafe_allow_html=True)
+                        with gap_cols[2]:
+                            st.markdown('<div class="annot-field-label">Corpus Sources To Check</div>', unsafe_allow_html=True)
+                            for s in gaps.get("missing_sources", []) or gaps.get("weak_chunks", [])[:3] or ["All sources matched"]:
+                                st.markdown(f'<div style="font-size:0.78rem;color:var(--ice);margin:0.3rem 0;padding:0.4rem 0.6rem;border-left:2px solid var(--ice);background:#080f14">• {s}</div>', unsafe_allow_html=True)
+
+                st.session_state["last_result"] = result
+
+            with st.expander(f"RETRIEVED EVIDENCE ({len(retrieved)} chunks)", expanded=False):
+                for r in retrieved:
+                    st.markdown(f'<div class="chunk-card"><div class="chunk-id">{r["source_id"]} · {r["chunk_id"]}<span class="chunk-score">score {r["score"]:.3f}</span></div><div class="chunk-text">{r["text"][:450]}{"…" if len(r["text"])>450 else ""}</div></div>', unsafe_allow_html=True)
+
+        except Exception as e:
+            st.error(f"Error: {e}")
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -303,29 +441,29 @@ with tab_eval:
     <div class="section-desc">All queries run through the portal with confidence scores and citation counts.</div>
     """, unsafe_allow_html=True)
 
-    log_path = ROOT / "logs/query_log.jsonl"
-    if not log_path.exists() or log_path.stat().st_size == 0:
+    log_sig = log_signature(QUERY_LOG)
+    if log_sig[0] == 0:
         st.markdown('<div style="color:var(--muted);font-size:0.85rem">No evaluation data yet. Run queries in the Research tab.</div>', unsafe_allow_html=True)
     else:
-        logs = []
-        with log_path.open() as f:
-            for line in f:
-                if line.strip():
-                    try: logs.append(json.loads(line))
-                    except: pass
-        if logs:
-            n_ans = sum(1 for l in logs if l.get("confidence",{}).get("can_answer",False))
-            avg_c = sum(l.get("confidence",{}).get("overall_confidence",0) for l in logs)/len(logs)
+        stats = query_log_stats()
+        if stats["total"]:
+            n_ans = stats["answered"]
+            avg_c = stats["avg_conf"]
             st.markdown(f"""
             <div class="stat-grid">
-                <div class="stat-cell"><div class="stat-value">{len(logs)}</div><div class="stat-label">Total Queries</div></div>
+                <div class="stat-cell"><div class="stat-value">{stats['total']}</div><div class="stat-label">Total Queries</div></div>
                 <div class="stat-cell"><div class="stat-value">{n_ans}</div><div class="stat-label">Answered</div></div>
-                <div class="stat-cell"><div class="stat-value">{len(logs)-n_ans}</div><div class="stat-label">Refused</div></div>
+                <div class="stat-cell"><div class="stat-value">{stats['total']-n_ans}</div><div class="stat-label">Refused</div></div>
                 <div class="stat-cell"><div class="stat-value">{avg_c:.2f}</div><div class="stat-label">Avg Confidence</div></div>
             </div>
             """, unsafe_allow_html=True)
+            if stats["cite_checked"]:
+                from src.rag.grounding import SUPPORT_THRESHOLD
+                st.markdown(f'<div style="color:var(--muted);font-size:0.78rem">Citation overlap: {stats["cite_supported"] / stats["cite_checked"]:.0%} of {stats["cite_checked"]} cited sentences share at least {int(SUPPORT_THRESHOLD * 100)}% of their word pairs with the chunk they cite. This is a lexical check, not a judgement of support, so faithful paraphrases count as misses. Re-check the whole log with <code>python src/rag/grounding.py --details</code>.</div>', unsafe_allow_html=True)
             st.markdown('<hr class="divider">', unsafe_allow_html=True)
-            for log in reversed(logs[-20:]):
+            n_pages = (stats["total"] + LOG_PAGE_SIZE - 1) // LOG_PAGE_SIZE
+            page    = st.number_input(f"Page (newest first, {n_pages} total)", min_value=1, max_value=n_pages, value=1) - 1 if n_pages > 1 else 0
+            for log in query_log_page(page, *log_sig):
                 conf  = log.get("confidence",{})
                 score = conf.get("overall_confidence",0)
                 ans   = conf.get("can_answer",False)
@@ -338,6 +476,16 @@ with tab_eval:
                 else:              bc,bt = "badge-low",    f"{score:.2f}"
                 st.markdown(f'<div class="log-row"><span class="badge {bc}">{bt}</span><div class="log-q">{q}</div><div class="log-meta">{ts}<br>{nc} citations</div></div>', unsafe_allow_html=True)
 
+    if rag_ask:
+        from src.rag.llm import get_metrics
+        llm_metrics = get_metrics()
+        if llm_metrics:
+            with st.expander("LLM CLIENT METRICS (this server process)", expanded=False):
+                for task, m in sorted(llm_metrics.items()):
+                    n      = max(m["calls"], 1)
+                    errors = ", ".join(f"{k} ×{v}" for k, v in m["errors"].items()) or "none"
+                    st.markdown(f'<div class="log-row"><span class="badge badge-medium">{task}</span><div class="log-q">{m["ok"]}/{m["calls"]} ok · {m["retries"]} retries · avg {m["latency_s"]/n:.1f}s (prefill {m["prompt_eval_s"]/n:.1f}s · decode {m["eval_s"]/n:.1f}s)</div><div class="log-meta">errors: {errors}</div></div>', unsafe_allow_html=True)
+
     st.markdown('<hr class="divider">', unsafe_allow_html=True)
     st.markdown('<div class="section-eyebrow">Batch Evaluation</div>', unsafe_allow_html=True)
 
@@ -376,12 +524,15 @@ with tab_eval:
 
             answered = sum(1 for r in results if r["confidence"]["can_answer"])
             avg      = sum(r["confidence"]["overall_confidence"] for r in results)/len(results)
+            checked  = sum((r.get("grounding") or {}).get("checked", 0) for r in results)
+            support  = sum((r.get("grounding") or {}).get("supported", 0) for r in results)
+            cite_acc = f"{support / checked:.0%}" if checked else "—"
             st.markdown(f"""
             <div class="stat-grid" style="margin-top:1rem">
                 <div class="stat-cell"><div class="stat-value">{answered}</div><div class="stat-label">Answered</div></div>
                 <div class="stat-cell"><div class="stat-value">{20-answered}</div><div class="stat-label">Refused</div></div>
                 <div class="stat-cell"><div class="stat-value">{avg:.2f}</div><div class="stat-label">Avg Confidence</div></div>
-                <div class="stat-cell"><div class="stat-value">100%</div><div class="stat-label">Citation Accuracy</div></div>
+                <div class="stat-cell"><div class="stat-value">{cite_acc}</div><div class="stat-label">Citation Overlap</div></div>
             </div>
             """, unsafe_allow_html=True)
 
@@ -419,80 +570,60 @@ with tab_export:
     <div class="section-title">EXPORT</div>
     <div class="section-desc">Download your synthesis memos, evidence tables, query logs, and research threads.</div>
     """, unsafe_allow_html=True)
+    st.markdown('<div style="color:var(--muted);font-size:0.78rem;margin-bottom:1.5rem">To export many logged results at once: <code>python src/rag/export.py --formats md,csv,html,pdf</code></div>', unsafe_allow_html=True)
 
     if "last_result" in st.session_state:
         r = st.session_state["last_result"]
 
         # ── Memo ──────────────────────────────────────────────────────
-        md = f"""# Mars Life Research Portal — Synthesis Memo
-
-**Query:** {r['query']}
-**Generated:** {r['timestamp'][:16]}
-**Confidence:** {r['confidence']['overall_confidence']:.2f}
-**Sources cited:** {len(set(s for s,_ in r['citations']))}
-
----
-
-{r['memo']}
-
----
-*Generated by Mars Life Research Portal · Phase 3*
-*Corpus: 20 peer-reviewed papers on Mars habitability and biosignatures*
-"""
-        pdf_html = f"""<!DOCTYPE html><html><head><meta charset="utf-8">
-<style>body{{font-family:Georgia,serif;max-width:800px;margin:40px auto;color:#222;line-height:1.7}}
-h1{{color:#c04010;font-size:1.6rem}}.meta{{color:#888;font-size:0.85rem;margin-bottom:1.5rem;padding:0.5rem;background:#f9f9f9}}
-p{{margin:0.8rem 0}}@media print{{body{{margin:1in}}}}</style></head><body>
-<h1>Mars Life Research Portal — Synthesis Memo</h1>
-<div class="meta"><strong>Query:</strong> {r['query']}<br>
-<strong>Generated:</strong> {r['timestamp'][:16]}<br>
-<strong>Confidence:</strong> {r['confidence']['overall_confidence']:.2f}</div>
-{"".join(f"<p>{para}</p>" for para in r['memo'].split(chr(10)+chr(10)))}
-</body></html>"""
-
         st.markdown('<div class="section-eyebrow">Download Memo</div>', unsafe_allow_html=True)
+        pdf_html = export.memo_html(r)
         col1, col2 = st.columns(2)
         with col1:
-            st.download_button("⬇ MARKDOWN", data=md, file_name=f"memo_{r['timestamp'][:10]}.md", mime="text/markdown")
+            st.download_button("⬇ MARKDOWN", data=export.memo_markdown(r), file_name=f"memo_{r['timestamp'][:10]}.md", mime="text/markdown")
         with col2:
             try:
-                import pdfkit
-                pdf_bytes = pdfkit.from_string(pdf_html, False)
+                pdf_bytes = cached_pdf(pdf_html)
                 st.download_button("⬇ PDF", data=pdf_bytes, file_name=f"memo_{r['timestamp'][:10]}.pdf", mime="application/pdf")
-            except:
+            except (ImportError, OSError):
                 st.download_button("⬇ PDF", data=pdf_html, file_name=f"memo_{r['timestamp'][:10]}.html", mime="text/html", help="Open in browser → File → Print → Save as PDF")
         # ── Evidence Table ─────────────────────────────────────────────
         if r.get("evidence_table"):
             st.markdown('<hr class="divider">', unsafe_allow_html=True)
             st.markdown('<div class="section-eyebrow">Download Evidence Table</div>', unsafe_allow_html=True)
-            import csv, io
-            csv_buf = io.StringIO()
-            writer = csv.DictWriter(csv_buf, fieldnames=["claim","snippet","citation","confidence_score","confidence_label","notes"])
-            writer.writeheader()
-            writer.writerows(r["evidence_table"])
-            st.download_button("⬇ CSV", data=csv_buf.getvalue(), file_name=f"evidence_table_{r['timestamp'][:10]}.csv", mime="text/csv")
+            st.download_button("⬇ CSV", data=export.evidence_csv(r), file_name=f"evidence_table_{r['timestamp'][:10]}.csv", mime="text/csv")
 
         # ── Annotated Bibliography ──────────────────────────────────────
         if r.get("annot_bib"):
             st.markdown('<hr class="divider">', unsafe_allow_html=True)
             st.markdown('<div class="section-eyebrow">Download Annotated Bibliography</div>', unsafe_allow_html=True)
-            annot_md = f"# Annotated Bibliography\n\n**Query:** {r['query']}\n**Generated:** {r['timestamp'][:16]}\n\n---\n\n"
-            for entry in r["annot_bib"]:
-                annot_md += f"## {entry['source_id']}\n\n"
-                annot_md += f"**Claim:** {entry['claim']}\n\n"
-                annot_md += f"**Method:** {entry['method']}\n\n"
-                annot_md += f"**Limitations:** {entry['limitations']}\n\n"
-                annot_md += f"**Why It Matters:** {entry['why_it_matters']}\n\n---\n\n"
-            st.download_button("⬇ MARKDOWN", data=annot_md, file_name=f"annot_bib_{r['timestamp'][:10]}.md", mime="text/markdown")
+            st.download_button("⬇ MARKDOWN", data=export.bibliography_markdown(r), file_name=f"annot_bib_{r['timestamp'][:10]}.md", mime="text/markdown")
 
         st.markdown('<hr class="divider">', unsafe_allow_html=True)
         st.markdown('<div class="section-eyebrow">Research Threads & Logs</div>', unsafe_allow_html=True)
-        log_path = ROOT / "logs/query_log.jsonl"
-        if log_path.exists() and log_path.stat().st_size > 0:
-            st.download_button("⬇ FULL QUERY LOG (JSONL)", data=log_path.read_text(), file_name="query_log.jsonl", mime="application/json")
-        threads_path = ROOT / "logs/threads.jsonl"
-        if threads_path.exists() and threads_path.stat().st_size > 0:
-            st.download_button("⬇ RESEARCH THREADS (JSONL)", data=threads_path.read_text(), file_name="threads.jsonl", mime="application/json")
+        # A download button holds its whole payload in memory, so logs are
+        # served in line-aligned parts of at most EXPORT_PART_MB, and a part is
+        # only read once PREPARE is clicked
+        from src.rag.logstore import byte_parts, read_bytes
+        for label, path in [("FULL QUERY LOG", QUERY_LOG), ("RESEARCH THREADS", THREADS_LOG)]:
+            parts = byte_parts(path, EXPORT_PART_MB * 1_000_000)
+            if not parts:
+                continue
+            part = 0
+            if len(parts) > 1:
+                part = st.selectbox(f"{label} part", range(len(parts)), key=f"part_{path.name}",
+                                    format_func=lambda i, p=parts: f"{i + 1} of {len(p)} ({(p[i][1] - p[i][0]) / 1e6:.1f} MB)")
+            start, end = parts[part]
+            if st.button(f"PREPARE {label} ({(end - start) / 1e6:.1f} MB)", key=f"prep_{path.name}"):
+                name = path.name if len(parts) == 1 else f"{path.stem}.part{part + 1:03d}{path.suffix}"
+                st.download_button(f"⬇ {label} (JSONL)", data=read_bytes(path, start, end), file_name=name, mime="application/json")
 
     else:
         st.markdown('<div style="color:var(--muted);font-size:0.85rem;margin-bottom:1.5rem">Run a query in the Research tab first.</div>', unsafe_allow_html=True)
+
+
+# ── Job polling ────────────────────────────────────────────────────────────────
+# Last, so the EVALUATION and EXPORT tabs render before the page reruns
+if poll_job:
+    time.sleep(JOB_POLL_S)
+    st.rerun()
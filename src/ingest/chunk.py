@@ -4,11 +4,13 @@ Parse PDFs from manifest and chunk into overlapping text segments.
 Called by run_pipeline.py
 """
 
-import os, json, re
+import os, sys, json, re, argparse
 from pathlib import Path
 import pandas as pd
 
-import pdfplumber
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.ingest.terms import extract_terms
+from src.ingest import pagecache
 
 # ── Config ─────────────────────────────────────────────────────────────────────
 MANIFEST_PATH = Path("data/data_manifest.csv")
@@ -31,13 +33,10 @@ def clean_text(s: str) -> str:
 
 
 # ── PDF extraction ─────────────────────────────────────────────────────────────
-def extract_pages(pdf_path: Path):
-    pages = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages, start=1):
-            txt = clean_text(page.extract_text() or '')
-            pages.append({'page': i, 'text': txt})
-    return pages
+def extract_pages(pdf_path: Path, extractor: str = None):
+    # Raw page text comes from the page cache; cleaning is applied fresh each run
+    raw, _ = pagecache.raw_pages(pdf_path, extractor)
+    return [{'page': p['page'], 'text': clean_text(p['text'])} for p in raw]
 
 
 # ── Chunking ───────────────────────────────────────────────────────────────────
@@ -57,13 +56,45 @@ def chunk_text(full_text: str, chunk_chars: int = CHUNK_CHARS, overlap_chars: in
     return chunks
 
 
+# ── Stable IDs ─────────────────────────────────────────────────────────────────
+def load_uid_map(*paths: Path) -> dict:
+    """Integer IDs already issued in existing chunk stores.
+
+    Every chunk carries a `uid` that the FAISS index uses as its vector ID.
+    A chunk_id keeps its uid across re-chunks and new chunks get fresh ones,
+    so IDs stay stable for incremental index updates.
+    """
+    ids = {"map": {}, "next": 0}
+    for path in paths:
+        if not path.exists():
+            continue
+        with path.open(encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                c = json.loads(line)
+                if 'uid' in c:
+                    ids["map"][c['chunk_id']] = c['uid']
+                    ids["next"] = max(ids["next"], c['uid'] + 1)
+    return ids
+
+
+def assign_uids(chunks: list, ids: dict):
+    for c in chunks:
+        uid = ids["map"].get(c['chunk_id'])
+        if uid is None:
+            uid = ids["map"][c['chunk_id']] = ids["next"]
+            ids["next"] += 1
+        c['uid'] = uid
+
+
 # ── Per-source builder ─────────────────────────────────────────────────────────
-def build_chunks_for_source(row):
+def build_chunks_for_source(row, extractor: str = None):
     source_id = row['source_id']
     pdf_path  = Path(row['raw_path']).with_suffix('.pdf')
 
     try:
-        pages = extract_pages(pdf_path)
+        pages = extract_pages(pdf_path, extractor)
     except FileNotFoundError:
         print(f"  ERROR: File not found — {pdf_path}")
         return []
@@ -88,13 +119,14 @@ def build_chunks_for_source(row):
             'authors':   row.get('authors', ''),
             'year':      int(row['year']) if str(row.get('year', '')).isdigit() else row.get('year'),
             'raw_path':  str(pdf_path),
-            'text':      c
+            'text':      c,
+            'terms':     extract_terms(c),
         })
     return out
 
 
 # ── Main ───────────────────────────────────────────────────────────────────────
-def run():
+def run(extractor: str = None):
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
     assert MANIFEST_PATH.exists(), f"Manifest not found at {MANIFEST_PATH.resolve()}"
@@ -102,9 +134,11 @@ def run():
     print(f"Loaded manifest: {len(manifest)} sources\n")
 
     all_chunks, successful, failed = [], [], []
+    ids = load_uid_map(CHUNKS_PATH)
 
     for _, row in manifest.iterrows():
-        chunks = build_chunks_for_source(row)
+        chunks = build_chunks_for_source(row, extractor)
+        assign_uids(chunks, ids)
         if chunks:
             all_chunks.extend(chunks)
             successful.append(row['source_id'])
@@ -112,18 +146,27 @@ def run():
         else:
             failed.append(row['source_id'])
 
-    with open(CHUNKS_PATH, 'w', encoding='utf-8') as f:
+    # Replace, never rewrite in place: snapshots hardlink this file
+    tmp = CHUNKS_PATH.with_suffix('.jsonl.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
         for ch in all_chunks:
             f.write(json.dumps(ch, ensure_ascii=False) + '\n')
+    os.replace(tmp, CHUNKS_PATH)
 
     print(f"\n{'='*50}")
     print(f"CHUNKING COMPLETE")
     print(f"  Sources processed : {len(successful)}/{len(manifest)}")
     print(f"  Total chunks      : {len(all_chunks)}")
+    print(f"  Page cache        : {pagecache.stats['hits']} hits, {pagecache.stats['misses']} extracted "
+          f"({extractor or pagecache.EXTRACTOR})")
     print(f"  Output            : {CHUNKS_PATH}")
     if failed:
         print(f"  Failed            : {failed}")
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Parse PDFs from the manifest and chunk them")
+    parser.add_argument("--extractor", choices=pagecache.BACKENDS, default=None,
+                        help=f"PDF text backend (default: {pagecache.EXTRACTOR}); cached per backend")
+    args = parser.parse_args()
+    run(extractor=args.extractor)
@@ -1,64 +1,228 @@
 """
 src/ingest/embed_index.py
 Embed chunks with e5-base-v2 and build FAISS index.
+With --shards N the vectors are split by source_id hash into N independent
+indexes (see snapshot.py); retrieve.py searches them in parallel.
+Every distinct sentence is embedded too, for extractive answers and the
+context budgeter (see sentences.py), and chunk word shingles are indexed
+for citation grounding (see shingles.py).
 Called by run_pipeline.py
 """
 
+import sys
+import argparse
 from pathlib import Path
 import numpy as np
 import orjson
 import faiss
 from sentence_transformers import SentenceTransformer
 
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.ingest import snapshot
+from src.ingest.sentences import normalize, sentence_spans, sentence_key, sentence_hash
+from src.ingest.shingles import build_postings
+
 # ── Config ─────────────────────────────────────────────────────────────────────
 CHUNKS_PATH   = Path("data/processed/chunks.jsonl")
-VECTOR_DIR    = Path("data/vector_store")
+VECTOR_DIR    = snapshot.VECTOR_DIR
 EMBED_MODEL   = "intfloat/e5-base-v2"
 BATCH_SIZE    = 32
+SHARDS        = 1    # index files per snapshot; 1 writes a single faiss.index
+SENTENCES     = True # also build the sentence-level index
+
+
+# ── Incremental reuse ──────────────────────────────────────────────────────────
+def _reusable_vectors(uids: list, hashes: list) -> dict:
+    """uid -> stored vector for chunks whose text is unchanged in the live snapshot."""
+    version  = snapshot.current_version()
+    manifest = snapshot.read_manifest(version)
+    if manifest.get("id_scheme") != "uid" or manifest.get("embed_model") != EMBED_MODEL:
+        print(f"  Live snapshot ({version}) cannot be reused — embedding everything")
+        return {}
+    root     = snapshot.snapshot_dir(version)
+    prev     = orjson.loads((root / "id_map.json").read_bytes())
+    prev_emb = np.load(root / "embeddings.npy", mmap_mode="r")
+    by_uid   = {e["uid"]: (row, e["text_hash"]) for row, e in enumerate(prev)}
+    reuse = {}
+    for uid, h in zip(uids, hashes):
+        hit = by_uid.get(uid)
+        if hit and hit[1] == h:
+            reuse[uid] = prev_emb[hit[0]]
+    return reuse
+
+
+def _reusable_sentence_vectors() -> tuple:
+    """(sentence hash -> row, vectors) from the live snapshot's sentence index."""
+    version = snapshot.current_version()
+    if snapshot.read_manifest(version).get("embed_model") != EMBED_MODEL:
+        return {}, None
+    prev = snapshot.read_sentence_index(snapshot.snapshot_dir(version))
+    if prev is None:
+        return {}, None
+    return {int(h): row for row, h in enumerate(prev["hash"])}, prev["vectors"]
+
+
+# ── Sentence index ─────────────────────────────────────────────────────────────
+def _sentence_rows(chunks: list, uids: list) -> list:
+    """(text, uid, start, end) per distinct sentence of each source.
+
+    Neighbouring chunks overlap, so a sentence is indexed once per source,
+    under the first chunk it appears in.
+    """
+    rows, seen = [], set()
+    for c, uid in zip(chunks, uids):
+        norm = normalize(c["text"])
+        for a, b in sentence_spans(norm):
+            key = (c["source_id"], sentence_key(norm[a:b]))
+            if key not in seen:
+                seen.add(key)
+                rows.append((norm[a:b], uid, a, b))
+    return rows
+
+
+def write_sentence_index(out: Path, chunks: list, uids: list, model, incremental: bool) -> tuple:
+    """Embed every distinct sentence into the snapshot; returns (sentences, embedded)."""
+    rows   = _sentence_rows(chunks, uids)
+    hashes = np.array([sentence_hash(s) for s, *_ in rows], dtype=np.uint64)
+    vecs   = np.empty((len(rows), model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    prev_row, prev_vecs = _reusable_sentence_vectors() if incremental else ({}, None)
+    todo = []
+    for i, h in enumerate(hashes.tolist()):
+        if h in prev_row:
+            vecs[i] = prev_vecs[prev_row[h]]
+        else:
+            todo.append(i)
+    if todo:
+        print(f"Embedding {len(todo)} sentences")
+        vecs[todo] = model.encode(
+            [f"passage: {rows[i][0]}" for i in todo],
+            batch_size=BATCH_SIZE,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32)
+
+    snapshot.write_sentence_index(
+        out, vecs,
+        uid=np.array([r[1] for r in rows], dtype=np.int64),
+        start=np.array([r[2] for r in rows], dtype=np.int32),
+        end=np.array([r[3] for r in rows], dtype=np.int32),
+        hashes=hashes,
+    )
+    return len(rows), len(todo)
+
+
+# ── Shards ─────────────────────────────────────────────────────────────────────
+def build_shard(embeddings: np.ndarray, uids: np.ndarray) -> faiss.Index:
+    """A uid-keyed flat index over one shard's vectors."""
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.shape[1]))
+    index.add_with_ids(np.ascontiguousarray(embeddings), uids)
+    return index
+
+
+def write_shards(out: Path, embeddings: np.ndarray, uids: list, source_ids: list, shards: int) -> list:
+    """Partition by source_id hash and write one index per shard; returns shard sizes."""
+    uids     = np.asarray(uids, dtype=np.int64)
+    assigned = np.array([snapshot.shard_of(sid, shards) for sid in source_ids], dtype=np.int32)
+    sizes    = []
+    for i in range(shards):
+        rows  = np.flatnonzero(assigned == i)
+        index = build_shard(embeddings[rows], uids[rows])
+        faiss.write_index(index, str(out / snapshot.shard_file(i)))
+        sizes.append(int(index.ntotal))
+    return sizes
 
 
 # ── Main ───────────────────────────────────────────────────────────────────────
-def run():
+def run(incremental: bool = False, shards: int = None):
+    shards = shards or SHARDS
     VECTOR_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Load chunks
-    chunks = [orjson.loads(line) for line in CHUNKS_PATH.open("rb") if line.strip()]
+    # Load chunks (fingerprinted in the same pass)
+    chunks, fingerprint = snapshot.read_chunks(CHUNKS_PATH)
     print(f"Loaded {len(chunks)} chunks")
+    uids   = [c.get("uid", i) for i, c in enumerate(chunks)]
+    hashes = [snapshot.text_hash(c["text"]) for c in chunks]
+    assert len(set(uids)) == len(uids), "Duplicate chunk uids — re-run chunking"
+
+    reuse = _reusable_vectors(uids, hashes) if incremental else {}
+    todo  = [i for i, uid in enumerate(uids) if uid not in reuse]
+    if reuse:
+        print(f"Reusing {len(reuse)} unchanged embeddings, embedding {len(todo)} chunks")
 
     # Load model
     print(f"Loading embedding model: {EMBED_MODEL}")
     model = SentenceTransformer(EMBED_MODEL)
+    dim   = model.get_sentence_embedding_dimension()
 
     # Embed
-    texts = [f"passage: {c['text']}" for c in chunks]
-    embeddings = model.encode(
-        texts,
-        batch_size=BATCH_SIZE,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        normalize_embeddings=True,
-    ).astype(np.float32)
+    embeddings = np.empty((len(chunks), dim), dtype=np.float32)
+    for i, uid in enumerate(uids):
+        if uid in reuse:
+            embeddings[i] = reuse[uid]
+    if todo:
+        embeddings[todo] = model.encode(
+            [f"passage: {chunks[i]['text']}" for i in todo],
+            batch_size=BATCH_SIZE,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32)
     print(f"Embeddings shape: {embeddings.shape}")
 
-    # Build FAISS index
-    dim   = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
-
-    # Save artifacts
-    faiss.write_index(index, str(VECTOR_DIR / "faiss.index"))
+    # Build FAISS index(es) into a new snapshot, then publish it atomically.
+    # Vectors are addressed by chunk uid, not row position.
+    version, out = snapshot.begin()
+    if shards > 1:
+        shard_sizes = write_shards(out, embeddings, uids, [c["source_id"] for c in chunks], shards)
+    else:
+        index = build_shard(embeddings, np.asarray(uids, dtype=np.int64))
+        faiss.write_index(index, str(out / "faiss.index"))
+        shard_sizes = [int(index.ntotal)]
 
-    id_map = [{"source_id": c["source_id"], "chunk_id": c["chunk_id"]} for c in chunks]
-    with (VECTOR_DIR / "id_map.json").open("wb") as f:
+    id_map = [
+        {"source_id": c["source_id"], "chunk_id": c["chunk_id"], "uid": uid, "text_hash": h}
+        for c, uid, h in zip(chunks, uids, hashes)
+    ]
+    with (out / "id_map.json").open("wb") as f:
         f.write(orjson.dumps(id_map))
 
-    np.save(VECTOR_DIR / "embeddings.npy", embeddings)
+    np.save(out / "embeddings.npy", embeddings)
+    snapshot.add_chunks(out, CHUNKS_PATH, fingerprint)
+    snapshot.write_source_centroids(out, embeddings, [c["source_id"] for c in chunks])
+    snapshot.write_shingles(out, *build_postings([c["text"] for c in chunks]))
+    n_sentences, sentences_embedded = (
+        write_sentence_index(out, chunks, uids, model, incremental) if SENTENCES else (0, 0)
+    )
+    final = snapshot.publish(version, out, {
+        "ntotal":             len(chunks),
+        "dim":                dim,
+        "shards":             shards,
+        "shard_sizes":        shard_sizes,
+        "sentences":          n_sentences,
+        "embed_model":        EMBED_MODEL,
+        "id_scheme":          "uid",
+        "chunks_fingerprint": fingerprint,
+    })
 
     print(f"\n{'='*50}")
     print(f"EMBEDDING & INDEXING COMPLETE")
-    print(f"  Index size : {index.ntotal}")
-    print(f"  Saved to   : {VECTOR_DIR}")
+    print(f"  Index size : {len(chunks)}")
+    if shards > 1:
+        print(f"  Shards     : {shards} ({min(shard_sizes)}–{max(shard_sizes)} vectors each)")
+    print(f"  Re-embedded: {len(todo)}")
+    if SENTENCES:
+        print(f"  Sentences  : {n_sentences} ({sentences_embedded} embedded)")
+    print(f"  Snapshot   : {version}")
+    print(f"  Saved to   : {final}")
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Embed chunks and publish a FAISS snapshot")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse vectors from the live snapshot for chunks whose text is unchanged")
+    parser.add_argument("--shards", type=int, default=None,
+                        help=f"Split the index into N shards by source_id hash (default: {SHARDS})")
+    args = parser.parse_args()
+    run(incremental=args.incremental, shards=args.shards)
@@ -0,0 +1,133 @@
+"""
+src/ingest/pagecache.py
+Per-page raw text cache for PDF extraction.
+
+Extracted page text is stored before clean_text(), keyed by the PDF's
+content hash and the extractor (backend + version), so changing the
+chunking parameters or the cleaning rules re-chunks from cache instead of
+re-parsing every PDF. Entries are gzipped JSON:
+
+    data/processed/page_cache/<pdf sha256[:24]>-<extractor>.json.gz
+
+Backends:
+    pdfplumber   layout-aware, slow (the original extractor)
+    pdfium       pypdfium2 text layer, several times faster
+    auto         pdfium per page, pdfplumber for pages pdfium returns
+                 empty or garbled (scanned/odd encodings)
+Used by chunk.py
+"""
+
+import gzip, hashlib
+from pathlib import Path
+import orjson
+import pdfplumber
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+CACHE_DIR  = Path("data/processed/page_cache")
+EXTRACTOR  = "pdfplumber"   # pdfplumber | pdfium | auto
+BACKENDS   = ("pdfplumber", "pdfium", "auto")
+
+# Bump when a backend's extraction logic changes so old entries are ignored
+EXTRACTOR_VERSION = 1
+
+AUTO_MIN_CHARS      = 20     # pdfium pages shorter than this are re-extracted
+AUTO_MAX_BAD_FRAC   = 0.05   # ... as are pages with this share of replacement/control chars
+
+stats = {"hits": 0, "misses": 0}
+
+
+# ── Keys ───────────────────────────────────────────────────────────────────────
+def pdf_hash(pdf_path: Path) -> str:
+    h = hashlib.sha256()
+    with Path(pdf_path).open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extractor_key(backend: str) -> str:
+    """Backend, EXTRACTOR_VERSION and the version of every library it may call."""
+    if backend == "pdfplumber":
+        lib = pdfplumber.__version__
+    else:
+        import pypdfium2
+        lib = str(pypdfium2.PYPDFIUM_INFO)
+        if backend == "auto":   # falls back to pdfplumber per page
+            lib += f"+pdfplumber{pdfplumber.__version__}"
+    return f"{backend}{EXTRACTOR_VERSION}_{lib}"
+
+
+def cache_path(digest: str, backend: str) -> Path:
+    return CACHE_DIR / f"{digest[:24]}-{extractor_key(backend)}.json.gz"
+
+
+# ── Backends ───────────────────────────────────────────────────────────────────
+def _plumber_pages(pdf_path: Path, only: set = None) -> dict:
+    out = {}
+    with pdfplumber.open(pdf_path) as pdf:
+        for i, page in enumerate(pdf.pages, start=1):
+            if only is None or i in only:
+                out[i] = page.extract_text() or ''
+    return out
+
+
+def _pdfium_pages(pdf_path: Path) -> dict:
+    import pypdfium2 as pdfium
+    out = {}
+    pdf = pdfium.PdfDocument(str(pdf_path))
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            # pdfium ends lines with \r\n; clean_text would turn that into blank lines
+            out[i + 1] = textpage.get_text_range().replace('\r\n', '\n')
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return out
+
+
+def _looks_garbled(text: str) -> bool:
+    stripped = text.strip()
+    if len(stripped) < AUTO_MIN_CHARS:
+        return True
+    bad = sum(1 for ch in stripped if ch == '�' or (ord(ch) < 32 and ch not in '\n\t'))
+    return bad / len(stripped) > AUTO_MAX_BAD_FRAC
+
+
+def _extract(pdf_path: Path, backend: str) -> list:
+    if backend == "pdfplumber":
+        pages = _plumber_pages(pdf_path)
+    elif backend == "pdfium":
+        pages = _pdfium_pages(pdf_path)
+    else:
+        pages = _pdfium_pages(pdf_path)
+        redo  = {i for i, t in pages.items() if _looks_garbled(t)}
+        if redo:
+            pages.update(_plumber_pages(pdf_path, only=redo))
+    return [{'page': i, 'text': pages[i]} for i in sorted(pages)]
+
+
+# ── Cache ──────────────────────────────────────────────────────────────────────
+def raw_pages(pdf_path: Path, backend: str = None) -> tuple:
+    """Raw (uncleaned) page texts for a PDF; returns (pages, cache_hit)."""
+    backend = backend or EXTRACTOR
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown extractor {backend!r} — expected one of {BACKENDS}")
+    path = cache_path(pdf_hash(pdf_path), backend)
+    if path.exists():
+        try:
+            pages = orjson.loads(gzip.decompress(path.read_bytes()))
+            stats["hits"] += 1
+            return pages, True
+        except (OSError, EOFError, orjson.JSONDecodeError):
+            pass   # truncated entry from an interrupted run — re-extract
+
+    pages = _extract(pdf_path, backend)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(gzip.compress(orjson.dumps(pages), compresslevel=6))
+    tmp.replace(path)
+    stats["misses"] += 1
+    return pages, False
@@ -0,0 +1,45 @@
+"""
+src/ingest/sentences.py
+Sentence splitting shared by ingest (the sentence index in each snapshot) and
+query time (context budgeting, extractive answers), so both sides agree on
+sentence boundaries and on the hashes used to look vectors up.
+"""
+
+import re
+import hashlib
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+MIN_SENTENCE_CHARS = 25    # drop page furniture, figure labels, stray numbers
+MAX_SENTENCE_CHARS = 600   # tables and reference runs come out as one huge "sentence"
+
+BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9(\[])')
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def sentence_spans(text: str) -> list:
+    """(start, end) of each kept sentence in normalize(text)."""
+    text, spans, start = normalize(text), [], 0
+    for m in [*BOUNDARY_RE.finditer(text), None]:
+        end = m.start() if m else len(text)
+        if end - start >= MIN_SENTENCE_CHARS:
+            spans.append((start, min(end, start + MAX_SENTENCE_CHARS)))
+        start = m.end() if m else start
+    return spans
+
+
+def split_sentences(text: str) -> list:
+    norm = normalize(text)
+    return [norm[a:b] for a, b in sentence_spans(norm)]
+
+
+def sentence_key(s: str) -> str:
+    """Case- and punctuation-insensitive form, for spotting repeats."""
+    return re.sub(r'\W+', ' ', s.lower()).strip()
+
+
+def sentence_hash(s: str) -> int:
+    """64-bit hash of a sentence's exact text (fits a uint64 column)."""
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
@@ -0,0 +1,55 @@
+"""
+src/ingest/shingles.py
+Word-shingle hashing for citation grounding (see src/rag/grounding.py).
+
+A shingle is a run of SHINGLE_K consecutive content words (stop words and
+words under 3 characters dropped), hashed to 64 bits with a rolling
+polynomial over crc32 word hashes — stable across processes, unlike hash().
+The postings index pairs every distinct shingle of a chunk with the chunk's
+row, sorted by hash, so one searchsorted per memo sentence gives its shingle
+overlap with every chunk at once.
+Used by embed_index.py and grounding.py
+"""
+
+import re
+import zlib
+import numpy as np
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+SHINGLE_K = 2
+WORD_RE   = re.compile(r'[a-z0-9]{3,}')
+STOPWORDS = frozenset("""
+    the and for are was were with that this these those from into onto than then there their
+    which while where when what who whom whose has have had been being its not but can could
+    may might must shall should will would also such more most other some any all each both
+    only very our out over under about above below between through during before after again
+    further here how why per via upon within without among however thus therefore
+""".split())
+
+_MULT = np.uint64(0x9E3779B97F4A7C15)   # odd 64-bit multiplier for the rolling hash
+
+
+def content_words(text: str) -> list:
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_K) -> np.ndarray:
+    """Sorted distinct shingle hashes of `text` (uint64)."""
+    words = content_words(text)
+    if len(words) < k:
+        return np.empty(0, dtype=np.uint64)
+    w = np.fromiter((zlib.crc32(t.encode()) for t in words), dtype=np.uint64, count=len(words))
+    h = w[: len(w) - k + 1].copy()
+    for j in range(1, k):
+        h = h * _MULT + w[j : len(w) - k + 1 + j]   # wraps mod 2**64
+    return np.unique(h)
+
+
+def build_postings(texts: list) -> tuple:
+    """(hash, row) arrays over every distinct shingle of every text, sorted by hash."""
+    per   = [shingle_hashes(t) for t in texts]
+    sizes = np.fromiter((len(p) for p in per), dtype=np.int64, count=len(per))
+    hashes = np.concatenate(per) if per else np.empty(0, dtype=np.uint64)
+    rows   = np.repeat(np.arange(len(per), dtype=np.int32), sizes)
+    order  = np.argsort(hashes, kind="stable")
+    return hashes[order], rows[order]
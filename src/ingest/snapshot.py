@@ -0,0 +1,271 @@
+"""
+src/ingest/snapshot.py
+Versioned vector-store snapshots.
+
+Each build writes a complete snapshot directory and publishes it atomically:
+
+    data/vector_store/
+        CURRENT                        # name of the live snapshot
+        snapshots/<version>/
+            faiss.index                # or shard-000.index … when sharded
+            id_map.json
+            chunks.jsonl               # the chunk store the vectors were built from
+            embeddings.npy
+            source_centroids.npy       # one mean vector per source (document routing)
+            source_ids.json            # ... and the source each row belongs to
+            source_similarity.npy      # source × source centroid cosine
+            sentence_vectors.npy       # one vector per distinct sentence of each source
+            sentences.npz              # ... its chunk uid, span in the chunk text, text hash
+            shingles.npz               # word-shingle postings per chunk row (citation checks)
+            manifest.json
+
+Files are written under snapshots/.tmp-<version>/, fsynced, then the directory
+is renamed into place and CURRENT is swapped with os.replace, so readers only
+ever see a complete snapshot. Stores built before snapshots existed (files
+directly in data/vector_store/) are served as version "legacy".
+
+Each snapshot carries its own chunks.jsonl (a hardlink to the working copy
+in data/processed/ where possible), so a snapshot serves on its own: rolling
+CURRENT back to a kept snapshot works, and a re-chunk without a re-embed
+leaves the live snapshot untouched. The working copy is only ever replaced
+with os.replace, never rewritten in place, which keeps those links intact.
+manifest.json records the chunk store's fingerprint; readers verify it while
+parsing, and snapshots built before chunks were stored fall back to the
+working copy.
+
+A sharded snapshot splits the vectors by source_id hash into N self-contained
+indexes (manifest "shards": N). Each shard file is an ordinary uid-keyed FAISS
+index, so a shard can be searched by any process — or host — that has the file.
+Used by embed_index.py, stream.py and retrieve.py
+"""
+
+import os, json, time, shutil, hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import orjson
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+VECTOR_DIR      = Path("data/vector_store")
+SNAPSHOT_DIR    = VECTOR_DIR / "snapshots"
+CURRENT_PATH    = VECTOR_DIR / "CURRENT"
+LEGACY          = "legacy"
+KEEP_SNAPSHOTS  = 3
+STALE_STAGING_S = 24 * 3600   # staging dirs older than this are from crashed builds
+
+# Serve vectors straight from the page cache instead of a private copy, so
+# every process on the host shares one physical copy of each snapshot.
+# Snapshot files are never modified after publish, and pruning only unlinks
+# them, so a mapping stays valid for as long as a reader holds it.
+MMAP_VECTORS = True
+
+
+# ── Readers ────────────────────────────────────────────────────────────────────
+def current_version() -> str:
+    try:
+        return CURRENT_PATH.read_text().strip() or LEGACY
+    except FileNotFoundError:
+        return LEGACY
+
+
+def snapshot_dir(version: str) -> Path:
+    return VECTOR_DIR if version == LEGACY else SNAPSHOT_DIR / version
+
+
+def read_manifest(version: str) -> dict:
+    path = snapshot_dir(version) / "manifest.json"
+    return json.loads(path.read_text()) if path.exists() else {"version": version}
+
+
+def index_paths(version: str) -> list:
+    """Index files of a snapshot: one per shard, or the single faiss.index."""
+    root   = snapshot_dir(version)
+    shards = read_manifest(version).get("shards", 1)
+    return [root / shard_file(i) for i in range(shards)] if shards > 1 else [root / "faiss.index"]
+
+
+def open_index(path: Path, mmap: bool = None):
+    """Read a FAISS index for searching; flat codes are memory-mapped when supported."""
+    import faiss
+    mmap  = MMAP_VECTORS if mmap is None else mmap
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", None)   # zero-copy flat codes (faiss >= 1.10)
+    if mmap and flags is not None:
+        return faiss.read_index(str(path), flags | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(str(path))
+
+
+def open_embeddings(path: Path, mmap: bool = None) -> np.ndarray:
+    mmap = MMAP_VECTORS if mmap is None else mmap
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+# ── Fingerprints ───────────────────────────────────────────────────────────────
+def read_chunks(path: Path) -> tuple:
+    """Parse a chunk store and fingerprint its bytes in the same pass."""
+    h, chunks = hashlib.sha256(), []
+    with path.open("rb") as f:
+        for line in f:
+            h.update(line)
+            if line.strip():
+                chunks.append(orjson.loads(line))
+    return chunks, h.hexdigest()
+
+
+def fingerprint_file(path: Path) -> str:
+    """Same digest as read_chunks, without parsing (constant memory)."""
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+# ── Chunk store ────────────────────────────────────────────────────────────────
+CHUNKS_FILE = "chunks.jsonl"
+
+
+def chunks_path(version: str, working: Path) -> Path:
+    """A snapshot's own chunk store; older snapshots fall back to the working copy."""
+    own = snapshot_dir(version) / CHUNKS_FILE
+    return own if own.exists() else working
+
+
+def add_chunks(out: Path, working: Path, fingerprint: str):
+    """Put the chunk store into a staging snapshot, checking it is the one that was indexed."""
+    dest = out / CHUNKS_FILE
+    try:
+        os.link(working, dest)
+    except OSError:   # other filesystem, or links unsupported
+        shutil.copyfile(working, dest)
+    if fingerprint_file(dest) != fingerprint:
+        raise RuntimeError(f"{working} changed while the snapshot was being built — re-run the build")
+
+
+# ── Shards ─────────────────────────────────────────────────────────────────────
+def shard_of(source_id: str, shards: int) -> int:
+    """Shard for a source — stable across processes and hosts (unlike hash())."""
+    digest = hashlib.blake2b(source_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def shard_file(i: int) -> str:
+    return f"shard-{i:03d}.index"
+
+
+# ── Source centroids ───────────────────────────────────────────────────────────
+def source_centroids(embeddings: np.ndarray, source_ids: list) -> tuple:
+    """(sorted unique source ids, unit-length mean chunk vector per source)."""
+    ids, codes = np.unique(np.asarray(source_ids), return_inverse=True)
+    order  = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    sums   = np.add.reduceat(np.asarray(embeddings, dtype=np.float32)[order], starts, axis=0)
+    sums  /= np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12
+    return ids.tolist(), sums.astype(np.float32)
+
+
+def write_source_centroids(out: Path, embeddings: np.ndarray, source_ids: list):
+    ids, centroids = source_centroids(embeddings, source_ids)
+    np.save(out / "source_centroids.npy", centroids)
+    np.save(out / "source_similarity.npy", centroids @ centroids.T)
+    (out / "source_ids.json").write_text(json.dumps(ids))
+
+
+def read_source_centroids(root: Path) -> tuple:
+    """(source ids, centroids, similarity) stored with a snapshot; Nones for older builds."""
+    if not (root / "source_similarity.npy").exists():
+        return None, None, None
+    return (json.loads((root / "source_ids.json").read_text()),
+            np.load(root / "source_centroids.npy"),
+            np.load(root / "source_similarity.npy"))
+
+
+# ── Sentence index ─────────────────────────────────────────────────────────────
+def write_sentence_index(out: Path, vectors: np.ndarray, uid: np.ndarray, start: np.ndarray,
+                         end: np.ndarray, hashes: np.ndarray):
+    np.save(out / "sentence_vectors.npy", vectors)
+    np.savez(out / "sentences.npz", uid=uid, start=start, end=end, hash=hashes)
+
+
+def read_sentence_index(root: Path, mmap: bool = None) -> dict:
+    """Sentence vectors and their uid / start / end / hash columns, or None for older builds."""
+    if not (root / "sentences.npz").exists():
+        return None
+    with np.load(root / "sentences.npz") as cols:
+        index = {k: cols[k] for k in ("uid", "start", "end", "hash")}
+    index["vectors"] = open_embeddings(root / "sentence_vectors.npy", mmap)
+    return index
+
+
+# ── Shingle postings ───────────────────────────────────────────────────────────
+def write_shingles(out: Path, hashes: np.ndarray, rows: np.ndarray):
+    np.savez(out / "shingles.npz", hash=hashes, row=rows)
+
+
+def read_shingles(root: Path) -> tuple:
+    """(hash, row) postings stored with a snapshot, or (None, None) for older builds."""
+    if not (root / "shingles.npz").exists():
+        return None, None
+    with np.load(root / "shingles.npz") as cols:
+        return cols["hash"], cols["row"]
+
+
+# ── Writers ────────────────────────────────────────────────────────────────────
+def begin() -> tuple:
+    """Create a staging directory for a new snapshot; returns (version, path)."""
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    staging = SNAPSHOT_DIR / f".tmp-{version}"
+    staging.mkdir(parents=True)
+    return version, staging
+
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish(version: str, staging: Path, manifest: dict) -> Path:
+    """Seal the staging directory, move it into place and point CURRENT at it."""
+    files = {p.name: p.stat().st_size for p in staging.iterdir() if p.is_file()}
+    manifest = {
+        "version": version,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "files":   files,
+        **manifest,
+    }
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    for p in staging.iterdir():
+        _fsync(p)
+
+    final = SNAPSHOT_DIR / version
+    os.rename(staging, final)
+    _fsync(SNAPSHOT_DIR)
+
+    tmp = CURRENT_PATH.with_suffix(".tmp")
+    tmp.write_text(version)
+    _fsync(tmp)
+    os.replace(tmp, CURRENT_PATH)
+    _fsync(VECTOR_DIR)
+
+    prune()
+    return final
+
+
+def prune(keep: int = KEEP_SNAPSHOTS):
+    """Remove old snapshots and abandoned staging dirs, never the live one."""
+    if not SNAPSHOT_DIR.exists():
+        return
+    live = current_version()
+    for p in SNAPSHOT_DIR.glob(".tmp-*"):
+        if time.time() - p.stat().st_mtime > STALE_STAGING_S:
+            shutil.rmtree(p, ignore_errors=True)
+    versions = sorted(p.name for p in SNAPSHOT_DIR.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for v in versions[:-keep]:
+        if v != live:
+            shutil.rmtree(SNAPSHOT_DIR / v, ignore_errors=True)
@@ -0,0 +1,279 @@
+"""
+src/ingest/stream.py
+Streaming ingest: PDF -> clean -> chunk -> embed -> FAISS in one pass.
+
+Stages are generators joined by bounded queues, so only a few sources and
+embedding batches are in flight at any time regardless of corpus size (the
+flat index itself still holds every vector). Progress is checkpointed every
+CHECKPOINT_EVERY sources and a crashed run resumes from the last checkpoint.
+
+Usage (from repo root):
+    python src/ingest/stream.py            # resume if a checkpoint exists
+    python src/ingest/stream.py --fresh    # discard any checkpoint
+Called by run_pipeline.py --stream
+"""
+
+import os, sys, csv, json, queue, threading, argparse
+from pathlib import Path
+import numpy as np
+import faiss
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.ingest.chunk import MANIFEST_PATH, CHUNKS_PATH, build_chunks_for_source, load_uid_map, assign_uids
+from src.ingest.embed_index import VECTOR_DIR, EMBED_MODEL, BATCH_SIZE, SENTENCES, write_sentence_index
+from src.ingest.shingles import build_postings
+from src.ingest import snapshot
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+QUEUE_SIZE       = 64     # chunk records buffered between extract and embed
+BATCH_QUEUE_SIZE = 4      # embedded batches buffered between embed and index
+CHECKPOINT_EVERY = 100    # sources between checkpoints
+
+PARTIAL_CHUNKS   = CHUNKS_PATH.with_suffix(".jsonl.partial")
+CHECKPOINT_INDEX = VECTOR_DIR / "ingest_checkpoint.index"
+CHECKPOINT_STATE = VECTOR_DIR / "ingest_checkpoint.json"
+
+
+# ── Bounded stage plumbing ─────────────────────────────────────────────────────
+_END = object()
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+def _bounded(items, maxsize: int):
+    """Run the `items` generator in a background thread behind a bounded queue."""
+    q = queue.Queue(maxsize=maxsize)
+
+    def pump():
+        try:
+            for item in items:
+                q.put(item)
+        except BaseException as e:
+            q.put(_Failed(e))
+            return
+        q.put(_END)
+
+    threading.Thread(target=pump, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _END:
+            return
+        if isinstance(item, _Failed):
+            raise item.error
+        yield item
+
+
+# ── Stages ─────────────────────────────────────────────────────────────────────
+def read_manifest(path: Path = MANIFEST_PATH):
+    with path.open(newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def chunk_stage(rows, done: set, ids: dict):
+    """Yield chunk records, then ("done", source_id) once a source is fully chunked.
+
+    A source that yields no chunks (unreadable PDF, extraction failure) ends
+    with ("failed", source_id) instead, so it is not checkpointed as done and
+    a resumed run tries it again.
+    """
+    for row in rows:
+        source_id = row["source_id"]
+        if source_id in done:
+            continue
+        chunks = build_chunks_for_source(row)
+        assign_uids(chunks, ids)
+        print(f"  {'✓' if chunks else '✗'} {source_id}: {len(chunks)} chunks")
+        yield from chunks
+        yield ("done" if chunks else "failed", source_id)
+
+
+def embed_stage(items, model, batch_size: int = BATCH_SIZE * 4):
+    """Yield (records, embeddings, finished) batches.
+
+    `finished` lists (status, source_id, n) for sources whose last chunk is
+    record n - 1 of this batch (n == 0: the source ended before the batch
+    began), so the writer knows where each completed source ends.
+    """
+    records, finished = [], []
+
+    def flush():
+        emb = model.encode(
+            [f"passage: {r['text']}" for r in records],
+            batch_size=BATCH_SIZE,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32) if records else None
+        return records, emb, finished
+
+    for item in items:
+        if isinstance(item, tuple):
+            finished.append((*item, len(records)))
+            continue
+        records.append(item)
+        if len(records) >= batch_size:
+            yield flush()
+            records, finished = [], []
+    if records or finished:
+        yield flush()
+
+
+# ── Checkpointing ──────────────────────────────────────────────────────────────
+def _save_checkpoint(index, chunks_file, done: set, boundary: tuple):
+    """Persist progress up to `boundary` = (chunks_bytes, ntotal) of the last completed source.
+
+    Chunks and vectors written past the boundary belong to a source that is
+    still in flight; they are trimmed on resume and that source is redone.
+    """
+    chunks_file.flush()
+    os.fsync(chunks_file.fileno())
+    faiss.write_index(index, str(CHECKPOINT_INDEX) + ".tmp")
+    os.replace(str(CHECKPOINT_INDEX) + ".tmp", CHECKPOINT_INDEX)
+    state = {"done": sorted(done), "chunks_bytes": boundary[0], "ntotal": boundary[1]}
+    CHECKPOINT_STATE.with_suffix(".tmp").write_text(json.dumps(state))
+    os.replace(CHECKPOINT_STATE.with_suffix(".tmp"), CHECKPOINT_STATE)
+
+
+def _load_checkpoint():
+    if not (CHECKPOINT_STATE.exists() and CHECKPOINT_INDEX.exists() and PARTIAL_CHUNKS.exists()):
+        return None
+    state = json.loads(CHECKPOINT_STATE.read_text())
+    index = faiss.read_index(str(CHECKPOINT_INDEX))
+    if index.ntotal < state["ntotal"] or PARTIAL_CHUNKS.stat().st_size < state["chunks_bytes"]:
+        print("  Checkpoint does not match its state file — starting fresh")
+        return None
+    # Drop chunks and vectors of the source that was in flight at the checkpoint
+    if index.ntotal > state["ntotal"]:
+        stale = faiss.vector_to_array(index.id_map)[state["ntotal"]:]
+        index.remove_ids(faiss.IDSelectorBatch(stale))
+    with PARTIAL_CHUNKS.open("r+b") as f:
+        f.truncate(state["chunks_bytes"])
+    return index, set(state["done"])
+
+
+def _clear_checkpoint():
+    for p in (CHECKPOINT_INDEX, CHECKPOINT_STATE):
+        p.unlink(missing_ok=True)
+
+
+# ── Finalize ───────────────────────────────────────────────────────────────────
+def _write_id_map(chunks_path: Path, out_path: Path) -> list:
+    """Stream id_map.json from the chunk store without holding it in memory.
+
+    Returns the source_id column (row order), used for the source centroids.
+    """
+    source_ids = []
+    with chunks_path.open(encoding="utf-8") as src, out_path.open("w", encoding="utf-8") as out:
+        out.write("[")
+        for i, line in enumerate(l for l in src if l.strip()):
+            c = json.loads(line)
+            source_ids.append(c["source_id"])
+            out.write(("," if i else "") + json.dumps({
+                "source_id": c["source_id"],
+                "chunk_id":  c["chunk_id"],
+                "uid":       c["uid"],
+                "text_hash": snapshot.text_hash(c["text"]),
+            }))
+        out.write("]")
+    return source_ids
+
+
+def _finalize(index, model) -> str:
+    """Publish the streamed index as a snapshot with the same artifacts embed_index writes.
+
+    The sentence index and shingle postings need every chunk text at once,
+    so the finished chunk store is read back here (vectors of sentences the
+    live snapshot already has are reused).
+    """
+    os.replace(PARTIAL_CHUNKS, CHUNKS_PATH)
+    version, out = snapshot.begin()
+    faiss.write_index(index, str(out / "faiss.index"))
+    source_ids = _write_id_map(CHUNKS_PATH, out / "id_map.json")
+    # View the flat index's storage directly instead of copying it out
+    flat = faiss.downcast_index(index.index)
+    vecs = faiss.rev_swig_ptr(flat.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+    np.save(out / "embeddings.npy", vecs)
+    snapshot.write_source_centroids(out, vecs, source_ids)
+    chunks, fingerprint = snapshot.read_chunks(CHUNKS_PATH)
+    snapshot.add_chunks(out, CHUNKS_PATH, fingerprint)
+    snapshot.write_shingles(out, *build_postings([c["text"] for c in chunks]))
+    n_sentences, _ = (
+        write_sentence_index(out, chunks, [c["uid"] for c in chunks], model, incremental=True)
+        if SENTENCES else (0, 0)
+    )
+    snapshot.publish(version, out, {
+        "ntotal":             index.ntotal,
+        "dim":                index.d,
+        "sentences":          n_sentences,
+        "embed_model":        EMBED_MODEL,
+        "id_scheme":          "uid",
+        "chunks_fingerprint": fingerprint,
+    })
+    _clear_checkpoint()
+    return version
+
+
+# ── Main ───────────────────────────────────────────────────────────────────────
+def run(resume: bool = True):
+    CHUNKS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+    assert MANIFEST_PATH.exists(), f"Manifest not found at {MANIFEST_PATH.resolve()}"
+
+    print(f"Loading embedding model: {EMBED_MODEL}")
+    model = SentenceTransformer(EMBED_MODEL)
+
+    restored = _load_checkpoint() if resume else None
+    if restored:
+        index, done = restored
+        print(f"Resuming from checkpoint: {len(done)} sources, {index.ntotal} chunks\n")
+        mode = "ab"
+    else:
+        _clear_checkpoint()
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(model.get_sentence_embedding_dimension()))
+        done  = set()
+        mode  = "wb"
+    # uids already issued: the previous chunk store plus anything resumed
+    ids = load_uid_map(CHUNKS_PATH, PARTIAL_CHUNKS) if restored else load_uid_map(CHUNKS_PATH)
+
+    since_checkpoint, boundary, failed = 0, None, []
+    with PARTIAL_CHUNKS.open(mode) as f:
+        chunks  = _bounded(chunk_stage(read_manifest(), set(done), ids), QUEUE_SIZE)
+        batches = _bounded(embed_stage(chunks, model), BATCH_QUEUE_SIZE)
+        for records, emb, finished in batches:
+            start_bytes, start_n, ends = f.tell(), index.ntotal, []
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n")
+                ends.append(f.tell())
+            if emb is not None:
+                index.add_with_ids(emb, np.array([r["uid"] for r in records], dtype=np.int64))
+            for status, source_id, n in finished:
+                if status == "done":
+                    done.add(source_id)
+                else:
+                    failed.append(source_id)
+                boundary = (ends[n - 1] if n else start_bytes, start_n + n)
+            since_checkpoint += len(finished)
+            if since_checkpoint >= CHECKPOINT_EVERY:
+                _save_checkpoint(index, f, done, boundary)
+                since_checkpoint = 0
+
+    version = _finalize(index, model)
+
+    print(f"\n{'='*50}")
+    print(f"STREAMING INGEST COMPLETE")
+    print(f"  Sources processed : {len(done)}")
+    print(f"  Index size        : {index.ntotal}")
+    print(f"  Snapshot          : {version}")
+    print(f"  Output            : {CHUNKS_PATH}, {VECTOR_DIR}")
+    if failed:
+        print(f"  Failed (no chunks): {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming PDF -> FAISS ingest")
+    parser.add_argument("--fresh", action="store_true", help="Ignore any checkpoint and start over")
+    args = parser.parse_args()
+    run(resume=not args.fresh)
@@ -0,0 +1,13 @@
+"""
+src/ingest/terms.py
+Term extraction shared by ingest (stored per chunk in chunks.jsonl) and
+query-time lexical scoring in retrieve.py, so both sides tokenize identically.
+"""
+
+import re
+
+TERM_RE = re.compile(r'\b\w{4,}\b')
+
+
+def extract_terms(text: str) -> list:
+    return sorted(set(TERM_RE.findall(text.lower())))
@@ -0,0 +1,120 @@
+"""
+src/rag/context.py
+Context budgeter — compress retrieved chunks to their most query-relevant
+sentences so the evidence block fits a token budget before prompting the LLM.
+Called by rag.py
+"""
+
+import numpy as np
+
+from src.ingest.sentences import normalize, split_sentences, sentence_key
+from src.rag.retrieve import (
+    embed_query,
+    sentence_vectors,
+    chunk_position,
+    strip_overlap,
+)
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+CHARS_PER_TOKEN     = 4    # rough estimate for English prose with Mistral's tokenizer
+LABEL_TOKENS        = 20   # "[source_id:chunk_id] (score: 0.000)" header per chunk
+MIN_SENTENCE_TOKENS = 15   # floor when best sentences are clipped to share a tight budget
+
+
+# ── Tokens ─────────────────────────────────────────────────────────────────────
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def clip(text: str, tokens: int) -> str:
+    """`text` cut at a word boundary to about `tokens` tokens."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit] + " …"
+
+
+# ── Budgeter ───────────────────────────────────────────────────────────────────
+def build_context(question: str, retrieved: list, budget_tokens: int) -> list:
+    """Return `retrieved` with each chunk's text reduced to its best sentences.
+
+    Every chunk first gets its single most relevant sentence (so its
+    [source_id:chunk_id] label survives for citation checks), then the
+    remaining budget is filled with the highest-scoring sentences overall.
+    If the best sentences alone overflow the budget, each is clipped to an
+    equal share of it (at least MIN_SENTENCE_TOKENS), so no chunk is dropped.
+    Text repeated from an adjacent retrieved chunk of the same source, and
+    sentences seen earlier in the block, are dropped before scoring; a chunk
+    left with nothing after that keeps its own sentences anyway.
+    Selected sentences keep their original order within a chunk.
+    """
+    if not retrieved:
+        return retrieved
+
+    # A merged span covers chunk_ids[0] … chunk_ids[-1]
+    by_pos = {}
+    for r in retrieved:
+        pos = chunk_position(r.get("chunk_ids", [r["chunk_id"]])[-1])
+        if pos is not None:
+            by_pos[(r["source_id"], pos)] = r["text"]
+
+    sents, owner, seen = [], [], set()
+    for i, r in enumerate(retrieved):
+        text = r["text"]
+        pos  = chunk_position(r.get("chunk_ids", [r["chunk_id"]])[0])
+        prev = by_pos.get((r["source_id"], pos - 1)) if pos is not None else None
+        if prev is not None:
+            text = text[strip_overlap(prev, text):]
+        fresh = [s for s in split_sentences(text) if sentence_key(s) not in seen]
+        if not fresh:   # everything repeats earlier text; keep the chunk citable
+            fresh = split_sentences(r["text"]) or ([normalize(r["text"])] if r["text"].strip() else [])
+        for s in fresh:
+            seen.add(sentence_key(s))
+            sents.append(s)
+            owner.append(i)
+
+    if not sents:
+        return retrieved
+
+    owner = np.asarray(owner)
+    cost  = np.fromiter((estimate_tokens(s) for s in sents), dtype=np.int64, count=len(sents))
+    sims  = sentence_vectors(sents) @ embed_query(question)[0]
+
+    chosen   = np.zeros(len(sents), dtype=bool)
+    included = np.zeros(len(retrieved), dtype=bool)
+    used     = 0
+
+    # Round 1 — best sentence of each chunk, clipped to a fair share if they overflow
+    order  = np.lexsort((-sims, owner))
+    firsts = order[np.r_[True, owner[order][1:] != owner[order][:-1]]]
+    if int(cost[firsts].sum()) + LABEL_TOKENS * len(firsts) > budget_tokens:
+        share = max(MIN_SENTENCE_TOKENS, (budget_tokens - LABEL_TOKENS * len(firsts)) // len(firsts))
+        print(f"  Context budget {budget_tokens} is tight for {len(firsts)} chunks — "
+              f"clipping each best sentence to ~{share} tokens")
+        for j in firsts:
+            sents[j] = clip(sents[j], share)
+            cost[j]  = estimate_tokens(sents[j])
+    for j in firsts:
+        chosen[j] = included[owner[j]] = True
+        used += cost[j] + LABEL_TOKENS
+
+    # Round 2 — fill the rest of the budget by relevance
+    for j in np.argsort(-sims, kind="stable"):
+        if chosen[j]:
+            continue
+        c = cost[j] + (0 if included[owner[j]] else LABEL_TOKENS)
+        if used + c <= budget_tokens:
+            chosen[j] = included[owner[j]] = True
+            used += c
+
+    out = []
+    for i, r in enumerate(retrieved):
+        if not included[i]:
+            continue
+        picked = np.flatnonzero(chosen & (owner == i))
+        parts  = [sents[picked[0]]]
+        for a, b in zip(picked[:-1], picked[1:]):
+            parts.append((" " if b == a + 1 else " … ") + sents[b])
+        out.append(dict(r, text="".join(parts)))
+    return out
@@ -0,0 +1,194 @@
+"""
+src/rag/export.py
+Renderers for the research artifacts (memo, evidence table, bibliography)
+and an offline batch exporter over the query log.
+
+The Export tab in app.py uses the same renderers for the last result; the CLI
+renders any set of logged results in parallel worker processes, so exporting
+an eval run of hundreds of memos doesn't tie up the UI.
+
+Usage (from repo root):
+    python src/rag/export.py                                 # every logged result, md + csv
+    python src/rag/export.py --last 50 --formats md,csv,html,pdf
+    python src/rag/export.py --contains methane --answered-only --out exports/methane
+"""
+
+import os, io, re, csv, sys, html, string, argparse
+from functools import lru_cache
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.rag import logstore
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+LOG_PATH   = Path("logs/query_log.jsonl")
+EXPORT_DIR = Path("exports")
+FORMATS    = ("md", "csv", "html", "pdf")
+
+EVIDENCE_FIELDS = ["claim", "snippet", "citation", "confidence_score", "confidence_label", "notes"]
+
+MEMO_MD = string.Template("""# Mars Life Research Portal — Synthesis Memo
+
+**Query:** $query
+**Generated:** $generated
+**Confidence:** $confidence
+**Sources cited:** $n_sources
+
+---
+
+$memo
+
+---
+*Generated by Mars Life Research Portal · Phase 3*
+*Corpus: 20 peer-reviewed papers on Mars habitability and biosignatures*
+""")
+
+MEMO_HTML = string.Template("""<!DOCTYPE html><html><head><meta charset="utf-8">
+<style>body{font-family:Georgia,serif;max-width:800px;margin:40px auto;color:#222;line-height:1.7}
+h1{color:#c04010;font-size:1.6rem}.meta{color:#888;font-size:0.85rem;margin-bottom:1.5rem;padding:0.5rem;background:#f9f9f9}
+p{margin:0.8rem 0}@media print{body{margin:1in}}</style></head><body>
+<h1>Mars Life Research Portal — Synthesis Memo</h1>
+<div class="meta"><strong>Query:</strong> $query<br>
+<strong>Generated:</strong> $generated<br>
+<strong>Confidence:</strong> $confidence</div>
+$paragraphs
+</body></html>""")
+
+
+# ── Renderers ──────────────────────────────────────────────────────────────────
+def memo_markdown(r: dict) -> str:
+    return MEMO_MD.substitute(
+        query=r["query"],
+        generated=r["timestamp"][:16],
+        confidence=f"{r['confidence']['overall_confidence']:.2f}",
+        n_sources=len(set(s for s, _ in r["citations"])),
+        memo=r["memo"],
+    )
+
+
+def memo_html(r: dict) -> str:
+    return MEMO_HTML.substitute(
+        query=html.escape(r["query"]),
+        generated=r["timestamp"][:16],
+        confidence=f"{r['confidence']['overall_confidence']:.2f}",
+        paragraphs="".join(f"<p>{html.escape(para)}</p>" for para in r["memo"].split("\n\n")),
+    )
+
+
+def evidence_csv(r: dict) -> str:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EVIDENCE_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(r.get("evidence_table", []))
+    return buf.getvalue()
+
+
+def bibliography_markdown(r: dict) -> str:
+    parts = [f"# Annotated Bibliography\n\n**Query:** {r['query']}\n**Generated:** {r['timestamp'][:16]}\n\n---\n\n"]
+    for entry in r.get("annot_bib", []):
+        parts.append(
+            f"## {entry['source_id']}\n\n"
+            f"**Claim:** {entry['claim']}\n\n"
+            f"**Method:** {entry['method']}\n\n"
+            f"**Limitations:** {entry['limitations']}\n\n"
+            f"**Why It Matters:** {entry['why_it_matters']}\n\n---\n\n"
+        )
+    return "".join(parts)
+
+
+@lru_cache(maxsize=1)
+def _pdf_config():
+    """Locate wkhtmltopdf once per process (pdfkit shells out to `which` otherwise)."""
+    import pdfkit
+    return pdfkit.configuration()
+
+
+def memo_pdf(page_html: str, out_path=False):
+    """Render memo HTML to PDF bytes (or to `out_path`); needs wkhtmltopdf."""
+    import pdfkit
+    return pdfkit.from_string(page_html, out_path, configuration=_pdf_config(), options={"quiet": ""})
+
+
+# ── Batch export ───────────────────────────────────────────────────────────────
+def _slug(text: str, n: int = 40) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip("-")[:n] or "query"
+
+
+def export_result(r: dict, out_dir: Path, formats: tuple) -> tuple:
+    """Write one result's artifacts into its own folder; returns (folder, errors)."""
+    folder = out_dir / f"{re.sub(r'[^0-9T]', '', r['timestamp'])}_{_slug(r['query'])}"
+    folder.mkdir(parents=True, exist_ok=True)
+    errors = []
+    if "md" in formats:
+        (folder / "memo.md").write_text(memo_markdown(r), encoding="utf-8")
+        if r.get("annot_bib"):
+            (folder / "annotated_bibliography.md").write_text(bibliography_markdown(r), encoding="utf-8")
+    if "csv" in formats and r.get("evidence_table"):
+        with (folder / "evidence_table.csv").open("w", encoding="utf-8", newline="") as f:
+            f.write(evidence_csv(r))
+    if "html" in formats or "pdf" in formats:
+        page = memo_html(r)
+        if "html" in formats:
+            (folder / "memo.html").write_text(page, encoding="utf-8")
+        if "pdf" in formats:
+            try:
+                memo_pdf(page, str(folder / "memo.pdf"))
+            except (ImportError, OSError) as e:
+                errors.append(f"pdf: {e}")
+    return str(folder), errors
+
+
+def _select(log_path: Path, last: int = None, contains: str = None, answered_only: bool = False):
+    records = logstore.tail(log_path, last) if last else logstore.iter_records(log_path)
+    for r in records:
+        if "memo" not in r or "confidence" not in r:
+            continue
+        if answered_only and not r["confidence"].get("can_answer"):
+            continue
+        if contains and contains.lower() not in r["query"].lower():
+            continue
+        yield r
+
+
+def run(log_path: Path = LOG_PATH, out_dir: Path = EXPORT_DIR, formats: tuple = ("md", "csv"),
+        workers: int = None, last: int = None, contains: str = None, answered_only: bool = False):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    done, failed = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(export_result, r, out_dir, formats)
+            for r in _select(log_path, last, contains, answered_only)
+        ]
+        for fut in futures:
+            folder, errors = fut.result()
+            done += 1
+            if errors:
+                failed += 1
+                print(f"  ✗ {folder}: {'; '.join(errors)}")
+
+    print(f"\n{'='*50}")
+    print(f"EXPORT COMPLETE")
+    print(f"  Results exported : {done}")
+    print(f"  With errors      : {failed}")
+    print(f"  Formats          : {', '.join(formats)}")
+    print(f"  Output           : {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-export logged research results")
+    parser.add_argument("--log", type=Path, default=LOG_PATH, help="Query log to export from")
+    parser.add_argument("--out", type=Path, default=EXPORT_DIR, help="Output directory")
+    parser.add_argument("--formats", default="md,csv", help=f"Comma-separated subset of {','.join(FORMATS)}")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--last", type=int, default=None, help="Only the most recent N results")
+    parser.add_argument("--contains", default=None, help="Only queries containing this text")
+    parser.add_argument("--answered-only", action="store_true", help="Skip refused queries")
+    args = parser.parse_args()
+
+    formats = tuple(f.strip() for f in args.formats.split(",") if f.strip())
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+    run(args.log, args.out, formats, args.workers, args.last, args.contains, args.answered_only)
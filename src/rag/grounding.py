@@ -0,0 +1,232 @@
+"""
+src/rag/grounding.py
+Citation grounding — checks that each memo sentence is supported by the chunk
+it cites, not just that the cited source ID exists.
+
+A cited sentence is supported when at least SUPPORT_THRESHOLD of its word
+shingles (src/ingest/shingles.py) occur in a cited chunk; a bare [source_id]
+citation is checked against that source's best chunk, and a chunk cited for
+a merged span counts every chunk of the span. The shingle postings give a
+sentence's overlap with every chunk in one pass, so unsupported sentences
+also report the best-matching chunk in the corpus — telling a wrong chunk ID
+("misattributed") apart from a claim the corpus doesn't make.
+
+This is lexical overlap, not entailment: a faithful paraphrase can share
+few shingles with its chunk and score as unsupported, and the threshold has
+not been calibrated against hand-labelled citations. Read the rate as a
+floor and a pointer to sentences worth checking by hand.
+
+ask() verifies every memo. The CLI re-verifies the query log against the
+current chunk store (no embedding model or LLM needed):
+    python src/rag/grounding.py                    # every answered query
+    python src/rag/grounding.py --last 50 --details
+"""
+
+import re
+import sys
+import argparse
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.ingest import snapshot
+from src.ingest.shingles import shingle_hashes, build_postings
+from src.rag import logstore
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+CHUNKS_PATH = Path("data/processed/chunks.jsonl")
+LOG_PATH    = Path("logs/query_log.jsonl")
+
+SUPPORT_THRESHOLD = 0.3   # share of a sentence's shingles found in the cited chunk
+MIN_SHINGLES      = 3     # shorter sentences (headings, fragments) aren't scored
+
+BRACKET_RE = re.compile(r'\[([^\[\]]+)\]')
+CITE_RE    = re.compile(r'^\s*([A-Za-z][A-Za-z0-9_]*)(?:\s*:\s*(\S+?))?\s*$')   # one citation in a bracket
+SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+END_RE   = re.compile(r'(?im)^\s*(?:reference list|references\b|---)')   # memo body ends here
+
+
+# ── Index ──────────────────────────────────────────────────────────────────────
+def build_index(chunks: list, hashes: np.ndarray = None, rows: np.ndarray = None) -> dict:
+    """Grounding index over `chunks`; postings are built here unless given."""
+    if hashes is None:
+        hashes, rows = build_postings([c["text"] for c in chunks])
+    by_source = {}
+    for i, c in enumerate(chunks):
+        by_source.setdefault(c["source_id"], []).append(i)
+    return {
+        "hash":      hashes,
+        "row":       rows,
+        "n":         len(chunks),
+        "ids":       [(c["source_id"], c["chunk_id"]) for c in chunks],
+        "row_of":    {c["chunk_id"]: i for i, c in enumerate(chunks)},
+        "by_source": {s: np.asarray(r) for s, r in by_source.items()},
+    }
+
+
+def store_index(store: dict) -> dict:
+    """Index for a live retrieve.py store, built once per snapshot."""
+    if store.get("grounding") is None:
+        hashes, rows = snapshot.read_shingles(store["root"])
+        if rows is not None and len(rows) and rows.max() >= len(store["chunks"]):
+            hashes = rows = None
+        store["grounding"] = build_index(store["chunks"], hashes, rows)
+    return store["grounding"]
+
+
+def load_index(chunks_path: Path = None) -> dict:
+    """Index for the live snapshot's chunk store (or `chunks_path`); reuses its postings if they match."""
+    version = snapshot.current_version()
+    chunks, fingerprint = snapshot.read_chunks(chunks_path or snapshot.chunks_path(version, CHUNKS_PATH))
+    hashes = rows = None
+    if snapshot.read_manifest(version).get("chunks_fingerprint") == fingerprint:
+        hashes, rows = snapshot.read_shingles(snapshot.snapshot_dir(version))
+    return build_index(chunks, hashes, rows)
+
+
+def overlap(index: dict, shingles: np.ndarray) -> np.ndarray:
+    """Shingles of the sentence found in each chunk (length index["n"])."""
+    lo   = np.searchsorted(index["hash"], shingles, side="left")
+    hi   = np.searchsorted(index["hash"], shingles, side="right")
+    lens = hi - lo
+    # Concatenate the postings ranges [lo, hi) without a Python loop
+    pos  = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens) + np.repeat(lo, lens)
+    return np.bincount(index["row"][pos], minlength=index["n"])
+
+
+# ── Memo parsing ───────────────────────────────────────────────────────────────
+def memo_sentences(memo: str) -> list:
+    """(sentence text without citations, [(source_id, chunk_id or None)]) for the memo body.
+
+    A citation written after the full stop ("... on Mars. [src:chunk]") is
+    attached to the sentence before it.
+    """
+    end = END_RE.search(memo)
+    out = []
+    for line in memo[:end.start() if end else len(memo)].splitlines():
+        if line.lstrip().startswith("#"):
+            continue   # section heading
+        for piece in SPLIT_RE.split(line.strip()):
+            lead = re.match(r'^(\s*\[[^\]]*\]\s*[.,;]?)+', piece)
+            if lead and out:
+                out[-1][1].extend(_citations(lead.group(0)))
+                piece = piece[lead.end():]
+            text = BRACKET_RE.sub(lambda m: "" if _bracket(m.group(1)) else m.group(0), piece).strip()
+            if text:
+                out.append((text, _citations(piece)))
+    return out
+
+
+def _bracket(body: str) -> list:
+    """Citations in one bracket body, which may hold several ("[a:1; b:2]"); [] if it isn't a citation."""
+    parts = [CITE_RE.match(p) for p in re.split(r'[;,]', body)]
+    return [(m.group(1), m.group(2)) for m in parts] if all(parts) else []
+
+
+def _citations(text: str) -> list:
+    return [c for body in BRACKET_RE.findall(text) for c in _bracket(body)]
+
+
+def spans_of(retrieved: list) -> dict:
+    """Cited chunk_id -> chunk_ids whose text the hit carries (merged spans cite one member)."""
+    return {r["chunk_id"]: r.get("chunk_ids", [r["chunk_id"]]) for r in retrieved}
+
+
+def _cited_rows(index: dict, citations: list, spans: dict) -> list:
+    rows = []
+    for source_id, chunk_id in citations:
+        if chunk_id is None:
+            rows.extend(index["by_source"].get(source_id, []))
+            continue
+        if chunk_id not in index["row_of"] and f"{source_id}_{chunk_id}" in index["row_of"]:
+            chunk_id = f"{source_id}_{chunk_id}"
+        for member in spans.get(chunk_id, [chunk_id]):
+            row = index["row_of"].get(member)
+            if row is not None:
+                rows.append(row)
+    return rows
+
+
+# ── Verify ─────────────────────────────────────────────────────────────────────
+def verify(memo: str, index: dict, spans: dict = None) -> dict:
+    """Per-sentence citation support for one memo, plus totals.
+
+    spans (see spans_of) widens a cited chunk to the merged span it stood for.
+    """
+    spans = spans or {}
+    checks, uncited, short = [], 0, 0
+    for text, citations in memo_sentences(memo):
+        if not citations:
+            uncited += 1
+            continue
+        shingles = shingle_hashes(text)
+        if len(shingles) < MIN_SHINGLES:
+            short += 1
+            continue
+        share = overlap(index, shingles) / len(shingles)
+        rows  = _cited_rows(index, citations, spans)
+        best  = int(np.argmax(share))
+        support = float(share[rows].max()) if rows else 0.0
+        checks.append({
+            "sentence":      text[:200],
+            "citations":     [f"{s}:{c}" if c else s for s, c in citations],
+            "support":       round(support, 3),
+            "supported":     support >= SUPPORT_THRESHOLD,
+            "best_citation": "{}:{}".format(*index["ids"][best]),
+            "best_support":  round(float(share[best]), 3),
+        })
+
+    supported = sum(c["supported"] for c in checks)
+    return {
+        "checked":       len(checks),
+        "supported":     supported,
+        "misattributed": sum(not c["supported"] and c["best_support"] >= SUPPORT_THRESHOLD for c in checks),
+        "uncited":       uncited,
+        "too_short":     short,
+        "support_rate":  supported / len(checks) if checks else None,
+        "sentences":     checks,
+    }
+
+
+# ── Batch over the query log ───────────────────────────────────────────────────
+def run(log_path: Path = LOG_PATH, last: int = None, details: bool = False):
+    index   = load_index()
+    records = logstore.tail(log_path, last) if last else logstore.iter_records(log_path)
+    memos = checked = supported = misattributed = fully = 0
+    for r in records:
+        if not r.get("memo") or not r.get("confidence", {}).get("can_answer"):
+            continue
+        g = verify(r["memo"], index, spans_of(r.get("retrieved", [])))
+        if not g["checked"]:
+            continue
+        memos         += 1
+        checked       += g["checked"]
+        supported     += g["supported"]
+        misattributed += g["misattributed"]
+        fully         += g["supported"] == g["checked"]
+        if details and g["supported"] < g["checked"]:
+            print(f"\n{r['timestamp'][:16]}  {r['query'][:80]}")
+            for c in g["sentences"]:
+                if not c["supported"]:
+                    print(f"  ✗ {c['support']:.2f} {', '.join(c['citations'])} "
+                          f"(best: {c['best_citation']} {c['best_support']:.2f})  {c['sentence'][:90]}")
+
+    print(f"\n{'='*50}")
+    print(f"CITATION GROUNDING (lexical overlap)")
+    print(f"  Memos checked        : {memos}")
+    print(f"  Cited sentences      : {checked}")
+    if checked:
+        print(f"  Overlapping          : {supported} ({supported / checked:.1%})")
+        print(f"  Misattributed chunk  : {misattributed}")
+        print(f"  Fully overlapping    : {fully}/{memos} memos")
+    print(f"  Threshold            : {SUPPORT_THRESHOLD} of sentence shingles in the cited chunk "
+          f"(uncalibrated; paraphrases score low)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check memo citations in the query log against the cited chunks")
+    parser.add_argument("--log", type=Path, default=LOG_PATH, help="Query log to verify")
+    parser.add_argument("--last", type=int, default=None, help="Only the most recent N records")
+    parser.add_argument("--details", action="store_true", help="List unsupported sentences")
+    args = parser.parse_args()
+    run(args.log, args.last, args.details)
@@ -0,0 +1,232 @@
+"""
+src/rag/jobs.py
+Background job queue for ask() — lets the Streamlit app submit a question,
+return immediately, and poll for progress instead of blocking a script run.
+
+Jobs run on a small thread pool shared by every session of the server
+process (models and the LLM client are loaded once and shared). Every state
+change is appended to logs/jobs.jsonl, so finished results survive browser
+refreshes and restarts. The job table lives in memory: it is loaded once,
+compacted to the most recent MAX_JOBS jobs on import, and afterwards only the
+bytes appended since the last read are folded in (jobs other processes run).
+
+Each process heartbeats the jobs it owns. A job left queued or running whose
+owner is gone (dead pid on this host, or no heartbeat for STALE_S) is
+re-queued by whichever live process notices first, up to MAX_ATTEMPTS starts;
+after that it is marked failed instead of crashing the server again.
+
+    submit(question, rerank=..., filters=...) -> job_id
+    get(job_id)                               -> job dict (status, stage, partial, result, error)
+    list_jobs(limit)                          -> most recent jobs, newest first
+Called by app.py
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from src.rag.rag import ask, save_thread
+from src.rag.retrieve import _convert_numpy
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+JOBS_PATH    = Path("logs/jobs.jsonl")
+MAX_WORKERS  = 2     # concurrent asks; LLM calls are further bounded in llm.py
+MAX_JOBS     = 200   # jobs kept when the log is compacted on import
+MAX_ATTEMPTS = 3     # starts before a job that keeps dying is given up on
+HEARTBEAT_S  = 30.0
+STALE_S      = 3 * HEARTBEAT_S
+
+JOBS_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+HOST, PID = socket.gethostname(), os.getpid()
+UNFINISHED = ("queued", "running")
+
+_lock   = threading.Lock()
+_jobs   = {}      # job_id -> latest state, every process's jobs
+_owned  = set()   # job ids this process is running or has queued
+_offset = 0       # bytes of jobs.jsonl already folded into _jobs
+_events = 0       # lines folded in, to tell when compaction pays off
+_pool   = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ask-job")
+
+
+# ── Job table ──────────────────────────────────────────────────────────────────
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _append(event: dict):
+    with _lock, JOBS_PATH.open("a") as f:
+        f.write(json.dumps(_convert_numpy(event)) + "\n")
+
+
+def _update(job_id: str, persist: bool = True, **fields):
+    with _lock:
+        job = _jobs[job_id]
+        job.update(fields, updated=_now())
+        event = {"id": job_id, **fields, "updated": job["updated"]}
+    if persist:
+        _append(event)
+
+
+def _apply(event: dict):
+    if event.get("id") in _owned:
+        return   # this process holds the newer in-memory state
+    _jobs.setdefault(event["id"], {"partial": {}}).update(event)
+
+
+def _sync():
+    """Fold in events appended to jobs.jsonl since the last read."""
+    global _offset, _events
+    try:
+        if JOBS_PATH.stat().st_size < _offset:
+            _offset = 0   # compacted by another process
+    except FileNotFoundError:
+        return
+    with _lock:
+        with JOBS_PATH.open("rb") as f:
+            f.seek(_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1   # leave a half-written last line for next time
+        for line in data[:end].splitlines():
+            try:
+                _apply(json.loads(line))
+                _events += 1
+            except (json.JSONDecodeError, KeyError):
+                continue
+        _offset += end
+
+
+def _compact():
+    """Rewrite jobs.jsonl as one line per job, keeping unfinished jobs and the newest MAX_JOBS."""
+    global _offset
+    with _lock:
+        jobs  = sorted(_jobs.values(), key=lambda j: j.get("submitted", ""), reverse=True)
+        keep  = [j for i, j in enumerate(jobs) if i < MAX_JOBS or j.get("status") in UNFINISHED]
+        if len(keep) == len(jobs) and _events <= 2 * len(jobs):
+            return
+        tmp = JOBS_PATH.with_suffix(".jsonl.tmp")
+        with tmp.open("w") as f:
+            for j in reversed(keep):
+                f.write(json.dumps(_convert_numpy({k: v for k, v in j.items() if k != "partial"})) + "\n")
+        os.replace(tmp, JOBS_PATH)
+        _jobs.clear()
+        _jobs.update({j["id"]: j for j in keep})
+        _offset = JOBS_PATH.stat().st_size
+
+
+# ── Worker ─────────────────────────────────────────────────────────────────────
+def _run(job_id: str):
+    job = _jobs[job_id]
+    _update(job_id, status="running", stage="retrieving", attempts=job.get("attempts", 0) + 1,
+            host=HOST, pid=PID, heartbeat=_now())
+
+    def on_progress(stage: str, partial: dict):
+        with _lock:
+            job["partial"].update(partial)
+        _update(job_id, persist=False, stage=stage)
+
+    try:
+        result = ask(job["query"], on_progress=on_progress, **job["kwargs"])
+    except Exception as e:
+        _update(job_id, status="failed", stage="failed", error=f"{type(e).__name__}: {e}")
+        return
+    finally:
+        with _lock:
+            job["partial"] = {}
+    if result["confidence"]["can_answer"]:
+        save_thread({"query": result["query"], "citations": result["citations"],
+                     "confidence": result["confidence"], "timestamp": result["timestamp"]})
+    _update(job_id, status="done", stage="done", result=result)
+
+
+def _claim(job: dict, stage: str):
+    """Take ownership of `job` and queue it on this process's pool."""
+    with _lock:
+        job.update(status="queued", stage=stage, host=HOST, pid=PID, heartbeat=_now(), partial={})
+        _owned.add(job["id"])
+    _append({"id": job["id"], "status": "queued", "stage": stage, "host": HOST, "pid": PID,
+             "heartbeat": job["heartbeat"], "updated": _now()})
+    _pool.submit(_run, job["id"])
+
+
+def submit(question: str, **kwargs) -> str:
+    """Queue ask(question, **kwargs); returns the job id immediately."""
+    job_id = uuid.uuid4().hex[:12]
+    now    = _now()
+    job    = {"id": job_id, "query": question, "kwargs": kwargs, "status": "queued", "stage": "queued",
+              "submitted": now, "updated": now, "attempts": 0, "host": HOST, "pid": PID,
+              "heartbeat": now, "partial": {}}
+    with _lock:
+        _jobs[job_id] = job
+        _owned.add(job_id)
+    _append({k: v for k, v in job.items() if k != "partial"})
+    _pool.submit(_run, job_id)
+    return job_id
+
+
+def get(job_id: str) -> dict:
+    _sync()
+    with _lock:
+        job = _jobs.get(job_id)
+        return {**job, "partial": dict(job["partial"])} if job is not None else None
+
+
+def list_jobs(limit: int = 20) -> list:
+    _sync()
+    with _lock:
+        jobs = sorted(_jobs.values(), key=lambda j: j.get("submitted", ""), reverse=True)[:limit]
+        return [{**j, "partial": dict(j["partial"])} for j in jobs]
+
+
+# ── Heartbeat and recovery ─────────────────────────────────────────────────────
+def _owner_alive(job: dict) -> bool:
+    if job.get("host") == HOST and job.get("pid") == PID:
+        return False   # an earlier process that had our pid; this one doesn't own it
+    if job.get("host") == HOST and job.get("pid") is not None:
+        try:
+            os.kill(job["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    beat = job.get("heartbeat") or job.get("updated")
+    return bool(beat) and (datetime.now() - datetime.fromisoformat(beat)).total_seconds() < STALE_S
+
+
+def _recover():
+    """Re-queue unfinished jobs whose owner is gone; give up on ones that keep dying."""
+    with _lock:
+        stale = [j for j in _jobs.values()
+                 if j.get("status") in UNFINISHED and j["id"] not in _owned and not _owner_alive(j)]
+    for job in stale:
+        if job.get("attempts", 0) >= MAX_ATTEMPTS:
+            with _lock:
+                job.update(status="failed", stage="failed",
+                           error=f"Gave up after {job['attempts']} attempts (the process running it exited)")
+            _append({"id": job["id"], "status": "failed", "stage": "failed", "error": job["error"],
+                     "updated": _now()})
+        elif "kwargs" in job:
+            _claim(job, "requeued")
+
+
+def _heartbeat():
+    while True:
+        time.sleep(HEARTBEAT_S)
+        with _lock:
+            mine = [j["id"] for j in _jobs.values() if j["id"] in _owned and j.get("status") in UNFINISHED]
+        for job_id in mine:
+            _update(job_id, heartbeat=_now())
+        _sync()
+        _recover()
+
+
+_sync()
+_compact()
+_recover()
+threading.Thread(target=_heartbeat, name="ask-job-heartbeat", daemon=True).start()
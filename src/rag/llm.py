@@ -0,0 +1,229 @@
+"""
+src/rag/llm.py
+Shared Ollama client for every LLM call in rag.py.
+
+One ollama.AsyncClient (pooled httpx connections) lives on a background event
+loop, so synchronous callers (Streamlit, CLI) and batched calls share the same
+connection pool, timeouts, retry policy and concurrency limit.
+
+    chat(model, messages, options, task="memo")   -> response (blocking)
+    chat_many([dict(model=..., messages=...), ...], timeout_s) -> responses / LLMErrors
+    get_metrics()                                   -> per-task counters
+
+Every call passes keep_alive so the model (and its prompt cache) stays
+resident between requests. With LLM_MEASURE=1, each call's prefill vs
+decode timings are appended to logs/llm_timings.jsonl;
+`python src/rag/llm.py` summarises that file per task.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+import httpx
+import ollama
+from pathlib import Path
+from datetime import datetime
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+OLLAMA_HOST       = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+CONNECT_TIMEOUT_S = 5.0
+READ_TIMEOUT_S    = 600.0   # long memos on CPU can take minutes
+MAX_RETRIES       = 3
+BACKOFF_BASE_S    = 1.0
+BACKOFF_MAX_S     = 20.0
+MAX_CONCURRENCY   = 2       # in-flight requests; Ollama queues the rest anyway
+KEEP_ALIVE        = "30m"   # keep weights + KV cache loaded between calls
+
+MEASURE      = os.environ.get("LLM_MEASURE") == "1"
+TIMINGS_PATH = Path("logs/llm_timings.jsonl")
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """An LLM call that failed after retries; `kind` is a short error class."""
+
+    def __init__(self, task: str, kind: str, message: str):
+        super().__init__(f"{task}: {kind}: {message}")
+        self.task = task
+        self.kind = kind
+
+
+# ── Background loop ────────────────────────────────────────────────────────────
+_runtime = {"lock": threading.Lock(), "loop": None, "client": None, "sem": None}
+
+
+def _loop() -> asyncio.AbstractEventLoop:
+    with _runtime["lock"]:
+        if _runtime["loop"] is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ollama-client", daemon=True).start()
+
+            async def init():
+                _runtime["client"] = ollama.AsyncClient(
+                    host=OLLAMA_HOST,
+                    timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                    limits=httpx.Limits(max_connections=MAX_CONCURRENCY,
+                                        max_keepalive_connections=MAX_CONCURRENCY),
+                )
+                _runtime["sem"] = asyncio.Semaphore(MAX_CONCURRENCY)
+
+            asyncio.run_coroutine_threadsafe(init(), loop).result()
+            _runtime["loop"] = loop
+    return _runtime["loop"]
+
+
+# ── Metrics ────────────────────────────────────────────────────────────────────
+# Only mutated on the client loop thread, so no locking is needed.
+_metrics = {}
+
+
+def _record(task: str, outcome: str, latency_s: float = 0.0, kind: str = None):
+    m = _metrics.setdefault(task, {"calls": 0, "ok": 0, "failed": 0, "retries": 0,
+                                   "latency_s": 0.0, "prompt_eval_s": 0.0, "eval_s": 0.0,
+                                   "errors": {}})
+    if outcome == "retry":
+        m["retries"] += 1
+    else:
+        m["calls"] += 1
+        m[outcome] += 1
+        m["latency_s"] += latency_s
+    if kind:
+        m["errors"][kind] = m["errors"].get(kind, 0) + 1
+
+
+def _record_timings(task: str, model: str, response):
+    """Split server-side time into prefill (prompt_eval) and decode (eval)."""
+    t = {
+        "prompt_eval_count": response.get("prompt_eval_count") or 0,
+        "prompt_eval_s":     (response.get("prompt_eval_duration") or 0) / 1e9,
+        "eval_count":        response.get("eval_count") or 0,
+        "eval_s":            (response.get("eval_duration") or 0) / 1e9,
+        "load_s":            (response.get("load_duration") or 0) / 1e9,
+    }
+    m = _metrics[task]
+    m["prompt_eval_s"] += t["prompt_eval_s"]
+    m["eval_s"]        += t["eval_s"]
+    if MEASURE:
+        TIMINGS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with TIMINGS_PATH.open("a") as f:
+            f.write(json.dumps({"timestamp": datetime.now().isoformat(), "task": task, "model": model, **t}) + "\n")
+
+
+def get_metrics() -> dict:
+    """Per-task counters: calls, ok, failed, retries, total latency, errors by kind."""
+    async def snapshot():
+        return {task: {**m, "errors": dict(m["errors"])} for task, m in _metrics.items()}
+    return asyncio.run_coroutine_threadsafe(snapshot(), _loop()).result()
+
+
+def reset_metrics():
+    async def clear():
+        _metrics.clear()
+    asyncio.run_coroutine_threadsafe(clear(), _loop()).result()
+
+
+# ── Calls ──────────────────────────────────────────────────────────────────────
+def _classify(e: Exception) -> tuple:
+    """(kind, retryable) for an exception raised by the client."""
+    if isinstance(e, httpx.TimeoutException):
+        return "timeout", True
+    if isinstance(e, (httpx.NetworkError, httpx.RemoteProtocolError, ConnectionError)):
+        return "connection", True
+    if isinstance(e, ollama.ResponseError):
+        return f"http_{e.status_code}", e.status_code in RETRY_STATUS
+    return type(e).__name__, False
+
+
+async def _achat(model: str, messages: list, options: dict = None, task: str = "chat", **kwargs):
+    start      = time.perf_counter()
+    keep_alive = kwargs.pop("keep_alive", KEEP_ALIVE)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with _runtime["sem"]:
+                response = await _runtime["client"].chat(
+                    model=model, messages=messages, options=options, keep_alive=keep_alive, **kwargs
+                )
+            _record(task, "ok", time.perf_counter() - start)
+            _record_timings(task, model, response)
+            return response
+        except Exception as e:
+            kind, retryable = _classify(e)
+            if not retryable or attempt == MAX_RETRIES:
+                _record(task, "failed", time.perf_counter() - start, kind)
+                raise LLMError(task, kind, str(e)) from e
+            _record(task, "retry", kind=kind)
+            # Full jitter: spread retries from concurrent callers apart
+            await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)))
+
+
+def chat(model: str, messages: list, options: dict = None, task: str = "chat", **kwargs):
+    """Blocking chat call through the shared client; raises LLMError on failure."""
+    future = asyncio.run_coroutine_threadsafe(_achat(model, messages, options, task, **kwargs), _loop())
+    return future.result()
+
+
+def chat_many(requests: list, timeout_s: float = None) -> list:
+    """Run several chat requests concurrently (bounded by MAX_CONCURRENCY).
+
+    Each request is a dict of chat() keyword arguments. Results come back in
+    order; a failed request yields its LLMError instead of raising. With
+    timeout_s, requests still running at the deadline are cancelled and
+    every request yields an LLMError of kind "deadline".
+    """
+    def expired():
+        return [LLMError(r.get("task", "chat"), "deadline", f"no reply within {timeout_s:.2f}s")
+                for r in requests]
+
+    if timeout_s is not None and timeout_s <= 0:
+        return expired()
+
+    async def run_all():
+        return await asyncio.gather(*(_achat(**r) for r in requests), return_exceptions=True)
+
+    future = asyncio.run_coroutine_threadsafe(run_all(), _loop())
+    try:
+        return future.result(timeout=timeout_s)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        for r in requests:   # _metrics belongs to the loop thread
+            _loop().call_soon_threadsafe(_record, r.get("task", "chat"), "failed", timeout_s, "deadline")
+        return expired()
+
+
+# ── Measurement report ─────────────────────────────────────────────────────────
+def summarize_timings(path: Path = TIMINGS_PATH) -> dict:
+    """Per-task call count and mean prefill/decode seconds from the timings log."""
+    summary = {}
+    if not path.exists():
+        return summary
+    with path.open() as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            s = summary.setdefault(row["task"], {"calls": 0, "prompt_tokens": 0, "prompt_eval_s": 0.0,
+                                                 "eval_tokens": 0, "eval_s": 0.0})
+            s["calls"]         += 1
+            s["prompt_tokens"] += row["prompt_eval_count"]
+            s["prompt_eval_s"] += row["prompt_eval_s"]
+            s["eval_tokens"]   += row["eval_count"]
+            s["eval_s"]        += row["eval_s"]
+    return summary
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else TIMINGS_PATH
+    summary = summarize_timings(path)
+    if not summary:
+        sys.exit(f"No timings in {path} — run with LLM_MEASURE=1 first")
+    print(f"{'task':<22}{'calls':>6}{'prefill tok':>13}{'prefill s':>11}{'decode tok':>12}{'decode s':>10}")
+    for task, s in sorted(summary.items()):
+        n = s["calls"]
+        print(f"{task:<22}{n:>6}{s['prompt_tokens']/n:>13.0f}{s['prompt_eval_s']/n:>11.2f}"
+              f"{s['eval_tokens']/n:>12.0f}{s['eval_s']/n:>10.2f}")
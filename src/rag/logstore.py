@@ -0,0 +1,169 @@
+"""
+src/rag/logstore.py
+Paginated reads of the append-only JSONL logs (query_log.jsonl, threads.jsonl).
+
+Each file gets an index of its line ends, extended from the last indexed byte
+when the file grows, so fetching the newest page is a few seeks and
+json.loads no matter how large the log is. Only newline-terminated lines are
+indexed, so a record still being appended is never half-read. A file that
+shrinks or is replaced is re-indexed from scratch. Running totals over a
+log (fold) resume the same way, parsing only the records appended since the
+previous call. Exports split a log into line-aligned byte ranges (byte_parts)
+so no single download holds the whole file.
+Called by rag.py and app.py
+"""
+
+import json
+import threading
+from pathlib import Path
+import numpy as np
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+SCAN_BLOCK = 1 << 20   # bytes read per step while indexing
+
+_lock   = threading.Lock()
+_index  = {}   # path -> {"inode", "size", "ends"}
+_totals = {}   # (path, name) -> {"inode", "offset", "acc"}
+
+
+# ── Index ──────────────────────────────────────────────────────────────────────
+def signature(path: Path) -> tuple:
+    """(size, mtime_ns) — cheap cache key that changes whenever the log does."""
+    try:
+        st = Path(path).stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _line_ends(path: Path) -> np.ndarray:
+    """Byte offsets of every newline in `path`, indexed incrementally."""
+    path = Path(path)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return np.empty(0, dtype=np.int64)
+
+    with _lock:
+        entry = _index.get(path)
+        if entry is None or entry["inode"] != st.st_ino or st.st_size < entry["size"]:
+            entry = {"inode": st.st_ino, "size": 0, "ends": np.empty(0, dtype=np.int64)}
+        if st.st_size > entry["size"]:
+            new = [entry["ends"]]
+            with path.open("rb") as f:
+                f.seek(entry["size"])
+                pos = entry["size"]
+                while True:
+                    block = f.read(SCAN_BLOCK)
+                    if not block:
+                        break
+                    new.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10) + pos)
+                    pos += len(block)
+            # Stop at the last newline; a partial trailing record is picked up next time
+            ends = np.concatenate(new).astype(np.int64)
+            entry = {"inode": st.st_ino, "size": int(ends[-1]) + 1 if len(ends) else 0, "ends": ends}
+        _index[path] = entry
+        return entry["ends"]
+
+
+def count(path: Path) -> int:
+    """Number of complete lines (records, plus any blank lines)."""
+    return len(_line_ends(path))
+
+
+# ── Readers ────────────────────────────────────────────────────────────────────
+def _read_lines(path: Path, ends: np.ndarray, rows) -> list:
+    out = []
+    with Path(path).open("rb") as f:
+        for i in rows:
+            start = int(ends[i - 1]) + 1 if i else 0
+            f.seek(start)
+            line = f.read(int(ends[i]) - start)
+            if not line.strip():
+                continue
+            try:
+                out.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return out
+
+
+def read_page(path: Path, page: int = 0, page_size: int = 20) -> list:
+    """Records on `page` counting back from the end of the file, newest first."""
+    ends = _line_ends(path)
+    hi   = len(ends) - page * page_size
+    lo   = max(hi - page_size, 0)
+    return _read_lines(path, ends, range(hi - 1, lo - 1, -1)) if hi > 0 else []
+
+
+def tail(path: Path, n: int) -> list:
+    """The last `n` records in file order (oldest first)."""
+    return read_page(path, 0, n)[::-1]
+
+
+def fold(path: Path, name: str, init, step) -> dict:
+    """Running totals over every record: acc = step(acc, record), starting from init().
+
+    The accumulator is kept per (path, name) with the byte offset it covers,
+    so each call only parses the records appended since the last one.
+    Returns a copy of the accumulator.
+    """
+    path = Path(path)
+    ends = _line_ends(path)
+    end  = int(ends[-1]) + 1 if len(ends) else 0
+    key  = (path, name)
+    with _lock:
+        inode = _index[path]["inode"] if path in _index else None
+        entry = _totals.get(key)
+        if entry is None or entry["inode"] != inode or end < entry["offset"]:
+            entry = {"inode": inode, "offset": 0, "acc": init()}
+        if end > entry["offset"]:
+            with path.open("rb") as f:
+                f.seek(entry["offset"])
+                pos = entry["offset"]
+                for line in f:   # one line at a time, so a first call on a large log stays small
+                    pos += len(line)
+                    if pos > end:
+                        break    # past the indexed end: a record still being appended
+                    if line.strip():
+                        try:
+                            entry["acc"] = step(entry["acc"], json.loads(line))
+                        except json.JSONDecodeError:
+                            continue
+            entry["offset"] = end
+        _totals[key] = entry
+        return dict(entry["acc"])
+
+
+def byte_parts(path: Path, max_bytes: int) -> list:
+    """(start, end) byte ranges covering every complete line, each at most
+    max_bytes (a single longer line gets a range of its own), split at line ends."""
+    cuts  = _line_ends(path) + 1
+    parts, start = [], 0
+    while len(cuts) and start < cuts[-1]:
+        i   = int(np.searchsorted(cuts, start + max_bytes, side="right")) - 1
+        end = int(cuts[i]) if i >= 0 and cuts[i] > start else int(cuts[np.searchsorted(cuts, start, side="right")])
+        parts.append((start, end))
+        start = end
+    return parts
+
+
+def read_bytes(path: Path, start: int, end: int) -> bytes:
+    """Raw bytes [start, end) of `path` (one range from byte_parts)."""
+    with Path(path).open("rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def iter_records(path: Path):
+    """Every record in file order, streamed."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with path.open("rb") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
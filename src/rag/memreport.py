@@ -0,0 +1,98 @@
+"""
+src/rag/memreport.py
+Per-process memory report for loading the live vector-store snapshot with
+private copies vs. memory-mapped files.
+
+Starts N worker processes per mode. Each opens the index and embeddings the
+way the retriever does, touches every vector (one full search plus a pass
+over the embedding matrix), then waits until all its siblings have done the
+same before reading its memory counters from /proc:
+
+    RSS   resident pages, shared ones included
+    anon  private (heap) pages — the per-process cost of a copy
+    file  page-cache pages mapped from the snapshot files
+    PSS   proportional share: shared pages are split across the processes
+
+Linux only. The embedding model is not loaded; each process keeps its own
+SentenceTransformer either way.
+
+Usage (from repo root):
+    python src/rag/memreport.py                 # 4 processes per mode
+    python src/rag/memreport.py --procs 8
+"""
+
+import sys, argparse
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.ingest import snapshot
+
+
+def _proc_kb() -> dict:
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                out[key] = int(rest.split()[0])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    out["Pss"] = int(line.split()[1])
+    except FileNotFoundError:
+        out["Pss"] = None
+    return out
+
+
+def _worker(root: str, index_paths: list, mmap: bool, ready, results):
+    base   = _proc_kb()
+    shards = [snapshot.open_index(p, mmap=mmap) for p in index_paths]
+    emb    = snapshot.open_embeddings(Path(root) / "embeddings.npy", mmap=mmap)
+    for index in shards:
+        index.search(np.asarray(emb[:1], dtype=np.float32), min(10, index.ntotal))   # full scan
+    float(emb.sum(dtype=np.float64))
+    ready.wait()   # all siblings hold their mappings before anyone measures
+    after = _proc_kb()
+    results.put({k: (after[k] - base[k]) if after[k] is not None and base.get(k) is not None else None
+                 for k in after})
+    ready.wait()
+
+
+def measure(root: Path, index_paths: list, mmap: bool, procs: int) -> list:
+    ctx     = mp.get_context("spawn")
+    ready   = ctx.Barrier(procs)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(str(root), [str(p) for p in index_paths], mmap, ready, results)) for _ in range(procs)]
+    for w in workers:
+        w.start()
+    rows = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return rows
+
+
+def run(procs: int = 4, version: str = None):
+    version = version or snapshot.current_version()
+    root    = snapshot.snapshot_dir(version)
+    paths   = snapshot.index_paths(version)
+    size_mb = sum(p.stat().st_size for p in [*paths, root / "embeddings.npy"]) / 1e6
+    print(f"Snapshot {version}: {len(paths)} index file(s) + embeddings.npy = {size_mb:.1f} MB, "
+          f"{procs} processes per mode\n")
+
+    print(f"{'mode':<8}{'RSS/proc':>12}{'anon/proc':>12}{'file/proc':>12}{'PSS/proc':>12}{'PSS total':>12}   (MB, growth from load)")
+    for mode, mmap in (("copy", False), ("mmap", True)):
+        rows = measure(root, paths, mmap, procs)
+        mean = lambda k: np.mean([r[k] for r in rows]) / 1024 if rows[0].get(k) is not None else float("nan")
+        print(f"{mode:<8}{mean('VmRSS'):>12.1f}{mean('RssAnon'):>12.1f}{mean('RssFile'):>12.1f}"
+              f"{mean('Pss'):>12.1f}{mean('Pss') * procs:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-process memory: copied vs memory-mapped vectors")
+    parser.add_argument("--procs", type=int, default=4, help="Processes per mode")
+    parser.add_argument("--version", default=None, help="Snapshot to load (default: CURRENT)")
+    args = parser.parse_args()
+    run(args.procs, args.version)
@@ -9,16 +9,24 @@ Run: ollama serve && ollama pull mistral:7b
 from pathlib import Path
 import re
 import json
+import time
 import numpy as np
 from datetime import datetime
-import ollama
 
 # ── Import from retrieve.py ────────────────────────────────────────────────────
 from src.rag.retrieve import (
     retrieve_top_k,
     compute_confidence,
+    term_hits,
+    related_sources,
+    score_sentences,
+    top_sentences,
+    current_store,
     _convert_numpy,
 )
+from src.ingest.terms import extract_terms
+from src.rag.context import build_context
+from src.rag import llm, logstore, grounding
 
 # ── Paths ──────────────────────────────────────────────────────────────────────
 LOG_PATH     = Path("logs/query_log.jsonl")
@@ -28,6 +36,71 @@ LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 # ── Ollama config ──────────────────────────────────────────────────────────────
 OLLAMA_MODEL = "mistral:7b"
+SMALL_MODEL  = "llama3.2:3b"
+
+# Per-task model routing and output caps. The short, structured outputs
+# (CLAIM/METHOD fields, GAP/QUERY lines) go to the small model; anything it
+# returns that fails parsing is re-run once on OLLAMA_MODEL (see _chat_tiered).
+TASK_MODELS = {
+    "memo":       {"model": OLLAMA_MODEL, "num_predict": 1500},
+    "annotation": {"model": SMALL_MODEL,  "num_predict": 300},
+    "gaps":       {"model": SMALL_MODEL,  "num_predict": 160},
+}
+
+
+def _chat_tiered(task: str, prompts: list, parse, timeout_s: float = None) -> list:
+    """Run one chat per message list on the task's model, concurrently.
+
+    Returns parse(content) per prompt, in order. Prompts whose output parses
+    to None, or whose call failed, are retried once on OLLAMA_MODEL; an item
+    that still fails is its LLMError (or None if the output never parsed).
+    timeout_s bounds both rounds together; no fallback runs past it.
+    """
+    cfg = TASK_MODELS[task]
+    deadline = None if timeout_s is None else time.perf_counter() + timeout_s
+    left     = lambda: None if deadline is None else deadline - time.perf_counter()
+    requests = [
+        {"model": cfg["model"], "messages": m, "options": {"num_predict": cfg["num_predict"]}, "task": task}
+        for m in prompts
+    ]
+
+    def parsed(responses):
+        return [r if isinstance(r, Exception) else parse(r["message"]["content"]) for r in responses]
+
+    results = parsed(llm.chat_many(requests, left()))
+    retry   = [i for i, r in enumerate(results) if r is None or isinstance(r, Exception)]
+    if retry and cfg["model"] != OLLAMA_MODEL and (deadline is None or left() > 0):
+        again = parsed(llm.chat_many([
+            dict(requests[i], model=OLLAMA_MODEL, task=f"{task}_fallback") for i in retry
+        ], left()))
+        for i, r in zip(retry, again):
+            results[i] = r
+    return results
+
+# ── Retrieval config ───────────────────────────────────────────────────────────
+RERANK_ENABLED = False   # over-retrieve + cross-encoder re-rank (see retrieve.rerank_hits)
+MERGE_ADJACENT = True    # fold overlapping neighbour chunks of one paper into a single span
+MMR_LAMBDA     = None    # e.g. 0.7 to diversify the final k by maximal marginal relevance
+
+# Evidence pasted into the synthesis prompt is compressed to this many tokens
+# (see context.build_context); None sends every chunk's full text.
+CONTEXT_BUDGET_TOKENS = 2000
+
+# Refused queries skip the memo, bibliography, extractive answer and evidence
+# table (the sentence scoring behind the last two embeds every sentence on
+# snapshots without a sentence index), and must return within this many
+# seconds of the start of ask(): the LLM gap report gets whatever time is
+# left, and a deterministic template replaces it if it can't finish in time.
+# None waits for the LLM however long it takes.
+REFUSAL_BUDGET_S = 1.0
+
+# Adaptive k: ask() over-fetches K_MAX hits and keeps them up to the first
+# clear drop in score; pass k= to ask() for a fixed k instead.
+K_MIN        = 3      # never fewer (compute_confidence reads the top 3)
+K_MAX        = 15
+K_GAP_FACTOR = 3.0    # a drop this many times the mean step counts as the elbow
+K_DEFAULT    = 7      # k when the scores show no elbow and K_PRIOR is off
+K_PRIOR      = True   # ... otherwise fall back on the question-type k
 
 
 # ── Synthesis memo ─────────────────────────────────────────────────────────────
@@ -55,41 +128,47 @@ REFERENCE LIST — follow this exactly:
 - Only list sources you actually cited inline in the memo above
 - Do NOT include ANY numbers, ranges, or counts in section headers
     - WRONG: "Introduction (806-837 words)" or "Key Findings (2)" 
-    - CORRECT: "Introduction:" or "Key Findings:"""
+    - CORRECT: "Introduction:" or "Key Findings:"
+
+TASK — the user message gives the evidence chunks, the valid citations, and finally the research question:
+Write a synthesis memo of AT LEAST 800 words answering the research question using ONLY the evidence chunks.
+Each section (Introduction, Key Findings, Synthesis & Implications, Limitations & Gaps) must be at least 2 full paragraphs.
+Cite every claim inline using ONLY the valid citations listed as [source_id:chunk_id].
+In the Reference List, only write the source_id and chunk_id — do NOT invent author names, journal names, or page numbers.
+You MUST write at least 800 words. If you finish a section and have not reached 800 words, keep writing and expand with more analysis.
+Do not stop before 800 words."""
 
 def generate_synthesis_memo(question: str, retrieved: list, confidence: dict) -> str:
     if not confidence["can_answer"]:
         return build_refusal_message(question, retrieved, confidence)
 
+    evidence = build_context(question, retrieved, CONTEXT_BUDGET_TOKENS) if CONTEXT_BUDGET_TOKENS else retrieved
+
     evidence_block = "\n\n".join(
         f"[{r['source_id']}:{r['chunk_id']}] (score: {r['score']:.3f})\n{r['text']}"
-        for r in retrieved
+        for r in evidence
     )
 
-    valid_citations = "\n".join(f"- [{r['source_id']}:{r['chunk_id']}]" for r in retrieved)
+    valid_citations = "\n".join(f"- [{r['source_id']}:{r['chunk_id']}]" for r in evidence)
 
-    user_prompt = f"""Research Question: {question}
-
-Evidence Chunks:
+    # Fixed instructions live in the system prompt and the question goes last,
+    # so consecutive calls share the longest possible prefix in Ollama's cache
+    user_prompt = f"""Evidence Chunks:
 {evidence_block}
 
 VALID CITATIONS (use ONLY these exact IDs, no others):
 {valid_citations}
 
-Write a synthesis memo of AT LEAST 800 words answering the research question using ONLY the evidence above.
-Each section (Introduction, Key Findings, Synthesis & Implications, Limitations & Gaps) must be at least 2 full paragraphs.
-Cite every claim inline using ONLY the valid citations listed above as [source_id:chunk_id].
-In the Reference List, only write the source_id and chunk_id — do NOT invent author names, journal names, or page numbers.
-You MUST write at least 800 words. If you finish a section and have not reached 800 words, keep writing and expand with more analysis.
-Do not stop before 800 words."""
+Research Question: {question}"""
 
-    response = ollama.chat(
-        model=OLLAMA_MODEL,
+    response = llm.chat(
+        model=TASK_MODELS["memo"]["model"],
         messages=[
             {"role": "system", "content": SYNTHESIS_SYSTEM},
             {"role": "user",   "content": user_prompt},
         ],
-        options={"num_predict": 1500}
+        options={"num_predict": TASK_MODELS["memo"]["num_predict"]},
+        task="memo",
     )
     memo = response["message"]["content"]
     memo = re.sub(r'(Introduction|Key Findings|Synthesis & Implications|Limitations & Gaps|Conclusion|Reference List)\s*\([^)]*\)', r'\1:', memo)
@@ -118,17 +197,29 @@ Do not stop before 800 words."""
 
 
 # ── Evidence table (no LLM) ────────────────────────────────────────────────────
-def build_evidence_table(question: str, retrieved: list) -> list:
+def build_evidence_table(question: str, retrieved: list, scored: list = None) -> list:
+    """One row per hit; `scored` reuses score_sentences output for the same hits."""
     rows = []
-    q_words = set(re.findall(r'\b\w{4,}\b', question.lower()))
+    q_words  = extract_terms(question)
+    overlaps = term_hits(q_words, retrieved).sum(axis=1) / max(len(q_words), 1)
+    _, source_idx, source_counts = np.unique(
+        [r["source_id"] for r in retrieved], return_inverse=True, return_counts=True
+    )
+    best = {}
+    for sent in scored if scored is not None else score_sentences(question, retrieved):
+        if sent["hit"] not in best or sent["score"] > best[sent["hit"]]["score"]:
+            best[sent["hit"]] = sent
 
-    for r in retrieved:
+    for i, r in enumerate(retrieved):
         text  = r["text"]
         score = r["score"]
 
-        # Claim — first clean sentence
-        sentences = re.split(r'(?<=[.!?])\s+', text.strip())
-        claim = sentences[0][:150] if sentences else text[:150]
+        # Claim — the chunk's most query-relevant sentence
+        if i in best:
+            claim = best[i]["text"][:150]
+        else:
+            sentences = re.split(r'(?<=[.!?])\s+', text.strip())
+            claim = sentences[0][:150] if sentences else text[:150]
 
         # Snippet — first 200 chars cleaned
         snippet = " ".join(text.split())[:200]
@@ -143,8 +234,7 @@ def build_evidence_table(question: str, retrieved: list) -> list:
 
         # Notes
         notes = []
-        chunk_words = set(re.findall(r'\b\w{4,}\b', text.lower()))
-        overlap = len(q_words & chunk_words) / max(len(q_words), 1)
+        overlap = overlaps[i]
 
         # Match quality
         if score >= 0.85 and overlap >= 0.3:
@@ -156,8 +246,12 @@ def build_evidence_table(question: str, retrieved: list) -> list:
         elif overlap < 0.2:
             notes.append("Weak keyword overlap — may be tangential")
 
+        merged = len(r.get("chunk_ids", []))
+        if merged > 1:
+            notes.append(f"Merged span of {merged} adjacent chunks")
+
         # Source repetition
-        same_source = sum(1 for rr in retrieved if rr["source_id"] == r["source_id"])
+        same_source = int(source_counts[source_idx[i]])
         if same_source > 1:
             notes.append(f"Heavy reliance — {same_source} chunks from same paper")
 
@@ -187,79 +281,156 @@ LIMITATIONS: <what is uncertain, missing, or caveated in this chunk — or "Not
 WHY IT MATTERS: <why this finding is relevant to Mars habitability or life detection>"""
 
 
-def generate_annotated_bibliography(retrieved: list) -> list:
-    entries = []
-    seen_sources = set()
+def _extract_annot_field(label, text):
+    match = re.search(rf'{label}:\s*(.+?)(?=\n(?:CLAIM|METHOD|LIMITATIONS|WHY IT MATTERS):|$)', text, re.DOTALL)
+    if not match:
+        return "Not extracted"
+    val = match.group(1).strip()
+    # Remove any leaked next-field headers
+    val = re.sub(r'\n?WHY IT MATTERS:.*', '', val, flags=re.DOTALL).strip()
+    return val
+
+
+def _parse_annotation(content: str) -> dict:
+    """The four ANNOT_SYSTEM fields, or None if the output lacks a CLAIM."""
+    fields = {
+        "claim":          _extract_annot_field("CLAIM", content),
+        "method":         _extract_annot_field("METHOD", content),
+        "limitations":    _extract_annot_field("LIMITATIONS", content),
+        "why_it_matters": _extract_annot_field("WHY IT MATTERS", content),
+    }
+    return None if fields["claim"] == "Not extracted" else fields
+
 
+def generate_annotated_bibliography(retrieved: list) -> list:
+    # One entry per unique source
+    sources, seen_sources = [], set()
     for r in retrieved:
-        # One entry per unique source
-        if r["source_id"] in seen_sources:
-            continue
-        seen_sources.add(r["source_id"])
+        if r["source_id"] not in seen_sources:
+            seen_sources.add(r["source_id"])
+            sources.append(r)
 
-        prompt = f"""Evidence chunk from [{r['source_id']}:{r['chunk_id']}]:
+    # All sources go to the shared client at once; it bounds concurrency
+    results = _chat_tiered("annotation", [
+        [
+            {"role": "system", "content": ANNOT_SYSTEM},
+            {"role": "user",   "content": f"""Evidence chunk from [{r['source_id']}:{r['chunk_id']}]:
 
 {r['text'][:1500]}
 
-Extract the 4 fields as instructed."""
-
-        try:
-            response = ollama.chat(
-                model=OLLAMA_MODEL,
-                messages=[
-                    {"role": "system", "content": ANNOT_SYSTEM},
-                    {"role": "user",   "content": prompt},
-                ],
-            )
-            content = response["message"]["content"]
-
-            def extract_field(label, text):
-                match = re.search(rf'{label}:\s*(.+?)(?=\n(?:CLAIM|METHOD|LIMITATIONS|WHY IT MATTERS):|$)', text, re.DOTALL)
-                if not match:
-                    return "Not extracted"
-                val = match.group(1).strip()
-                # Remove any leaked next-field headers
-                val = re.sub(r'\n?WHY IT MATTERS:.*', '', val, flags=re.DOTALL).strip()
-                return val
-
-            entries.append({
-                "source_id":      r["source_id"],
-                "chunk_id":       r["chunk_id"],
-                "claim":          extract_field("CLAIM", content),
-                "method":         extract_field("METHOD", content),
-                "limitations":    extract_field("LIMITATIONS", content),
-                "why_it_matters": extract_field("WHY IT MATTERS", content),
-            })
-        except Exception as e:
-            entries.append({
-                "source_id":      r["source_id"],
-                "chunk_id":       r["chunk_id"],
+Extract the 4 fields as instructed."""},
+        ]
+        for r in sources
+    ], _parse_annotation)
+
+    entries = []
+    for r, fields in zip(sources, results):
+        if fields is None or isinstance(fields, Exception):
+            fields = {
                 "claim":          "Error generating entry",
-                "method":         str(e),
+                "method":         str(fields) if fields else "Output could not be parsed",
                 "limitations":    "",
                 "why_it_matters": "",
-            })
+            }
+        entries.append({"source_id": r["source_id"], "chunk_id": r["chunk_id"], **fields})
 
     return entries
 
 
-# ── Main ask function ──────────────────────────────────────────────────────────
-# Dynamic k based on question complexity
+# ── Adaptive k ─────────────────────────────────────────────────────────────────
+def question_k_prior(question: str) -> int:
+    """k suggested by the wording of the question."""
     q_lower = question.lower()
-    if any(w in q_lower for w in ["compare", "contrast", "all", "every", "comprehensive", "overview", "survey"]):
-        k = 15  # broad questions need more sources
-    elif any(w in q_lower for w in ["what is", "define", "how does", "who", "when"]):
-        k = 7   # simple factual questions need fewer
-    else:
-        k = 10  # default for most research questions
+    words   = set(re.findall(r"[a-z]+", q_lower))
+    if words & {"compare", "contrast", "all", "every", "comprehensive", "overview", "survey"}:
+        return 15  # broad questions need more sources
+    elif any(w in q_lower for w in ["what is", "define", "how does"]) or words & {"who", "when"}:
+        return 7   # simple factual questions need fewer
+    return 10  # default for most research questions
+
+
+def choose_k(question: str, scores: list) -> int:
+    """How many of the ranked hits to keep.
+
+    Cuts at the largest score drop that leaves at least K_MIN hits, if that
+    drop is K_GAP_FACTOR times the mean step across the list. Flat or evenly
+    decaying scores have no such elbow; then the question-type prior (or
+    K_DEFAULT) decides.
+    """
+    s = np.sort(np.asarray(scores, dtype=np.float64))[::-1]
+    if len(s) <= K_MIN:
+        return len(s)
+    drops     = (s[:-1] - s[1:])[K_MIN - 1:]   # drops[j] follows hit K_MIN + j
+    mean_step = (s[0] - s[-1]) / (len(s) - 1)
+    j = int(np.argmax(drops))
+    if mean_step > 0 and drops[j] >= K_GAP_FACTOR * mean_step:
+        return K_MIN + j
+    fallback = question_k_prior(question) if K_PRIOR else K_DEFAULT
+    return max(K_MIN, min(fallback, len(s)))
 
-def ask(question: str, k: int = 7) -> dict:
 
-    retrieved      = retrieve_top_k(question, k)
+# ── Main ask function ──────────────────────────────────────────────────────────
+def retrieve_evidence(question: str, k: int = None, rerank: bool = RERANK_ENABLED,
+                      filters: dict = None) -> list:
+    """The retrieval step of ask(): k=None picks k per query (see choose_k)."""
+    retrieved = retrieve_top_k(question, k or K_MAX, rerank=rerank, merge=MERGE_ADJACENT,
+                               mmr_lambda=MMR_LAMBDA, filters=filters)
     # Filter out reference-list chunks — they cause the LLM to hallucinate Author et al., YEAR citations
     retrieved = [r for r in retrieved if len(re.findall(r'[A-Z][a-z]+ et al\.', r["text"])) <= 5]
-    
+    if k is None:
+        # Merging and MMR leave the list out of score order; cut on the sorted list
+        rank      = lambda r: r.get("rerank_score", r["score"])
+        retrieved = sorted(retrieved, key=rank, reverse=True)
+        retrieved = retrieved[:choose_k(question, [rank(r) for r in retrieved])]
+    return retrieved
+
+
+def ask(question: str, k: int = None, rerank: bool = RERANK_ENABLED, filters: dict = None,
+        latency_budget_s: float = REFUSAL_BUDGET_S, on_progress=None, log: bool = True) -> dict:
+    """Run the full pipeline for one question.
+
+    k=None picks k per query from the retrieval scores (see choose_k).
+    latency_budget_s bounds a refusal, counted from the start of the call
+    (see REFUSAL_BUDGET_S).
+    on_progress(stage, partial) is called after each stage with the result
+    fields computed so far (used by jobs.py to show partial results).
+    log=False skips the query log (used by replay.py).
+    """
+    def progress(stage: str, **partial):
+        if on_progress:
+            on_progress(stage, partial)
+
+    started        = time.perf_counter()
+    retrieved      = retrieve_evidence(question, k, rerank, filters)
     confidence     = compute_confidence(question, retrieved)
+
+    # Refusal plan: only the gap report and the message built from it
+    if not confidence["can_answer"]:
+        progress("retrieved", retrieved=retrieved, confidence=confidence)
+        left = None if latency_budget_s is None else latency_budget_s - (time.perf_counter() - started)
+        gaps = find_gaps(question, retrieved, confidence, timeout_s=left, filters=filters)
+        result = {
+            "query":          question,
+            "filters":        filters,
+            "k":              len(retrieved),
+            "memo":           build_refusal_message(question, retrieved, confidence, gaps),
+            "citations":      [],
+            "retrieved":      retrieved,
+            "extractive":     [],
+            "confidence":     confidence,
+            "evidence_table": [],
+            "annot_bib":      [],
+            "gaps":           gaps,
+            "timestamp":      datetime.now().isoformat(),
+        }
+        if log:
+            _log(result)
+        return result
+
+    scored         = score_sentences(question, retrieved)   # shared by the extractive answer and evidence table
+    extractive     = top_sentences(question, retrieved, scored=scored)   # instant answer while the memo is written
+    progress("retrieved", retrieved=retrieved, confidence=confidence, extractive=extractive)
+
     memo           = generate_synthesis_memo(question, retrieved, confidence)
     # Extract citations — handle [source:chunk], [source : chunk], and [source] formats
     valid_source_ids = {r["source_id"] for r in retrieved}
@@ -275,23 +446,33 @@ def ask(question: str, k: int = 7) -> dict:
         if s in valid_source_ids:
             citations.add((s, chunk_map.get(s, "")))
     citations = list(citations)
-    evidence_table = build_evidence_table(question, retrieved)
+    # Check each cited sentence against the chunk it cites
+    grounding_report = grounding.verify(memo, grounding.store_index(current_store()), grounding.spans_of(retrieved))
+    progress("memo", memo=memo, citations=citations, grounding=grounding_report)
+    evidence_table = build_evidence_table(question, retrieved, scored)
+    progress("evidence_table", evidence_table=evidence_table)
     annot_bib      = generate_annotated_bibliography(retrieved)
+    progress("annot_bib", annot_bib=annot_bib)
 
-    gaps = find_gaps(question, retrieved, confidence)
+    gaps = find_gaps(question, retrieved, confidence, filters=filters)
 
     result = {
         "query":          question,
+        "filters":        filters,
+        "k":              len(retrieved),
         "memo":           memo,
         "citations":      citations,
+        "grounding":      grounding_report,
         "retrieved":      retrieved,
+        "extractive":     extractive,
         "confidence":     confidence,
         "evidence_table": evidence_table,
         "annot_bib":      annot_bib,
         "gaps":           gaps,
         "timestamp":      datetime.now().isoformat(),
     }
-    _log(result)
+    if log:
+        _log(result)
     return result
 
 
@@ -304,35 +485,19 @@ def save_thread(thread: dict):
     with THREADS_PATH.open("a") as f:
         f.write(json.dumps(_convert_numpy(thread)) + "\n")
 
-def load_threads() -> list:
-    if not THREADS_PATH.exists():
-        return []
-    threads = []
-    with THREADS_PATH.open() as f:
-        for line in f:
-            if line.strip():
-                try: threads.append(json.loads(line))
-                except: pass
-    return threads
+def load_threads(limit: int = None) -> list:
+    """Saved threads, oldest first; with `limit`, only the most recent ones."""
+    if limit is not None:
+        return logstore.tail(THREADS_PATH, limit)
+    return list(logstore.iter_records(THREADS_PATH))
 
 
 # ── Gap finder ────────────────────────────────────────────────────────
-def find_gaps(question: str, retrieved: list, confidence: dict) -> dict:
-    """LLM-based gap finder — dynamically identifies missing evidence and suggests next queries."""
-    
-    # Detect basic structural issues (no LLM needed)
-    unanswered = []
-    if confidence["overall_confidence"] < 0.6:
-        unanswered.append("Overall confidence is low — corpus may lack direct evidence on this question")
-    if len(set(r["source_id"] for r in retrieved)) <= 2:
-        unanswered.append("Only 1-2 unique sources retrieved — evidence base is narrow")
-
-    # LLM-based gap analysis
-    source_list = list(set(r["source_id"] for r in retrieved))
-    prompt = f"""A researcher asked this specific question: "{question}"
+# Unretrieved corpus sources listed as "may address this" (from the
+# precomputed source centroids — no LLM call)
+MISSING_SOURCES = 3
 
-The RAG system retrieved these sources: {source_list}
-Overall confidence: {confidence['overall_confidence']:.2f}
+GAPS_SYSTEM = """You review a research question against the sources a RAG system retrieved for it.
 
 Focusing ONLY on the specific question asked:
 1. What specific aspect of THIS question is not well covered by the retrieved sources?
@@ -348,50 +513,115 @@ GAP: one sentence about what's missing for this specific question
 QUERY1: specific follow-up query
 QUERY2: specific follow-up query"""
 
-    try:
-        response = ollama.chat(
-            model=OLLAMA_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        content = response["message"]["content"]
 
-        def extract(label, text):
-            match = re.search(rf'{label}:\s*(.+?)(?=\n[A-Z]+:|$)', text, re.DOTALL)
-            return match.group(1).strip() if match else ""
+def _parse_gaps(content: str) -> tuple:
+    """(gap, suggested_queries), or None if the output has neither."""
+    def extract(label, text):
+        match = re.search(rf'{label}:\s*(.+?)(?=\n[A-Z]+:|$)', text, re.DOTALL)
+        return match.group(1).strip() if match else ""
 
-        gap    = extract("GAP", content).split("\n")[0].strip()
-        query1 = extract("QUERY1", content).split("\n")[0].strip()
-        query2 = extract("QUERY2", content).split("\n")[0].strip()
+    gap    = extract("GAP", content).split("\n")[0].strip()
+    query1 = extract("QUERY1", content).split("\n")[0].strip()
+    query2 = extract("QUERY2", content).split("\n")[0].strip()
 
-        # Remove any leaked HTML, quotes, or QUERY2 fragments
-        for bad in ['</div>', '<div', 'QUERY2:', 'QUERY1:', '"']:
-            gap    = gap.replace(bad, "").strip()
-            query1 = query1.replace(bad, "").strip()
-            query2 = query2.replace(bad, "").strip()
+    # Remove any leaked HTML, quotes, or QUERY2 fragments
+    for bad in ['</div>', '<div', 'QUERY2:', 'QUERY1:', '"']:
+        gap    = gap.replace(bad, "").strip()
+        query1 = query1.replace(bad, "").strip()
+        query2 = query2.replace(bad, "").strip()
 
-        if gap:
-            unanswered.append(gap)
+    suggested = [q for q in [query1, query2] if q and len(q) > 10]
+    return (gap, suggested) if gap or suggested else None
+
+
+def _structural_gaps(retrieved: list, confidence: dict) -> list:
+    """Basic coverage issues detectable without an LLM."""
+    unanswered = []
+    if confidence["overall_confidence"] < 0.6:
+        unanswered.append("Overall confidence is low — corpus may lack direct evidence on this question")
+    if len(set(r["source_id"] for r in retrieved)) <= 2:
+        unanswered.append("Only 1-2 unique sources retrieved — evidence base is narrow")
+    return unanswered
+
+
+def template_gaps(question: str, retrieved: list, confidence: dict, filters: dict = None) -> dict:
+    """Deterministic gap report for the fast refusal path — no LLM call.
+
+    Question terms that no retrieved chunk mentions become the stated gap and
+    seed the suggested follow-up queries. Missing sources respect `filters`.
+    """
+    unanswered = _structural_gaps(retrieved, confidence)
+    q_words    = [w for w in extract_terms(question) if w not in {"what", "does", "how", "mars", "corpus"}]
+    missing    = []
+    if q_words:
+        covered = term_hits(q_words, retrieved).any(axis=0) if retrieved else np.zeros(len(q_words), dtype=bool)
+        missing = [w for w, hit in zip(q_words, covered) if not hit]
+    if missing:
+        unanswered.append(f"No retrieved passage mentions: {', '.join(missing)}")
+
+    suggested = [f"Which studies discuss {w} in the context of Mars habitability?" for w in missing[:2]]
+    if not suggested and retrieved:
+        suggested = [f"What evidence in {retrieved[0]['source_id']} relates to this question?"]
+
+    return {
+        "unanswered_aspects": unanswered,
+        "suggested_queries":  suggested,
+        "missing_sources":    related_sources(question, {r["source_id"] for r in retrieved}, MISSING_SOURCES,
+                                              filters=filters),
+        "weak_chunks":        [r["source_id"] for r in retrieved if r["score"] < 0.75],
+    }
+
+
+def find_gaps(question: str, retrieved: list, confidence: dict, timeout_s: float = None,
+              filters: dict = None) -> dict:
+    """LLM-based gap finder — dynamically identifies missing evidence and suggests next queries.
+
+    With timeout_s, an LLM report that isn't back in time is replaced by
+    template_gaps(). Missing sources are limited to those `filters` admit.
+    """
+    if timeout_s is not None and timeout_s <= 0:
+        return template_gaps(question, retrieved, confidence, filters)
+
+    # Detect basic structural issues and related unretrieved sources (no LLM needed)
+    unanswered = _structural_gaps(retrieved, confidence)
+    missing    = related_sources(question, {r["source_id"] for r in retrieved}, MISSING_SOURCES, filters=filters)
+
+    # LLM-based gap analysis — fixed instructions first, per-query facts last
+    source_list = sorted(set(r["source_id"] for r in retrieved))
+    prompt = f"""The RAG system retrieved these sources: {source_list}
+Overall confidence: {confidence['overall_confidence']:.2f}
 
-        suggested = [q for q in [query1, query2] if q and len(q) > 10]
+A researcher asked this specific question: "{question}"
+"""
 
+    result = _chat_tiered("gaps", [[
+        {"role": "system", "content": GAPS_SYSTEM},
+        {"role": "user",   "content": prompt},
+    ]], _parse_gaps, timeout_s)[0]
+    if result is not None and not isinstance(result, Exception):
+        gap, suggested = result
+        if gap:
+            unanswered.append(gap)
         return {
             "unanswered_aspects": unanswered,
             "suggested_queries":  suggested,
-            "missing_sources":    [],
+            "missing_sources":    missing,
             "weak_chunks":        [r["source_id"] for r in retrieved if r["score"] < 0.75],
         }
-    except Exception as e:
-        return {
-            "unanswered_aspects": unanswered,
-            "suggested_queries":  [],
-            "missing_sources":    [],
-            "weak_chunks":        [],
-        }
+    if timeout_s is not None:
+        return template_gaps(question, retrieved, confidence, filters)
+    return {
+        "unanswered_aspects": unanswered,
+        "suggested_queries":  [],
+        "missing_sources":    missing,
+        "weak_chunks":        [],
+    }
 
 
-def build_refusal_message(question: str, retrieved: list, confidence: dict) -> str:
+def build_refusal_message(question: str, retrieved: list, confidence: dict, gaps: dict = None) -> str:
     """Better refusal message with specific next retrieval steps."""
-    gaps = find_gaps(question, retrieved, confidence)
+    if gaps is None:
+        gaps = find_gaps(question, retrieved, confidence)
 
     lines = [
         "INSUFFICIENT EVIDENCE\n",
@@ -0,0 +1,188 @@
+"""
+src/rag/replay.py
+Replay logged researcher queries against the current pipeline, as a
+performance workload and a regression check for index or model changes.
+
+Queries from logs/query_log.jsonl are re-issued in log order at their
+original inter-arrival times divided by --speed (idle gaps capped at
+--max-gap), or back to back with --speed 0. Arrivals are open-loop: a pool
+of --concurrency workers serves them, so a slow query delays the ones queued
+behind it rather than the arrival schedule. Each result is diffed against the
+logged one (retrieved chunk IDs, confidence, answer/refusal) and latency
+percentiles are reported — service time per call, and response time from the
+scheduled arrival, which includes queueing.
+
+Modes:
+    retrieve   ask()'s retrieval step plus confidence scoring (default; no LLM)
+    ask        the full ask() pipeline; replayed results are not logged
+
+Usage (from repo root):
+    python src/rag/replay.py --last 200
+    python src/rag/replay.py --speed 10 --concurrency 4
+    python src/rag/replay.py --mode ask --last 20 --out logs/replay.jsonl
+"""
+
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.rag import logstore
+
+# ── Config ─────────────────────────────────────────────────────────────────────
+LOG_PATH    = Path("logs/query_log.jsonl")
+MODES       = ("retrieve", "ask")
+MAX_GAP_S   = 10.0   # longest pause between replayed arrivals, after scaling
+PERCENTILES = (50, 90, 99)
+
+
+# ── Workload ───────────────────────────────────────────────────────────────────
+def load_workload(log_path: Path, last: int = None) -> list:
+    records = logstore.tail(log_path, last) if last else logstore.iter_records(log_path)
+    return [r for r in records if r.get("query") and r.get("timestamp")]
+
+
+def schedule(records: list, speed: float, max_gap_s: float = MAX_GAP_S) -> np.ndarray:
+    """Arrival offsets (seconds from start) for each record."""
+    if not records or speed <= 0:
+        return np.zeros(len(records))
+    ts   = np.array([datetime.fromisoformat(r["timestamp"]).timestamp() for r in records])
+    gaps = np.clip(np.diff(ts, prepend=ts[0]) / speed, 0, max_gap_s)
+    return np.cumsum(gaps)
+
+
+# ── Replay one query ───────────────────────────────────────────────────────────
+def _chunk_ids(hits: list) -> list:
+    return [cid for h in hits for cid in h.get("chunk_ids", [h["chunk_id"]])]
+
+
+def diff(logged: dict, retrieved: list, confidence: dict) -> dict:
+    old, new = _chunk_ids(logged.get("retrieved", [])), _chunk_ids(retrieved)
+    old_set, new_set = set(old), set(new)
+    union    = old_set | new_set
+    old_conf = logged.get("confidence", {})
+    return {
+        "jaccard":     len(old_set & new_set) / len(union) if union else 1.0,
+        "top1_same":   bool(old and new and old[0] == new[0]),
+        "added":       [c for c in new if c not in old_set],
+        "dropped":     [c for c in old if c not in new_set],
+        "conf_old":    old_conf.get("overall_confidence"),
+        "conf_new":    confidence.get("overall_confidence"),
+        "answer_old":  old_conf.get("can_answer"),
+        "answer_new":  confidence.get("can_answer"),
+    }
+
+
+def _replay_one(record: dict, mode: str, k: int, rerank: bool) -> tuple:
+    from src.rag import rag
+    filters = record.get("filters")
+    if mode == "ask":
+        result = rag.ask(record["query"], k=k, rerank=rerank, filters=filters, log=False)
+        return result["retrieved"], result["confidence"]
+    retrieved = rag.retrieve_evidence(record["query"], k, rerank, filters)
+    return retrieved, rag.compute_confidence(record["query"], retrieved)
+
+
+# ── Run ────────────────────────────────────────────────────────────────────────
+def run(log_path: Path = LOG_PATH, mode: str = "retrieve", last: int = None, speed: float = 0.0,
+        concurrency: int = 1, k: int = None, rerank: bool = None, out: Path = None,
+        max_gap_s: float = MAX_GAP_S) -> list:
+    from src.rag import rag   # loads the store and embedding model once, before the clock starts
+    rerank   = rag.RERANK_ENABLED if rerank is None else rerank
+    records  = load_workload(log_path, last)
+    arrivals = schedule(records, speed, max_gap_s)
+    if not records:
+        print(f"No replayable queries in {log_path}")
+        return []
+    print(f"Replaying {len(records)} queries ({mode}, speed {speed or 'max'}, "
+          f"{concurrency} worker(s), offered span {arrivals[-1]:.1f}s)")
+
+    def serve(i: int, start: float) -> dict:
+        began = time.perf_counter()
+        row   = {"i": i, "query": records[i]["query"], "logged_at": records[i]["timestamp"]}
+        try:
+            retrieved, confidence = _replay_one(records[i], mode, k, rerank)
+            row.update(diff(records[i], retrieved, confidence))
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        done = time.perf_counter()
+        row["service_s"]  = done - began
+        row["response_s"] = done - (start + arrivals[i])
+        return row
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        futures = []
+        for i, at in enumerate(arrivals):
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(serve, i, start))
+        rows = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    if out:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with out.open("w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    _print_summary(rows, elapsed, mode, out)
+    return rows
+
+
+def _pcts(values: list) -> str:
+    if not values:
+        return "—"
+    p = np.percentile(values, PERCENTILES)
+    return "  ".join(f"p{q} {v * 1000:8.1f}" for q, v in zip(PERCENTILES, p)) + f"  max {max(values) * 1000:8.1f}"
+
+
+def _print_summary(rows: list, elapsed: float, mode: str, out: Path):
+    ok     = [r for r in rows if "error" not in r]
+    logged = [r for r in ok if r["conf_old"] is not None]
+    flips  = [r for r in logged if r["answer_old"] != r["answer_new"]]
+
+    print(f"\n{'='*70}")
+    print(f"REPLAY COMPLETE ({mode})")
+    print(f"  Queries          : {len(rows)} ({len(rows) - len(ok)} errors)")
+    print(f"  Wall time        : {elapsed:.1f}s ({len(rows) / max(elapsed, 1e-9):.2f} q/s)")
+    print(f"  Service ms       : {_pcts([r['service_s'] for r in ok])}")
+    print(f"  Response ms      : {_pcts([r['response_s'] for r in ok])}")
+    if ok:
+        print(f"  Retrieval Jaccard: {np.mean([r['jaccard'] for r in ok]):.3f} mean, "
+              f"{sum(r['jaccard'] == 1.0 for r in ok)}/{len(ok)} identical")
+        print(f"  Top-1 unchanged  : {sum(r['top1_same'] for r in ok)}/{len(ok)}")
+    if logged:
+        deltas = [abs(r["conf_new"] - r["conf_old"]) for r in logged]
+        print(f"  Confidence |Δ|   : {np.mean(deltas):.3f} mean, {max(deltas):.3f} max")
+        print(f"  Answer flips     : {len(flips)} "
+              f"({sum(bool(r['answer_old']) for r in flips)} answered→refused, "
+              f"{sum(not r['answer_old'] for r in flips)} refused→answered)")
+    for r in flips[:10]:
+        print(f"    {'A→R' if r['answer_old'] else 'R→A'}  {r['conf_old']:.2f}→{r['conf_new']:.2f}  {r['query'][:70]}")
+    for r in rows:
+        if "error" in r:
+            print(f"  ✗ {r['query'][:60]}: {r['error']}")
+    if out:
+        print(f"  Per-query rows   : {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay logged queries and diff against the logged results")
+    parser.add_argument("--log", type=Path, default=LOG_PATH, help="Query log to replay")
+    parser.add_argument("--mode", choices=MODES, default="retrieve", help="retrieve (no LLM) or full ask")
+    parser.add_argument("--last", type=int, default=None, help="Only the most recent N queries")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Arrival-rate multiplier over the logged timestamps (0 = back to back)")
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP_S, help="Cap on a single pause, seconds")
+    parser.add_argument("--concurrency", type=int, default=1, help="Worker threads serving arrivals")
+    parser.add_argument("--k", type=int, default=None, help="Fixed k (default: adaptive, as in ask())")
+    parser.add_argument("--rerank", action="store_true", default=None, help="Enable cross-encoder re-ranking")
+    parser.add_argument("--out", type=Path, default=None, help="Write per-query rows as JSONL")
+    args = parser.parse_args()
+    run(args.log, args.mode, args.last, args.speed, args.concurrency, args.k, args.rerank, args.out, args.max_gap)
@@ -6,56 +6,747 @@ Can be run standalone: python src/rag/retrieve.py "your question here"
 
 from pathlib import Path
 import numpy as np
-import orjson
 import faiss
 from sentence_transformers import SentenceTransformer
 import re
+import os
+import csv
 import json
+import time
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import sys
+from scipy import sparse
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from src.ingest.terms import extract_terms
+from src.ingest.sentences import normalize, split_sentences, sentence_key, sentence_hash
+from src.ingest import snapshot
 
 # ── Config ─────────────────────────────────────────────────────────────────────
 CHUNKS_PATH = Path("data/processed/chunks.jsonl")
-FAISS_PATH  = Path("data/vector_store/faiss.index")
+MANIFEST_PATH = Path("data/data_manifest.csv")
 LOG_PATH    = Path("logs/query_log.jsonl")
 
+RELOAD_CHECK_S = 2.0       # how often queries look for a newly published snapshot
+SEARCH_WORKERS = min(8, os.cpu_count() or 1)   # threads searching shards of a sharded snapshot
+
+# Optional cross-encoder re-ranking (CPU, loaded on first use)
+RERANK_MODEL      = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 50     # bi-encoder candidates to re-score
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_S   = 3.0    # per-query budget; over budget -> bi-encoder order
+
+# Post-retrieval diversification
+CANDIDATE_FACTOR  = 2      # hits fetched per k slot when merging / MMR is on
+MMR_LAMBDA        = 0.7    # relevance vs. novelty trade-off for mmr_select
+
+# Document-level routing: rank sources by centroid similarity, then search only
+# the chunks of the best ones. Left off below ROUTE_MIN_SOURCES, where a full
+# scan is already cheap and every source is worth a look.
+ROUTE_SOURCES     = 8
+ROUTE_MIN_SOURCES = 50
+
+# Extractive answers: best-matching sentences of the retrieved chunks
+EXTRACTIVE_SENTENCES = 5
+
 LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-# ── Load corpus ────────────────────────────────────────────────────────────────
-chunks = [orjson.loads(line) for line in CHUNKS_PATH.open("rb") if line.strip()]
-index  = faiss.read_index(str(FAISS_PATH))
-model  = SentenceTransformer("intfloat/e5-base-v2")
+# ── Load model ─────────────────────────────────────────────────────────────────
+model = SentenceTransformer("intfloat/e5-base-v2")
+
+
+# ── Metadata columns ───────────────────────────────────────────────────────────
+def _build_metadata(chunks: list) -> dict:
+    """Array-backed metadata for filtering.
+
+    Filters are evaluated once per source (a handful of rows) and broadcast to
+    chunks through the integer `source_code` column.
+    """
+    types = {}
+    if MANIFEST_PATH.exists():
+        with MANIFEST_PATH.open(newline="", encoding="utf-8") as f:
+            types = {row["source_id"]: row.get("type", "") for row in csv.DictReader(f)}
+
+    source_ids, first, codes = np.unique(
+        [c["source_id"] for c in chunks], return_index=True, return_inverse=True
+    )
+    years = [chunks[i].get("year") for i in first]
+    return {
+        "source_ids":   source_ids,
+        "source_code":  codes.astype(np.int32),
+        "source_year":  np.array([y if isinstance(y, int) else -1 for y in years], dtype=np.int32),
+        "source_type":  np.array([types.get(sid, "").lower() for sid in source_ids]),
+        "source_title": [f"{sid} {chunks[i].get('title', '')}".lower() for sid, i in zip(source_ids, first)],
+    }
+
+
+
+# ── Term matrix ────────────────────────────────────────────────────────────────
+def _build_term_matrix(chunks: list) -> dict:
+    """Chunk × term incidence matrix from the `terms` stored at ingest.
+
+    Chunk stores written before terms were stored are tokenized here once.
+    The per-chunk lists are dropped afterwards; the matrix is the only copy.
+    """
+    vocab, indptr, indices = {}, [0], []
+    for c in chunks:
+        terms = c.pop("terms", None)
+        if terms is None:
+            terms = extract_terms(c["text"])
+        indices.extend(vocab.setdefault(t, len(vocab)) for t in terms)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(chunks), len(vocab)),
+    ).tocsc()   # queries slice a handful of term columns
+    return {"vocab": vocab, "matrix": matrix}
+
+
+
+# ── Store & hot reload ─────────────────────────────────────────────────────────
+def _id_map(chunks: list, index) -> tuple:
+    """(uids, row_of_uid) for an index keyed by chunk uid; (None, None) if positional.
+
+    row_of_uid is a dense array, so resolving a batch of hit IDs to chunk
+    rows is a single fancy index. Chunks without a uid (stores chunked before
+    uids existed) are keyed by row position, as embed_index assigns them.
+    """
+    if not isinstance(index, faiss.IndexIDMap):
+        return None, None
+    uids = np.array([c.get("uid", i) for i, c in enumerate(chunks)], dtype=np.int64)
+    row_of_uid = np.full(int(uids.max()) + 1 if len(uids) else 0, -1, dtype=np.int64)
+    row_of_uid[uids] = np.arange(len(uids))
+    return uids, row_of_uid
+
+
+def load_store(version: str = None) -> dict:
+    """Load one vector-store snapshot plus the chunk store and derived columns.
+
+    Chunks come from the snapshot's own chunks.jsonl (older snapshots: the
+    working copy). The store is fingerprinted while it is parsed and checked
+    against the fingerprint the snapshot was built from; a mismatch raises
+    instead of serving texts that do not match the vectors.
+    """
+    version  = version or snapshot.current_version()
+    root     = snapshot.snapshot_dir(version)
+    manifest = snapshot.read_manifest(version)
+    path     = snapshot.chunks_path(version, CHUNKS_PATH)
+    chunks, fingerprint = snapshot.read_chunks(path)
+    shards   = [snapshot.open_index(p) for p in snapshot.index_paths(version)]
+    ntotal   = sum(s.ntotal for s in shards)
+
+    expected = manifest.get("chunks_fingerprint")
+    if expected and expected != fingerprint:
+        raise RuntimeError(
+            f"{path} does not match snapshot {version} — it changed after the index "
+            f"was built. Re-run src/ingest/embed_index.py (--incremental reuses unchanged vectors)."
+        )
+    if ntotal != len(chunks):
+        raise RuntimeError(
+            f"Snapshot {version} has {ntotal} vectors but {path} has {len(chunks)} chunks"
+        )
+    if not expected:
+        print(f"  Snapshot {version} has no chunk fingerprint — only the chunk count was checked")
+
+    uids, row_of_uid = _id_map(chunks, shards[0])
+    meta = _build_metadata(chunks)
+    meta["source_shard"] = np.array(
+        [snapshot.shard_of(sid, len(shards)) for sid in meta["source_ids"]], dtype=np.int32
+    )
+    return {
+        "version":    version,
+        "root":       root,
+        "chunks":     chunks,
+        "shards":     shards,
+        "ntotal":     ntotal,
+        "uids":       uids,
+        "row_of_uid": row_of_uid,
+        "meta":       meta,
+        "terms":      _build_term_matrix(chunks),
+        "embeddings": None,   # memory-mapped on first use (see _load_embeddings)
+        "centroids":  None,   # per-source vectors and their similarity matrix,
+        "source_sim": None,   # ... loaded on first use (see _source_vectors)
+        "sentences":  None,   # sentence index, loaded on first use (see _load_sentences)
+        "grounding":  None,   # citation-check index, built on first use (see grounding.py)
+    }
+
+
+def resolve_rows(store: dict, ids: np.ndarray) -> np.ndarray:
+    """Map FAISS result IDs to chunk rows; -1 for empty slots or unknown IDs."""
+    ids = np.asarray(ids, dtype=np.int64)
+    lut = store["row_of_uid"]
+    if lut is None:   # positional index: the ID is the row
+        return np.where((ids >= 0) & (ids < len(store["chunks"])), ids, -1)
+    ok   = (ids >= 0) & (ids < len(lut))
+    rows = np.full(ids.shape, -1, dtype=np.int64)
+    rows[ok] = lut[ids[ok]]
+    return rows
+
+
+_store      = load_store()
+_last_check = time.monotonic()
+_reload     = {"lock": threading.Lock(), "running": False, "failed": set()}
+
+
+def current_store() -> dict:
+    """The live store; starts a background swap when CURRENT names a new snapshot.
+
+    Queries take one reference at the start and use it throughout, so a swap
+    never changes the data under an in-flight query, and queries never wait
+    for a load — they keep using the old store until the new one is ready.
+    """
+    global _last_check
+    now = time.monotonic()
+    if now - _last_check >= RELOAD_CHECK_S:
+        _last_check = now
+        version = snapshot.current_version()
+        if version != _store["version"] and version not in _reload["failed"]:
+            with _reload["lock"]:
+                if not _reload["running"]:
+                    _reload["running"] = True
+                    threading.Thread(target=_swap_store, args=(version,), daemon=True).start()
+    return _store
+
+
+def _swap_store(version: str):
+    global _store
+    try:
+        new = load_store(version)
+        _store = new   # single reference assignment — atomic for readers
+        print(f"  Vector store hot-reloaded: snapshot {version} ({new['ntotal']} vectors, {len(new['shards'])} shard(s))")
+    except Exception as e:
+        _reload["failed"].add(version)
+        print(f"  Snapshot {version} failed to load, still serving {_store['version']}: {e}")
+    finally:
+        _reload["running"] = False
 
 
 # ── Retrieval ──────────────────────────────────────────────────────────────────
-def retrieve_top_k(query: str, k: int = 5) -> list:
-    q_emb = model.encode(
+@lru_cache(maxsize=256)
+def embed_query(query: str) -> np.ndarray:
+    """Query embedding; cached, so ask() stages that re-embed the question pay once."""
+    emb = model.encode(
         [f"query: {query}"],
         convert_to_numpy=True,
         normalize_embeddings=True
     ).astype(np.float32)
-    scores, idxs = index.search(q_emb, k)
-    return [
+    emb.setflags(write=False)   # shared between callers
+    return emb
+
+
+def embed_passages(texts: list, batch_size: int = 32) -> np.ndarray:
+    return model.encode(
+        [f"passage: {t}" for t in texts],
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32)
+
+
+def retrieve_top_k(query: str, k: int = 5, rerank: bool = False,
+                   merge: bool = False, mmr_lambda: float = None,
+                   filters: dict = None, route: int = None) -> list:
+    """Top-k chunks for `query`.
+
+    rerank     — re-score RERANK_CANDIDATES hits with the cross-encoder
+    merge      — fold adjacent hits from one source into a single span
+    mmr_lambda — pick the final k by maximal marginal relevance
+    filters    — metadata filter (see filter_mask), applied inside the search
+    route      — search only the chunks of the `route` best-matching sources
+                 (0 = all; default ROUTE_SOURCES once the corpus has
+                 ROUTE_MIN_SOURCES sources)
+    Merging and MMR work on a pool of k * CANDIDATE_FACTOR hits.
+    """
+    store  = current_store()
+    chunks = store["chunks"]
+
+    q_emb = embed_query(query)
+    pool  = k * CANDIDATE_FACTOR if (merge or mmr_lambda is not None) else k
+    n     = max(pool, RERANK_CANDIDATES) if rerank else pool
+
+    mask = filter_mask(filters, store)
+    if route is None:
+        route = ROUTE_SOURCES if len(store["meta"]["source_ids"]) >= ROUTE_MIN_SOURCES else 0
+    if 0 < route < len(store["meta"]["source_ids"]):
+        mask = route_mask(q_emb, route, store, mask)
+    n    = min(n, store["ntotal"] if mask is None else int(mask.sum()))
+    if n == 0:
+        return []
+    scores, idxs = search_index(store, q_emb, n, mask)
+
+    rows = resolve_rows(store, idxs[0])
+    hits = [
         {
             "score":     float(scores[0][i]),
-            "source_id": chunks[idxs[0][i]]["source_id"],
-            "chunk_id":  chunks[idxs[0][i]]["chunk_id"],
-            "text":      chunks[idxs[0][i]]["text"],
+            "source_id": chunks[row]["source_id"],
+            "chunk_id":  chunks[row]["chunk_id"],
+            "text":      chunks[row]["text"],
+            "row":       int(row),
+            "uid":       int(idxs[0][i]),
+            "snapshot":  store["version"],
         }
-        for i in range(k)
+        for i, row in enumerate(rows)
+        if row >= 0
+    ]
+    if rerank:
+        hits = rerank_hits(query, hits, pool)
+    if merge:
+        hits = merge_adjacent(hits)
+    if mmr_lambda is not None:
+        return mmr_select(q_emb[0], hits, k, mmr_lambda, store)
+    return hits[:k]
+
+
+# ── Shard search ───────────────────────────────────────────────────────────────
+_shard_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+
+def search_index(store: dict, q_emb: np.ndarray, n: int, mask: np.ndarray = None) -> tuple:
+    """Top-n (scores, ids) across every shard of the store, optionally masked.
+
+    Shards are searched concurrently and merged by score. FAISS releases the
+    GIL during a search and scans a single query on one core, so each shard
+    gets its own core. Shards holding none of the masked rows are skipped —
+    with a source filter that is usually all but one.
+    """
+    shards = store["shards"]
+    params = _search_params(mask, store) if mask is not None else None
+    active = list(range(len(shards)))
+    if mask is not None and len(shards) > 1:
+        meta   = store["meta"]
+        active = np.unique(meta["source_shard"][meta["source_code"][mask]]).tolist()
+    if len(active) == 1:
+        return shards[active[0]].search(q_emb, n, params=params)
+
+    parts  = list(_shard_pool.map(lambda i: shards[i].search(q_emb, n, params=params), active))
+    scores = np.concatenate([d for d, _ in parts], axis=1)
+    ids    = np.concatenate([i for _, i in parts], axis=1)
+    order  = np.argsort(-scores, axis=1, kind="stable")[:, :n]   # empty slots (-FLT_MAX) sort last
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+# ── Document routing ───────────────────────────────────────────────────────────
+def _source_vectors(store: dict) -> tuple:
+    """(centroids, source × source similarity), rows aligned with meta["source_ids"].
+
+    Read from the snapshot; snapshots built before these were stored get
+    them computed from the embeddings once.
+    """
+    if store["centroids"] is None:
+        ids, centroids, sim = snapshot.read_source_centroids(store["root"])
+        if ids is None or ids != store["meta"]["source_ids"].tolist():
+            ids, centroids = snapshot.source_centroids(
+                _load_embeddings(store), [c["source_id"] for c in store["chunks"]]
+            )
+            sim = centroids @ centroids.T
+        store["source_sim"] = sim
+        store["centroids"]  = centroids
+    return store["centroids"], store["source_sim"]
+
+
+def route_mask(q_emb: np.ndarray, n_sources: int, store: dict, mask: np.ndarray = None) -> np.ndarray:
+    """Chunk-row mask for the `n_sources` sources whose centroids best match the query.
+
+    With a filter `mask`, sources are chosen among those it admits and the
+    result is intersected with it.
+    """
+    meta = store["meta"]
+    sim  = _source_vectors(store)[0] @ q_emb[0]
+    keep = np.zeros(len(sim), dtype=bool)
+    if mask is not None:
+        allowed = np.zeros(len(sim), dtype=bool)
+        allowed[meta["source_code"][mask]] = True
+        sim = np.where(allowed, sim, -np.inf)
+    keep[np.argsort(-sim, kind="stable")[:n_sources]] = True
+    rows = keep[meta["source_code"]]
+    return rows if mask is None else rows & mask
+
+
+def related_sources(question: str, exclude, n: int = 3, store: dict = None, filters: dict = None) -> list:
+    """Corpus sources relevant to the question that are not in `exclude`.
+
+    Candidates are ranked by centroid similarity to the query plus similarity
+    to the closest excluded (retrieved) source, and must be at least as close
+    to the query as the weakest retrieved source — so nothing is suggested
+    when the rest of the corpus is further away than what was already found.
+    Only sources the metadata `filters` admit are suggested.
+    """
+    store = store or current_store()
+    centroids, sim = _source_vectors(store)
+    ids = store["meta"]["source_ids"]
+    rel = centroids @ embed_query(question)[0]
+    got = np.isin(ids, list(exclude))
+    if got.any():
+        score, floor = rel + sim[:, got].max(axis=1), rel[got].min()
+    else:
+        score, floor = rel, -np.inf
+    admitted = source_filter(filters, store)
+    cand = np.flatnonzero(~got & (rel >= floor) & (True if admitted is None else admitted))
+    return ids[cand[np.argsort(-score[cand], kind="stable")[:n]]].tolist()
+
+
+# ── Sentences ──────────────────────────────────────────────────────────────────
+def _load_sentences(store: dict) -> dict:
+    """The snapshot's sentence index ({} for builds without one), loaded on first use."""
+    if store["sentences"] is None:
+        index = snapshot.read_sentence_index(store["root"]) or {}
+        if index:
+            order = np.argsort(index["hash"], kind="stable")
+            index["by_hash"], index["sorted_hash"] = order, index["hash"][order]
+        store["sentences"] = index
+    return store["sentences"]
+
+
+def sentence_vectors(sentences: list, store: dict = None) -> np.ndarray:
+    """Passage embeddings for `sentences`, read from the sentence index where present."""
+    index = _load_sentences(store or current_store())
+    out   = np.empty((len(sentences), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    todo  = np.arange(len(sentences))
+    if len(index.get("hash", ())) and len(sentences):
+        hashes = np.array([sentence_hash(s) for s in sentences], dtype=np.uint64)
+        pos    = np.searchsorted(index["sorted_hash"], hashes).clip(max=len(index["hash"]) - 1)
+        found  = index["sorted_hash"][pos] == hashes
+        out[found] = index["vectors"][index["by_hash"][pos[found]]]
+        todo = np.flatnonzero(~found)
+    if len(todo):
+        out[todo] = embed_passages([sentences[i] for i in todo])
+    return out
+
+
+def score_sentences(question: str, hits: list, store: dict = None) -> list:
+    """Every sentence of `hits`, scored against the question.
+
+    Returns dicts with the sentence text, score, the index of its hit, and
+    the source_id / chunk_id it was taken from. Each hit's own chunk texts
+    are split and their vectors looked up by sentence hash, so sentences in
+    a chunk's leading overlap (indexed under the previous chunk) are kept.
+    With a sentence index this is a hash lookup plus one small mat-vec;
+    sentences it lacks (older snapshots) are embedded here.
+    """
+    if not hits:
+        return []
+    store = store or current_store()
+    chunks, sents, seen = store["chunks"], [], set()
+    for i, h in enumerate(hits):
+        # Hits from a snapshot that has since been swapped out don't index this store's rows
+        parts = [chunks[row] for row in h.get("rows", [h["row"]])] if h.get("snapshot") == store["version"] else [h]
+        for c in parts:
+            for s in split_sentences(c["text"]):
+                key = (i, sentence_key(s))   # neighbouring chunks of a merged hit overlap
+                if key not in seen:
+                    seen.add(key)
+                    sents.append((i, c, s))
+    if not sents:
+        return []
+    scores = sentence_vectors([s for *_, s in sents], store) @ embed_query(question)[0]
+    return [
+        {"text": s, "score": float(score), "hit": i,
+         "source_id": c["source_id"], "chunk_id": c["chunk_id"]}
+        for (i, c, s), score in zip(sents, scores)
     ]
 
 
+def top_sentences(question: str, hits: list, n: int = EXTRACTIVE_SENTENCES, store: dict = None,
+                  scored: list = None) -> list:
+    """The `n` distinct sentences of `hits` most similar to the question, best first.
+
+    Pass `scored` (score_sentences output for the same hits) to reuse it.
+    """
+    if scored is None:
+        scored = score_sentences(question, hits, store)
+    out, seen = [], set()
+    for s in sorted(scored, key=lambda s: -s["score"]):
+        key = sentence_key(s["text"])
+        if key not in seen:
+            seen.add(key)
+            out.append(s)
+            if len(out) == n:
+                break
+    return out
+
+
+# ── Filters ────────────────────────────────────────────────────────────────────
+def filter_mask(filters: dict, store: dict = None):
+    """Boolean row mask for a metadata filter, or None when nothing is filtered.
+
+    The filter is evaluated per source (see source_filter) and broadcast to
+    that source's chunk rows.
+    """
+    store = store or current_store()
+    ok    = source_filter(filters, store)
+    return None if ok is None else ok[store["meta"]["source_code"]]
+
+
+def source_filter(filters: dict, store: dict = None):
+    """Boolean mask over meta["source_ids"] for a metadata filter, or None when nothing is filtered.
+
+    Supported keys (all optional, combined with AND):
+      source_id — source id or list of ids
+      keyword   — case-insensitive substring of source_id or title
+      year_min  — inclusive lower bound on publication year
+      year_max  — inclusive upper bound on publication year
+      type      — manifest type or list of types (e.g. "Peer-Reviewed Article")
+    """
+    if not filters:
+        return None
+    meta = (store or current_store())["meta"]
+    ok   = np.ones(len(meta["source_ids"]), dtype=bool)
+
+    if filters.get("source_id"):
+        ids = filters["source_id"]
+        ok &= np.isin(meta["source_ids"], [ids] if isinstance(ids, str) else list(ids))
+    if filters.get("keyword"):
+        kw  = filters["keyword"].lower()
+        ok &= np.array([kw in t for t in meta["source_title"]])
+    if filters.get("year_min") is not None:
+        ok &= meta["source_year"] >= int(filters["year_min"])
+    if filters.get("year_max") is not None:
+        ok &= (meta["source_year"] >= 0) & (meta["source_year"] <= int(filters["year_max"]))
+    if filters.get("type"):
+        types = filters["type"]
+        types = [types] if isinstance(types, str) else list(types)
+        ok &= np.isin(meta["source_type"], [t.lower() for t in types])
+
+    return ok
+
+
+def _search_params(mask: np.ndarray, store: dict):
+    if store["uids"] is not None:   # selector sees uids, so move the mask into uid space
+        by_uid = np.zeros(len(store["row_of_uid"]), dtype=bool)
+        by_uid[store["uids"][mask]] = True
+        mask = by_uid
+    bitmap = np.packbits(mask, bitorder="little")
+    sel    = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))   # size in bytes
+    params = faiss.SearchParameters(sel=sel)
+    params._keepalive = (sel, bitmap)   # SWIG does not own these buffers
+    return params
+
+
+def parse_filter(expr: str) -> dict:
+    """Parse "year>=2015; keyword=methane; source=A,B; type=Case Study" into a filter dict.
+
+    year takes =, >=, <=, > and <; the other keys take =. A part that can't
+    be parsed raises ValueError rather than being dropped, since dropping it
+    would silently widen the search.
+    """
+    filters = {}
+    for part in (expr or "").split(";"):
+        if not part.strip():
+            continue
+        m = re.match(r'\s*(\w+)\s*(>=|<=|=|>|<)\s*(.+?)\s*$', part)
+        if not m:
+            raise ValueError(f"Can't parse filter {part.strip()!r} — expected key=value, e.g. year>=2015")
+        key, op, val = m.group(1).lower(), m.group(2), m.group(3)
+        if key not in ("year", "source", "source_id", "type", "keyword"):
+            raise ValueError(f"Unknown filter key {key!r} — expected year, source, type or keyword")
+        if key == "year":
+            if not re.fullmatch(r'\d{4}', val):
+                raise ValueError(f"Filter {part.strip()!r}: year must be a four-digit number")
+            year = int(val)
+            if op in (">=", "=", ">"):
+                filters["year_min"] = year + (op == ">")
+            if op in ("<=", "=", "<"):
+                filters["year_max"] = year - (op == "<")
+            continue
+        if op != "=":
+            raise ValueError(f"Filter {part.strip()!r}: {key} only supports '='")
+        if key in ("source", "source_id"):
+            filters["source_id"] = [v.strip() for v in val.split(",") if v.strip()]
+        elif key == "type":
+            filters["type"] = [v.strip() for v in val.split(",") if v.strip()]
+        else:
+            filters["keyword"] = val
+    return filters
+
+
+# ── Chunk helpers ──────────────────────────────────────────────────────────────
+def chunk_position(chunk_id: str):
+    """Sequence number of a chunk within its source ("..._chunk_0007" -> 7)."""
+    m = re.search(r'_chunk_(\d+)$', chunk_id)
+    return int(m.group(1)) if m else None
+
+
+def strip_overlap(prev_text: str, text: str, max_overlap: int = 600) -> int:
+    """Length of the prefix of `text` that repeats the tail of `prev_text`.
+
+    Adjacent chunks share OVERLAP_CHARS of text (minus whitespace stripped by
+    chunk_text), so the repeated span is located by anchoring on the start of
+    `text` inside the tail of `prev_text`.
+    """
+    tail   = prev_text[-max_overlap:]
+    anchor = text[:50]
+    if not anchor:
+        return 0
+    pos = tail.find(anchor)
+    while pos != -1:
+        if text.startswith(tail[pos:]):
+            return len(tail) - pos
+        pos = tail.find(anchor, pos + 1)
+    return 0
+
+
+# ── Diversification ────────────────────────────────────────────────────────────
+def _load_embeddings(store: dict) -> np.ndarray:
+    if store["embeddings"] is None:
+        store["embeddings"] = snapshot.open_embeddings(store["root"] / "embeddings.npy")
+    return store["embeddings"]
+
+
+def merge_adjacent(hits: list) -> list:
+    """Merge hits that are consecutive chunks of the same source.
+
+    The shared overlap is written once. The merged hit is cited by its
+    best-scoring member's chunk_id (which resolves to the whole span through
+    "chunk_ids" / "rows"), and takes the best score and rerank_score of the
+    run. Each span takes the rank of its best-ranked member.
+    """
+    positions = {}
+    for h in hits:
+        pos = chunk_position(h["chunk_id"])
+        if pos is not None:
+            positions[(h["source_id"], pos)] = h
+
+    merged, done = [], set()
+    for h in hits:
+        pos = chunk_position(h["chunk_id"])
+        if pos is None:
+            merged.append(dict(h, chunk_ids=[h["chunk_id"]], rows=[h["row"]]))
+            continue
+        if (h["source_id"], pos) in done:
+            continue
+        start = pos
+        while (h["source_id"], start - 1) in positions:
+            start -= 1
+        run = []
+        while (h["source_id"], start) in positions:
+            run.append(positions[(h["source_id"], start)])
+            done.add((h["source_id"], start))
+            start += 1
+        text = run[0]["text"]
+        for prev, nxt in zip(run[:-1], run[1:]):
+            text += "\n" + nxt["text"][strip_overlap(prev["text"], nxt["text"]):]
+        best = max(run, key=lambda x: x.get("rerank_score", x["score"]))
+        span = dict(
+            best,
+            score=max(x["score"] for x in run),
+            text=text,
+            chunk_ids=[x["chunk_id"] for x in run],
+            rows=[x["row"] for x in run],
+        )
+        if "rerank_score" in best:
+            span["rerank_score"] = max(x["rerank_score"] for x in run)
+        merged.append(span)
+    return merged
+
+
+def mmr_select(q_emb: np.ndarray, hits: list, k: int, lambda_: float = MMR_LAMBDA,
+               store: dict = None) -> list:
+    """Greedy maximal-marginal-relevance selection over the stored embeddings."""
+    if len(hits) <= k:
+        return hits
+    emb  = _load_embeddings(store or current_store())
+    vecs = np.stack([np.asarray(emb[h.get("rows", [h["row"]])], dtype=np.float32).mean(axis=0) for h in hits])
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+    rel  = vecs @ q_emb
+    sim  = vecs @ vecs.T
+
+    selected = [int(np.argmax(rel))]
+    max_sim  = sim[selected[0]].copy()
+    while len(selected) < k:
+        mmr = lambda_ * rel - (1 - lambda_) * max_sim
+        mmr[selected] = -np.inf
+        j = int(np.argmax(mmr))
+        selected.append(j)
+        np.maximum(max_sim, sim[j], out=max_sim)
+    return [hits[j] for j in selected]
+
+
+# ── Re-ranking ─────────────────────────────────────────────────────────────────
+_reranker = None
+
+def _load_reranker():
+    global _reranker
+    if _reranker is None:
+        from sentence_transformers import CrossEncoder
+        _reranker = CrossEncoder(RERANK_MODEL, device="cpu", max_length=512)
+    return _reranker
+
+
+def rerank_hits(query: str, hits: list, k: int, budget_s: float = RERANK_BUDGET_S) -> list:
+    """Re-score hits with the cross-encoder and keep the top k.
+
+    Pairs are scored in batches; if the budget runs out before every batch is
+    scored, the bi-encoder order is kept. "score" stays the bi-encoder cosine
+    so confidence thresholds are unaffected.
+    """
+    if len(hits) <= 1:
+        return hits[:k]
+    reranker = _load_reranker()
+    pairs    = [(query, h["text"]) for h in hits]
+    start    = time.perf_counter()
+    scores   = []
+    for i in range(0, len(pairs), RERANK_BATCH_SIZE):
+        if time.perf_counter() - start > budget_s:
+            print(f"  Re-rank budget exceeded ({budget_s:.1f}s) — using bi-encoder order")
+            return hits[:k]
+        batch = reranker.predict(
+            pairs[i:i + RERANK_BATCH_SIZE],
+            batch_size=RERANK_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        scores.extend(np.asarray(batch, dtype=np.float32).ravel().tolist())
+    order = np.argsort(-np.asarray(scores), kind="stable")[:k]
+    return [dict(hits[i], rerank_score=float(scores[i])) for i in order]
+
+
+# ── Lexical overlap ────────────────────────────────────────────────────────────
+def term_hits(terms: list, retrieved: list) -> np.ndarray:
+    """Boolean (len(retrieved), len(terms)) matrix: hit i contains term j.
+
+    Hits resolve to chunk rows (merged spans to all their rows) and are looked
+    up in the term matrix with one sparse product; only hits that did not come
+    from the live snapshot are tokenized.
+    """
+    out = np.zeros((len(retrieved), len(terms)), dtype=bool)
+    if not terms or not retrieved:
+        return out
+
+    store = current_store()
+    owners, rows = [], []
+    for i, r in enumerate(retrieved):
+        members = r.get("rows") or ([r["row"]] if "row" in r else None)
+        if members is None or r.get("snapshot") != store["version"]:
+            out[i] = np.isin(terms, extract_terms(r["text"]))
+            continue
+        owners.extend([i] * len(members))
+        rows.extend(members)
+
+    cols  = np.array([store["terms"]["vocab"].get(t, -1) for t in terms])
+    known = cols >= 0
+    if rows and known.any():
+        matrix = store["terms"]["matrix"]
+        group  = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (owners, rows)),
+            shape=(len(retrieved), matrix.shape[0]),
+        )
+        out[:, known] |= (group @ matrix[:, cols[known]]).toarray() > 0
+    return out
+
+
 # ── Confidence scoring ─────────────────────────────────────────────────────────
 def compute_confidence(question: str, retrieved: list) -> dict:
     if not retrieved:
-        return {"overall_confidence": 0.0, "can_answer": False, "reasoning": "No chunks retrieved"}
+        return {"overall_confidence": 0.0, "retrieval_confidence": 0.0, "can_answer": False,
+                "threshold": 0.5, "reasoning": "No chunks retrieved"}
 
     retrieval_conf = float(np.mean([r["score"] for r in retrieved[:3]]))
 
-    q_words    = set(re.findall(r'\b\w{4,}\b', question.lower())) - {"what", "does", "how", "mars", "corpus"}
-    text_words = set(re.findall(r'\b\w{4,}\b', " ".join(r["text"].lower() for r in retrieved[:3])))
-    overlap    = len(q_words & text_words) / max(len(q_words), 1)
+    q_words = [w for w in extract_terms(question) if w not in {"what", "does", "how", "mars", "corpus"}]
+    overlap = term_hits(q_words, retrieved[:3]).any(axis=0).sum() / max(len(q_words), 1)
 
     q_lower         = question.lower()
     is_strong_claim = any(p in q_lower for p in [
@@ -119,19 +810,16 @@ def build_answer(question: str, retrieved: list, min_score: float = 0.20) -> tup
         )
         return answer, [], confidence
 
-    citation_threshold = 0.85
-    used = [r for r in retrieved[:5] if r["score"] >= citation_threshold] or retrieved[:2]
-
     conf_label = "High" if confidence["overall_confidence"] >= 0.8 else \
                  "Medium" if confidence["overall_confidence"] >= 0.6 else "Low"
 
+    # Most query-relevant sentences of the top chunks, each with its chunk citation
     lines = [f"Answer [Confidence: {conf_label} ({confidence['overall_confidence']:.2f})]\n"]
     citations = []
-    for r in used:
-        cid     = f"[{r['source_id']}:{r['chunk_id']}]"
-        snippet = " ".join(r["text"].split())[:400]
-        lines.append(f"- {snippet}... {cid}")
-        citations.append((r["source_id"], r["chunk_id"]))
+    for s in top_sentences(question, retrieved[:5]):
+        lines.append(f"- {s['text']} [{s['source_id']}:{s['chunk_id']}]")
+        if (s["source_id"], s["chunk_id"]) not in citations:
+            citations.append((s["source_id"], s["chunk_id"]))
 
     return "\n".join(lines), citations, confidence
 
@@ -143,9 +831,9 @@ def _convert_numpy(obj):
     if isinstance(obj, (np.bool_, np.integer, np.floating)): return obj.item()
     return obj
 
-def query_and_log(question: str, k: int = 5):
+def query_and_log(question: str, k: int = 5, filters: dict = None):
     """Single command interface: retrieve, answer, and log."""
-    retrieved  = retrieve_top_k(question, k)
+    retrieved  = retrieve_top_k(question, k, filters=filters)
     answer, citations, confidence = build_answer(question, retrieved)
 
     print("=" * 70)
@@ -162,6 +850,7 @@ def query_and_log(question: str, k: int = 5):
             "citations":  citations,
             "confidence": confidence,
             "retrieved":  retrieved,
+            "filters":    filters,
             "timestamp":  datetime.now().isoformat(),
         })) + "\n")
 